@@ -3,95 +3,26 @@ Application IA-BrainStormer GPS (Version V6 - Hybride & Automatique)
 Système complet + Gestion de l'Historique + Save/Load
 Mode HYBRIDE : Détecte automatiquement si une clé admin est présente.
 """
-import streamlit as st
+import hashlib
 import json
+import os
 import re
-from openai import OpenAI
-from datetime import datetime
-
-# ==========================================
-# 0. OUTILS DE NETTOYAGE
-# ==========================================
-
-def clean_json_response(raw_content):
-    try: return json.loads(raw_content)
-    except: pass
-    try:
-        match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-        if match: return json.loads(match.group())
-    except: pass
-    try:
-        clean_str = re.sub(r'```json\s*|\s*```', '', raw_content)
-        return json.loads(clean_str)
-    except: return None
-
-# ==========================================
-# 1. PROMPTS SYSTÈME
-# ==========================================
-
-SYSTEM_PROMPT_CRASH_TEST = """Tu es un Auditeur Stratégique ("Devil's Advocate").
-Analyse l'idée selon D.U.R. (Douloureux, Urgent, Reconnu).
-FORMAT JSON STRICT :
-{
-  "score_D": 0, "score_U": 0, "score_R": 0, "total": 0,
-  "verdict": "VERT ou ROUGE",
-  "analyse_critique": "Phrase courte",
-  "conseil_architecte": "Action concrète"
-}"""
-
-SYSTEM_PROMPT_PHASE_G = """Génère 10 angles stratégiques uniques.
-FORMAT JSON STRICT :
-{ "angles": [ {"id": 1, "titre": "Titre court", "cible_precise": "...", "opportunite": "..."} ] }"""
-
-SYSTEM_PROMPT_PHASE_P = """Tu es Expert Stratège. Utilise la Matrice de Conviction.
-On te donne 3 options numérotées 1, 2 et 3.
-FORMAT JSON STRICT :
-{
-  "evaluations": [
-    { "id_option": 1, "score_douleur": 0, "score_unicite": 0, "score_alignement": 0, "score_total_pondere": 0 },
-    { "id_option": 2, ... }, { "id_option": 3, ... }
-  ],
-  "recommandation": { "id_gagnant": 1, "raison": "Explication courte" }
-}"""
-
-SYSTEM_PROMPT_PHASE_S = """Backcasting de J+7 à J+1.
-FORMAT JSON STRICT :
-{ "resultat_j7": "...", "etapes_journalieres": [ {"jour": "J+7", "action_principale": "...", "detail_execution": "..."} ] }"""
-
-# ==========================================
-# 2. MÉCANIQUE API
-# ==========================================
-
-class GPSSystem:
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
-        self.client = OpenAI(api_key=api_key)
-        self.model = model
-    
-    def call_gpt(self, system_prompt: str, user_message: str) -> dict:
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
-            raw = response.choices[0].message.content
-            json_data = clean_json_response(raw)
-            return json_data if json_data else {"error": True, "raw": raw}
-        except Exception as e:
-            return {"error": True, "message": str(e)}
-
-    def crash_test_dur(self, idee): return self.call_gpt(SYSTEM_PROMPT_CRASH_TEST, f"Idée: {idee}")
-    def phase_g_generation(self, idee): return self.call_gpt(SYSTEM_PROMPT_PHASE_G, f"Idée validée: {idee}")
-    def phase_p_priorisation(self, angles):
-        txt = ""
-        for index, a in enumerate(angles):
-            txt += f"OPTION {index + 1} : {a['titre']} ({a['cible_precise']})\n"
-        return self.call_gpt(SYSTEM_PROMPT_PHASE_P, f"Classe ces 3 options :\n{txt}")
-    def phase_s_sequencage(self, angle): return self.call_gpt(SYSTEM_PROMPT_PHASE_S, f"Plan pour: {angle.get('titre')}")
+import uuid
+import streamlit as st
+from gps_system import AUTO, PHASE_GRAPH, GPSSystem, AsyncGPSSystem, PhaseError, run_pipeline
+from model_router import router
+from resources import get_background_loop, get_supabase, warm_up
+from tracing import span, render_latency_panel
+from singleflight import flights, flight_key
+from jobs import JobQueue, build_backend as build_job_backend, render_job
+import project_format
+from project_store import ProjectStore, build_backend, render_recent_projects
+from reports import ReportEngine, ancien_sections, report_key
+from session_memory import MemoryBudget
+import token_budget
 
 # ==========================================
-# 3. UI & GESTION D'ÉTAT (SAVE/LOAD)
+# 1. UI & GESTION D'ÉTAT (SAVE/LOAD)
 # ==========================================
 
 st.set_page_config(page_title="IA-BrainStormer GPS", page_icon="🧭", layout="wide")
@@ -102,30 +33,156 @@ st.markdown("""
     .verdict-vert {background-color: #d4edda; padding: 1rem; border-radius: 5px; border-left: 5px solid #28a745;}
     .verdict-rouge {background-color: #f8d7da; padding: 1rem; border-radius: 5px; border-left: 5px solid #dc3545;}
     .stButton>button {width: 100%;}
-    .history-item {padding: 10px; border-bottom: 1px solid #eee; font-size: 0.9em;}
 </style>
 """, unsafe_allow_html=True)
 
 if 'step' not in st.session_state: st.session_state.step = 'crash_test'
-if 'history' not in st.session_state: st.session_state.history = []
+if 'sid' not in st.session_state: st.session_state.sid = uuid.uuid4().hex  # fichiers de déversement de la session
 
 def reset_app():
-    keys_keep = ['openai_api_key_input', 'history']
+    keys_keep = ['openai_api_key_input', 'mode_concurrent', 'sid', 'admin_code']
+    get_memory().forget(st.session_state.sid)
     st.session_state.step = 'crash_test'
     for k in list(st.session_state.keys()):
         if k not in keys_keep: del st.session_state[k]
+    st.query_params.pop("job", None)
+
+def speculate(key, inputs, coro):
+    """Mode concurrent : lance une phase en avance sur des entrées supposées."""
+    if 'spec' not in st.session_state: st.session_state.spec = {}
+    old = st.session_state.spec.get(key)
+    if old and old[0] == inputs: coro.close(); return
+    if old: old[1].cancel()
+    st.session_state.spec[key] = (inputs, get_background_loop().submit(coro))
+
+def take_speculation(key, inputs):
+    """Résultat de la phase lancée en avance, si elle portait sur les mêmes entrées."""
+    spec = st.session_state.get('spec', {}).pop(key, None)
+    if not spec: return None
+    if spec[0] != inputs: spec[1].cancel(); return None
+    res = spec[1].result()
+    return None if res.get('error') else res
 
 def load_project(uploaded_file):
     if uploaded_file is not None:
+        # Seuls les champs connus du projet sont restaurés (.gpsp compressé ou ancien .json)
         try:
-            data = json.load(uploaded_file)
+            data = project_format.load(uploaded_file, "ancien")
+            reset_app()  # rien du projet en cours ne survit (export, project_id : enregistré comme un nouveau projet)
             for key, value in data.items():
                 st.session_state[key] = value
             st.success("Projet chargé !")
             st.rerun()
-        except Exception as e:
+        except project_format.ProjectFormatError as e:
             st.error(f"Erreur : {e}")
 
+@st.cache_resource
+def get_project_store():
+    # PROJECT_STORE : supabase (si configuré) | postgres (instance locale, PROJECT_STORE_DSN) | memory
+    kind = st.secrets.get("PROJECT_STORE", "supabase" if st.secrets.get("SUPABASE_URL") else "memory")
+    client = get_supabase(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]) if kind == "supabase" else None
+    return ProjectStore(build_backend(kind, client, st.secrets.get("PROJECT_STORE_DSN")))
+
+@st.cache_resource
+def get_keyring():
+    return {}  # empreinte -> (clé API, base_url), en mémoire seulement : aucune clé n'est écrite dans la file
+
+@st.cache_resource
+def get_memory():
+    # Budget par session (SESSION_MEMORY_KB, 0 : mesure seulement) ; résultats déversés dans SPILL_DIR
+    return MemoryBudget(st.secrets.get("SPILL_DIR", ".cache/spill"), budget=int(st.secrets.get("SESSION_MEMORY_KB", 256)) * 1024)
+
+# Résultats déversables, du plus ancien au plus récent, et ceux qu'affiche chaque étape
+SPILLABLE = ['crash_test_result', 'phase_g_result', 'angles_selectionnes', 'phase_p_result', 'angle_choisi', 'phase_s_result']
+STEP_FIELDS = {'crash_test': ['crash_test_result'], 'generation': ['phase_g_result'],
+               'priorisation': ['angles_selectionnes', 'phase_p_result'], 'sequencage': ['angle_choisi', 'phase_s_result']}
+# Résultats lus par chaque étape (relus en tête d'exécution) : le rapport PDF de la Phase S reprend tout le parcours
+STEP_READS = {**STEP_FIELDS, 'sequencage': [k for k in SPILLABLE if k != 'phase_g_result']}
+
+def enforce_budget():
+    """Fin d'exécution : au-delà du budget mémoire de la session, les résultats que l'étape n'affiche pas partent
+    sur disque (puis l'export en cache est libéré), voir session_memory.py."""
+    get_memory().enforce(st.session_state.sid, st.session_state, spillable=SPILLABLE,
+                         keep=STEP_FIELDS.get(st.session_state.step, ()), shed=lambda: st.session_state.pop('export', None))
+
+@st.cache_resource
+def get_idea_index():
+    from idea_index import OwnerIndexes  # NumPy chargé au premier usage, pas au premier affichage
+    # Un index par propriétaire (OWNER) : une idée et son crash test ne sont jamais montrés qu'à leur auteur
+    return OwnerIndexes(os.path.join(st.secrets.get("IDEA_INDEX_DIR", ".cache/ideas"), "crash_test"))
+
+# Idée très proche d'une idée déjà passée au crash test (idea_index.py) : son résultat est proposé avant l'appel
+IDEA_REUSE_THRESHOLD = float(st.secrets.get("IDEA_REUSE_THRESHOLD", 0.8))  # 0 : désactivé
+
+PHASE_METHODS = {"crash_test": "crash_test_dur", "phase_p": "phase_p_priorisation", "phase_s": "phase_s_sequencage"}
+
+@st.cache_resource
+def get_jobs():
+    # JOB_STORE : sqlite (défaut, fichier JOB_DB) | supabase (table jobs, voir sql/jobs.sql)
+    kind = st.secrets.get("JOB_STORE", "sqlite")
+    client = get_supabase(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]) if kind == "supabase" else None
+    queue = JobQueue(build_job_backend(kind, client, st.secrets.get("JOB_DB")),
+                     max_workers=int(st.secrets.get("JOB_WORKERS", 4)))
+    keyring, ideas = get_keyring(), get_idea_index()
+    server = st.secrets.get("OPENAI_API_KEY")
+    if server: keyring[hashlib.sha256(server.encode()).hexdigest()[:32]] = (server, st.secrets.get("OPENAI_BASE_URL"))
+
+    def run_phase_job(job, progress):
+        # Clé d'un visiteur perdue (redémarrage du serveur) : le job échoue, la phase se relance à la main
+        p = job["payload"]
+        key_id = p.get("key_id", job["owner"])
+        if key_id not in keyring: raise LookupError("Clé API inconnue après un redémarrage, relancez la phase.")
+        api_key, base_url = keyring[key_id]
+        gps = GPSSystem(api_key, p["model"], base_url=base_url)
+        if p["phase"] == "phase_g":
+            # Éclats en parallèle, lus en flux : chaque angle retenu est publié dès qu'il est complet
+            angles = []
+            def on_item(a):
+                angles.append(a)
+                progress(list(angles))
+            res = gps.phase_g_generation(p["arg"], on_item=on_item)
+        else:
+            res = getattr(gps, PHASE_METHODS[p["phase"]])(p["arg"])
+        if p["phase"] == "crash_test" and not res.get("error"):
+            ideas.add(job["owner"], p["arg"], {k: v for k, v in res.items() if not k.startswith("_")}, model=res.get("_model"))
+        return res, res.get("_model")
+
+    queue.register("gps", run_phase_job)
+    queue.recover()
+    return queue
+
+@st.cache_resource
+def get_reports():
+    return ReportEngine(st.secrets.get("REPORTS_DIR", ".cache/reports"), max_workers=int(st.secrets.get("REPORT_WORKERS", 2)),
+                        font=st.secrets.get("REPORT_FONT"))
+
+def save_project(*names):
+    """Sauvegarde serveur incrémentale : seuls les champs passés (ceux qui viennent de changer) sont écrits."""
+    state = st.session_state
+    if not state.get('project_id'):  # premier enregistrement : tout ce qui existe déjà
+        state.project_id = get_project_store().new_id()
+        names = [k for k in project_format.FIELDS["ancien"] if k in state]
+    get_memory().rehydrate(state, [*names, 'angle_choisi'])
+    title = (state.get('angle_choisi') or {}).get('titre') or state.get('idee_initiale', '')[:80]
+    try:
+        with span("projects.save", fields=len(names)):
+            get_project_store().save(OWNER, "ancien", state.project_id, {n: state[n] for n in names if n in state},
+                                     title=title, step=state.step)
+    except Exception as e:
+        st.toast(f"⚠️ Sauvegarde en ligne impossible : {e}")
+
+def open_project(project_id):
+    with span("projects.load"):
+        data = get_project_store().load(OWNER, project_id)
+    if not data:
+        st.error("Projet introuvable.")
+        return
+    reset_app()
+    for key, value in project_format.validate("ancien", data).items():
+        st.session_state[key] = value
+    st.session_state.project_id = project_id
+    st.rerun()
+
 # --- LOGIQUE HYBRIDE (CLEF SECRÈTE) ---
 # On cherche d'abord dans les secrets du serveur
 server_key = st.secrets.get("OPENAI_API_KEY", None)
@@ -143,36 +200,168 @@ with st.sidebar:
         st.info("🔒 Mode Visiteur (BYOK)")
         api_key = st.text_input("Clé API OpenAI", type="password", key="openai_api_key_input")
     
-    model_choice = st.selectbox("Modèle", ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"])
+    model_choice = st.selectbox("Modèle", [AUTO, "gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"],
+                                format_func=lambda m: "Auto (par phase)" if m == AUTO else m)
+    mode_concurrent = st.toggle("⚡ Mode concurrent", key="mode_concurrent",
+                                help="Lance la phase suivante en parallèle sans attendre votre validation.")
     st.markdown("---")
     st.subheader("💾 Sauvegarde / Chargement")
-    uploaded_file = st.file_uploader("📂 Charger (.json)", type="json")
+    uploaded_file = st.file_uploader("📂 Charger (.gpsp / .json)", type=["gpsp", "json"])
     if uploaded_file and st.button("Restaurer"): load_project(uploaded_file)
     st.markdown("---")
     st.button("🔄 Reset", on_click=reset_app)
+    # Panneau admin : seulement avec le code ADMIN_ACCESS_CODE (comme batch_app), jamais pour tous les visiteurs
+    admin_code = st.secrets.get("ADMIN_ACCESS_CODE")
+    if admin_code and st.text_input("🔒 Code admin", type="password", key="admin_code") == admin_code:
+        render_latency_panel(st, extra={"Regroupement": flights.stats(), "Projets": get_project_store().stats(),
+                                        "Rapports PDF": get_reports().stats(),
+                                        "Tokens": token_budget.usage_store.summary(),
+                                        "Routage": router.states(), "Jobs": get_jobs().stats(),
+                                        "Idées (index)": get_idea_index().stats(),
+                                        "Mémoire (sessions)": get_memory().totals()})
+
+# Sidebar affichée : les SDK se chargent en fond pendant la saisie de la clé / de l'idée
+if st.secrets.get("WARMUP", True): warm_up("openai", *(["supabase"] if st.secrets.get("SUPABASE_URL") else []))
 
 if not api_key:
     st.warning("⬅️ Clé API requise.")
     st.stop()
 
-gps = GPSSystem(api_key, model_choice)
+# Pas de compte ici. Clé du visiteur (BYOK) : projets, jobs et idées rattachés à l'empreinte de sa clé.
+# Clé du serveur, commune à tous : à un identifiant de visiteur aléatoire gardé dans l'URL (à conserver en favori).
+KEY_ID = hashlib.sha256(api_key.encode()).hexdigest()[:32]
+get_keyring()[KEY_ID] = (api_key, st.secrets.get("OPENAI_BASE_URL", None))
+if server_key:
+    if not re.fullmatch(r"[0-9a-f]{32}", st.query_params.get("visitor", "")): st.query_params["visitor"] = uuid.uuid4().hex
+    OWNER = f"visitor:{st.query_params['visitor']}"
+else:
+    OWNER = KEY_ID
+with st.sidebar:
+    st.fragment(render_recent_projects)(st, get_project_store(), OWNER, "ancien", open_project,
+                                        st.session_state.get('project_id'), rerun_scope="fragment")
+
+base_url = st.secrets.get("OPENAI_BASE_URL", None)
+token_budget.configure(st.secrets.get("TOKEN_BUDGETS"))
+router.configure(st.secrets.get("MODEL_ROUTES"))
+agps = AsyncGPSSystem(api_key, model_choice, base_url=base_url) if mode_concurrent else None
+
+def error_hint(res):
+    return " Service IA saturé, réessayez dans un instant." if res.get('retryable') else ""
+
+def model_caption(res):
+    if res.get('_model'): st.caption(f"🤖 {res['_model']}")
+    if res.get('_reused'): st.caption(f"♻️ Repris de l'idée proche « {res['_reused']['idea'][:120]} » ({res['_reused']['score']:.0%})")
+
+def find_similar(idee):
+    if not IDEA_REUSE_THRESHOLD or not idee.strip(): return None
+    return get_idea_index().best(OWNER, idee, IDEA_REUSE_THRESHOLD)
+
+def similar_offer():
+    """Idée proche déjà passée au crash test : reprendre son résultat ou lancer l'analyse quand même."""
+    offer = st.session_state.get('similar')
+    if not offer: return
+    m, idee = offer['match'], offer['idee']
+    st.info(f"💡 Idée très proche déjà analysée ({m['score']:.0%}) : « {m['idea'][:200]} »")
+    c1, c2 = st.columns(2)
+    if c1.button("♻️ Reprendre ce résultat", type="primary"):
+        del st.session_state.similar
+        st.session_state.idee_initiale = idee
+        st.session_state.crash_test_result = {**m['result'], '_model': m.get('model'),
+                                              '_reused': {'idea': m['idea'], 'score': m['score']}}
+        save_project('idee_initiale', 'crash_test_result')
+        st.rerun()
+    if c2.button("Analyser quand même"):
+        del st.session_state.similar
+        run_phase('crash_test_result', 'crash_test', idee, "Analyse...", {"idee_initiale": idee})
+
+def run_phase(key, phase, arg, label, state):
+    """Envoie la phase dans la file de jobs ; son résultat arrivera dans st.session_state[key].
+    `state` : les entrées de la phase, remises en session au retour (utile après une déconnexion)."""
+    payload = {"key": key, "phase": phase, "arg": arg, "model": model_choice, "label": label, "state": state,
+               "key_id": KEY_ID}  # la clé elle-même reste en mémoire (get_keyring), jamais dans la file
+    st.session_state.job = get_jobs().submit(OWNER, "ancien", "gps", payload,
+                                             key=flight_key(model_choice, phase, json.dumps(arg, sort_keys=True, ensure_ascii=False)))
+    st.query_params["job"] = st.session_state.job  # pour se rattacher au job après une déconnexion
+    st.rerun()
+
+PHASE_STEPS = {"crash_test": "crash_test", "phase_g": "generation", "phase_p": "priorisation", "phase_s": "sequencage"}
+
+def finish_phase(job):
+    st.session_state.job = None
+    st.query_params.pop("job", None)
+    if job:
+        p = job["payload"]
+        st.session_state.update(p["state"])
+        st.session_state.step = PHASE_STEPS[p["phase"]]
+        st.session_state[p["key"]] = job["result"] if job["status"] == "done" else \
+            {"error": True, "message": job["error"], "retryable": job["error_type"] != "LookupError"}
+        save_project(p["key"], *p["state"])
+    st.rerun()
+
+def show_partial(partial):
+    # Phase G : les angles déjà arrivés, dans la même liste que le choix final
+    if not isinstance(partial, list): return st.markdown(f"{partial} ▌")
+    for a in partial:
+        with st.expander(f"📐 {a.get('titre')}"): st.write(a.get('opportunite'))
+
+@st.fragment
+def angle_picker(angles):
+    # Cocher un angle ne ré-exécute que ce bloc ; l'app entière seulement au passage en Phase P
+    sel = []
+    with span("fragment.angle_picker"):
+        for a in angles:
+            with st.expander(f"📐 {a.get('titre')}"):
+                st.write(a.get('opportunite'))
+                if st.checkbox("Sélectionner", key=f"c_{a['id']}"): sel.append(a)
+    if len(sel) == 3:
+        if st.button("Valider -> Phase P"):
+            st.session_state.angles_selectionnes = sel
+            st.session_state.step = 'priorisation'
+            save_project('angles_selectionnes', 'step')
+            st.rerun()
+    else: st.warning(f"Sélectionnez 3 angles ({len(sel)}/3)")
 
 # --- CORPS DE L'APP ---
+# Seuls les résultats que l'étape affiche sont relus ; les autres restent sur disque
+get_memory().rehydrate(st.session_state, STEP_READS.get(st.session_state.step, []))
 st.markdown("<h1 class='main-title'>🧭 IA-BrainStormer GPS</h1>", unsafe_allow_html=True)
 
+# Phase en cours dans la file de jobs (ou reprise après une déconnexion) : la page la suit sans bloquer de thread
+if 'job' not in st.session_state: st.session_state.job = st.query_params.get("job")
+if st.session_state.job:
+    render_job(st, get_jobs(), st.session_state.job, OWNER, finish_phase, show_partial=show_partial)
+    enforce_budget()
+    st.stop()
+
 # PHASE 0
 if st.session_state.step == 'crash_test':
     st.subheader("Phase 0 : Crash Test")
     idee = st.text_area("Votre idée :", height=100, key="input_idee")
     if st.button("🚀 Crash Test"):
-        with st.spinner("Analyse..."):
-            st.session_state.crash_test_result = gps.crash_test_dur(idee)
-            st.session_state.idee_initiale = idee
+        # Mode concurrent : la Phase G ne dépend que de l'idée, elle démarre pendant le scoring
+        if agps: speculate('phase_g_result', idee, agps.phase_g_generation(idee))
+        match = find_similar(idee)
+        if match:
+            st.session_state.similar = {'idee': idee, 'match': match}
             st.rerun()
+        run_phase('crash_test_result', 'crash_test', idee, "Analyse...", {"idee_initiale": idee})
+    # Mode concurrent : tout le parcours d'un coup, chaque phase partant dès que ses entrées sont prêtes
+    if agps and idee and st.button("⚡ Parcours automatique (G → P → S)"):
+        try:
+            with st.spinner("Crash test, angles, priorisation et plan en parallèle..."):
+                ctx = run_pipeline(agps, idee, get_background_loop())
+        except PhaseError as e:
+            st.error(f"Erreur IA ({e.phase})." + error_hint(e.result))
+            st.stop()
+        for k in ["idee_initiale", *PHASE_GRAPH]: st.session_state[k] = ctx[k]
+        st.session_state.step = 'sequencage'
+        save_project("idee_initiale", *PHASE_GRAPH, 'step')
+        st.rerun()
+    similar_offer()
 
     if 'crash_test_result' in st.session_state:
         res = st.session_state.crash_test_result
-        if res.get('error'): st.error("Erreur IA.")
+        if res.get('error'): st.error("Erreur IA." + error_hint(res))
         else:
             c1,c2,c3 = st.columns(3)
             c1.metric("Douleur", f"{res.get('score_D',0)}/10")
@@ -181,49 +370,46 @@ if st.session_state.step == 'crash_test':
             
             if res.get('verdict') == 'VERT': st.markdown(f"<div class='verdict-vert'>✅ {res.get('analyse_critique')}</div>", unsafe_allow_html=True)
             else: st.markdown(f"<div class='verdict-rouge'>🛑 {res.get('analyse_critique')}</div>", unsafe_allow_html=True)
+            model_caption(res)
             
             validee = st.text_area("Reformulation :", value=st.session_state.get('idee_initiale'))
             if st.button("Valider -> Phase G"):
                 st.session_state.idee_validee = validee
                 st.session_state.step = 'generation'
+                save_project('idee_validee', 'step')
                 st.rerun()
 
 # PHASE G
 elif st.session_state.step == 'generation':
     st.subheader("Phase G : Génération")
     if 'phase_g_result' not in st.session_state:
-        with st.spinner("Génération..."):
-            st.session_state.phase_g_result = gps.phase_g_generation(st.session_state.idee_validee)
-            st.rerun()
+        res = take_speculation('phase_g_result', st.session_state.idee_validee)
+        # Sinon : job, les angles s'affichent famille par famille, dès que chaque éclat arrive
+        if not res: run_phase('phase_g_result', 'phase_g', st.session_state.idee_validee, "Génération...",
+                              {"idee_validee": st.session_state.idee_validee})
+        st.session_state.phase_g_result = res
+        save_project('phase_g_result')
+        st.rerun()
     else:
         res = st.session_state.phase_g_result
         if res.get('error'): 
-            st.error("Erreur format."); 
+            st.error("Erreur format." + error_hint(res)); 
             if st.button("Réessayer"): del st.session_state.phase_g_result; st.rerun()
         else:
-            sel = []
-            for a in res.get('angles', []):
-                with st.expander(f"📐 {a.get('titre')}"):
-                    st.write(a.get('opportunite'))
-                    if st.checkbox("Sélectionner", key=f"c_{a['id']}"): sel.append(a)
-            if len(sel) == 3:
-                if st.button("Valider -> Phase P"):
-                    st.session_state.angles_selectionnes = sel
-                    st.session_state.step = 'priorisation'
-                    st.rerun()
-            else: st.warning(f"Sélectionnez 3 angles ({len(sel)}/3)")
+            model_caption(res)
+            if res.get('_shards_failed'): st.caption(f"⚠️ {res['_shards_failed']} famille(s) d'angles sans réponse.")
+            angle_picker(res.get('angles', []))
 
 # PHASE P
 elif st.session_state.step == 'priorisation':
     st.subheader("Phase P : Priorisation")
     if 'phase_p_result' not in st.session_state:
-        with st.spinner("Priorisation..."):
-            st.session_state.phase_p_result = gps.phase_p_priorisation(st.session_state.angles_selectionnes)
-            st.rerun()
+        run_phase('phase_p_result', 'phase_p', st.session_state.angles_selectionnes, "Priorisation...",
+                  {"angles_selectionnes": st.session_state.angles_selectionnes})
     else:
         res = st.session_state.phase_p_result
         if res.get('error') or 'evaluations' not in res:
-            st.error("Erreur format IA.")
+            st.error("Erreur format IA." + error_hint(res))
             if st.button("Relancer"): del st.session_state.phase_p_result; st.rerun()
         else:
             data_clean = []
@@ -242,7 +428,10 @@ elif st.session_state.step == 'priorisation':
             titre_gagnant = mes_3_angles[idx_gagnant]['titre'] if 0 <= idx_gagnant < len(mes_3_angles) else "Err"
 
             st.success(f"🏆 Recommandation : Option {id_gagnant} - {titre_gagnant}")
+            if agps and 0 <= idx_gagnant < len(mes_3_angles):
+                speculate('phase_s_result', mes_3_angles[idx_gagnant], agps.phase_s_sequencage(mes_3_angles[idx_gagnant]))
             st.info(reco.get('raison'))
+            model_caption(res)
 
             options_indices = range(len(mes_3_angles))
             default_idx = idx_gagnant if (0 <= idx_gagnant < len(mes_3_angles)) else 0
@@ -251,33 +440,55 @@ elif st.session_state.step == 'priorisation':
             if st.button("Générer le Plan -> Phase S"):
                 st.session_state.angle_choisi = mes_3_angles[choix_idx]
                 st.session_state.step = 'sequencage'
+                save_project('angle_choisi', 'step')
                 st.rerun()
 
 # PHASE S
 elif st.session_state.step == 'sequencage':
     st.subheader("Phase S : Plan")
     if 'phase_s_result' not in st.session_state:
-        with st.spinner("Backcasting..."):
-            res = gps.phase_s_sequencage(st.session_state.angle_choisi)
-            st.session_state.phase_s_result = res
-            
-            titre_projet = st.session_state.angle_choisi.get('titre', 'Projet Sans Titre')
-            timestamp = datetime.now().strftime("%H:%M")
-            st.session_state.history.append({"time": timestamp, "titre": titre_projet})
-            st.rerun()
+        res = take_speculation('phase_s_result', st.session_state.angle_choisi)
+        if not res: run_phase('phase_s_result', 'phase_s', st.session_state.angle_choisi, "Backcasting...",
+                              {"angle_choisi": st.session_state.angle_choisi})
+        st.session_state.phase_s_result = res
+        save_project('phase_s_result')  # l'historique vit côté serveur (liste « Projets récents »)
+        st.rerun()
     else:
         plan = st.session_state.phase_s_result
-        if plan.get('error'): st.error("Erreur plan.")
+        if plan.get('error'): st.error("Erreur plan." + error_hint(plan))
         else:
             st.info(f"Objectif : {plan.get('resultat_j7')}")
             for j in plan.get('etapes_journalieres', []):
                 st.write(f"**{j.get('jour')}** : {j.get('action_principale')}")
-            
-            state_to_save = {k: v for k, v in st.session_state.items() if k not in ['openai_api_key_input', 'history']}
-            json_str = json.dumps(state_to_save, indent=2, ensure_ascii=False)
+            model_caption(plan)
             
             col1, col2 = st.columns(2)
             with col1:
-                st.download_button("💾 SAUVEGARDER LE PROJET (JSON)", json_str, "projet_gps_save.json", type="primary")
+                # Le fichier n'est construit qu'au clic, pas à chaque rerun
+                if st.session_state.get('export'):
+                    st.download_button("⬇️ TÉLÉCHARGER LE PROJET", st.session_state.export, "projet_gps_save.gpsp", type="primary")
+                elif st.button("💾 SAUVEGARDER LE PROJET", type="primary"):
+                    with span("export_project"):
+                        get_memory().rehydrate(st.session_state)  # tout le projet part dans le fichier
+                        st.session_state.export = project_format.dump("ancien", dict(st.session_state.items()))
+                    st.rerun()
             with col2:
                 st.button("Nouveau Projet", on_click=reset_app)
+
+            # Rapport PDF G/P/S rendu en fond ; même contenu = même fichier, jamais rendu deux fois
+            sections = ancien_sections(st.session_state)
+            key = report_key("IA-BrainStormer GPS", sections)
+            report = get_reports().status(key)
+            pdf = get_reports().read(key, "IA-BrainStormer GPS", sections) if report == "ready" else None
+            if pdf:
+                st.download_button("📄 TÉLÉCHARGER LE RAPPORT PDF", pdf, "rapport_gps.pdf", mime="application/pdf")
+            elif report in ("ready", "pending"):  # "ready" sans fichier : élagué entre-temps, rendu relancé
+                st.info("📄 PDF en préparation...")
+                st.button("🔄 Actualiser")
+            else:
+                if report == "error": st.warning("Échec du PDF, relancez.")
+                if st.button("📄 RAPPORT PDF"):
+                    get_reports().submit(key, "IA-BrainStormer GPS", sections)
+                    st.rerun()
+
+enforce_budget()
@@ -0,0 +1,250 @@
+"""
+Mode batch : crash-test de centaines d'idées (CSV ou Google Sheet) en parallèle, pour les ateliers.
+
+    python batch.py idees.csv --task crash_test --out resultats.parquet --concurrency 8 --rpm 300
+    python batch.py "https://docs.google.com/spreadsheets/d/<id>/export?format=csv" --task analyse --column idee
+
+Tâches : crash_test (GPSSystem.crash_test_dur, OpenAI) et analyse (prompt « Analyse critique business », Gemini).
+Clés : OPENAI_API_KEY / GOOGLE_API_KEY (variables d'environnement).
+Reprise : chaque idée terminée est ajoutée à <out>.checkpoint.jsonl ; relancer la même commande
+repart là où le run s'était arrêté. Sortie Parquet (pyarrow) si disponible, CSV sinon, réécrite au fil de l'eau.
+Interface admin : batch_app.py.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llm_cache import normalize_input
+
+SCORES = ["score_D", "score_U", "score_R"]
+
+# ==========================================
+# 1. LIMITEUR DE DÉBIT (PAR FOURNISSEUR)
+# ==========================================
+
+class RateLimiter:
+    """Seau à jetons : `rpm` requêtes par minute en régime établi, `burst` d'un coup au maximum."""
+    def __init__(self, rpm: float, burst: int = None):
+        self.rate = rpm / 60.0
+        self.capacity = burst or max(1, int(rpm // 10))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(provider: str, rpm: float) -> RateLimiter:
+    """Un limiteur par fournisseur, partagé par tous les runs du process (CLI ou page admin)."""
+    with _limiters_lock:
+        if provider not in _limiters or _limiters[provider].rate != rpm / 60.0:
+            _limiters[provider] = RateLimiter(rpm)
+        return _limiters[provider]
+
+
+class RateLimitedProvider:
+    """Chaque requête réelle (reprises et corrections comprises) passe par le limiteur du fournisseur."""
+    def __init__(self, provider, limiter: RateLimiter):
+        self.provider = provider
+        self.limiter = limiter
+        self.name = provider.name  # mêmes disjoncteurs que l'app
+
+    def complete(self, *args, **kwargs):
+        self.limiter.acquire()
+        return self.provider.complete(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        self.limiter.acquire()
+        return self.provider.stream(*args, **kwargs)
+
+# ==========================================
+# 2. TÂCHES
+# ==========================================
+
+def crash_test_task(api_key: str, model: str = "gpt-4o", base_url: str = None, rpm: float = 300):
+    from gps_system import GPSSystem
+    from llm_provider import OpenAIProvider, LLMClient
+    provider = RateLimitedProvider(OpenAIProvider(api_key, base_url), limiter_for("openai", rpm))
+    gps = GPSSystem(api_key, model, base_url=base_url, llm=LLMClient([(provider, model)]))
+
+    def run(idea):
+        res = gps.crash_test_dur(idea)
+        if res.get("error"): return {"error": res.get("message") or "réponse invalide"}
+        return {k: res.get(k) for k in SCORES + ["total", "verdict", "analyse_critique", "conseil_architecte"]}
+    return run
+
+
+def analyse_task(api_key: str, model: str = "gemini-2.5-pro", endpoint: str = None, rpm: float = 300):
+    from llm_provider import GeminiProvider, LLMClient
+    from prompts import PROMPT_ANALYSE
+    from token_budget import build_prompt
+    llm = LLMClient([(RateLimitedProvider(GeminiProvider(api_key, endpoint), limiter_for("gemini", rpm)), model)])
+
+    def run(idea):
+        prompt, max_tokens = build_prompt("analysis", PROMPT_ANALYSE, {"idea": idea}, model)
+        res = llm.generate(prompt, max_tokens=max_tokens, phase="analysis")
+        return {"analysis": res.text, "model": res.model}
+    return run
+
+
+def make_task(task: str, model: str = None, rpm: float = 300, keys=None):
+    """`keys` : variables d'environnement par défaut, ou st.secrets depuis la page admin."""
+    keys = keys if keys is not None else os.environ
+    if task == "crash_test":
+        return crash_test_task(keys["OPENAI_API_KEY"], model or "gpt-4o", keys.get("OPENAI_BASE_URL"), rpm)
+    return analyse_task(keys["GOOGLE_API_KEY"], model or "gemini-2.5-pro", keys.get("GEMINI_ENDPOINT"), rpm)
+
+# ==========================================
+# 3. ENTRÉES, REPRISE, SORTIE
+# ==========================================
+
+def idea_id(task: str, idea: str) -> str:
+    return hashlib.sha256(f"{task}\x1f{normalize_input(idea)}".encode("utf-8")).hexdigest()[:16]
+
+
+def load_ideas(source, column: str = "idea", task: str = "crash_test") -> list:
+    """[(id, idée)] depuis un CSV (chemin ou URL d'export Sheets) ou un DataFrame ; doublons retirés."""
+    import pandas as pd
+    df = source if isinstance(source, pd.DataFrame) else pd.read_csv(source)
+    if column not in df.columns: column = df.columns[0]
+    ideas = df[column].dropna().astype(str).str.strip()
+    seen, out = set(), []
+    for idea in ideas[ideas != ""]:
+        key = idea_id(task, idea)
+        if key not in seen:
+            seen.add(key)
+            out.append((key, idea))
+    return out
+
+
+class Checkpoint:
+    """Journal JSONL des idées terminées (une ligne par idée, écrite dès la fin de l'appel)."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        rows = {}
+        if not os.path.exists(self.path): return rows
+        with open(self.path, encoding="utf-8") as fh:
+            for line in fh:
+                try: row = json.loads(line)
+                except ValueError: continue  # dernière ligne tronquée par un arrêt brutal
+                rows[row["id"]] = row
+        return rows
+
+    def append(self, row: dict):
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def write_output(rows, out: str):
+    """Réécrit le fichier de sortie (Parquet si pyarrow est installé, CSV sinon) ; renvoie (DataFrame, chemin)."""
+    import pandas as pd
+    df = pd.DataFrame(list(rows))
+    if out.endswith(".parquet"):
+        try:
+            df.to_parquet(out + ".tmp", index=False)
+            os.replace(out + ".tmp", out)
+            return df, out
+        except ImportError:
+            out = out[:-len(".parquet")] + ".csv"
+    df.to_csv(out + ".tmp", index=False)
+    os.replace(out + ".tmp", out)
+    return df, out
+
+# ==========================================
+# 4. EXÉCUTION
+# ==========================================
+
+def run_batch(ideas: list, task_fn, task: str, out: str, concurrency: int = 8, flush_every: int = 25,
+              on_progress=None, stop: threading.Event = None):
+    """Traite les idées pas encore dans le checkpoint ; renvoie (DataFrame complet, chemin de sortie).
+    `on_progress(terminées, total)` est appelé après chaque idée ; `stop` interrompt proprement le run."""
+    checkpoint = Checkpoint(out + ".checkpoint.jsonl")
+    done = {k: r for k, r in checkpoint.load().items() if not r.get("error")}  # les échecs sont retentés
+    todo = [(k, idea) for k, idea in ideas if k not in done]
+    total, lock = len(ideas), threading.Lock()
+
+    def one(key, idea):
+        if stop is not None and stop.is_set(): return None
+        t0 = time.perf_counter()
+        try: result = task_fn(idea)
+        except Exception as e: result = {"error": str(e)[:500]}
+        row = {"id": key, "idea": idea, "task": task, **result,
+               "latency_ms": round((time.perf_counter() - t0) * 1000, 1), "finished_at": time.time()}
+        checkpoint.append(row)
+        return row
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        futures = [pool.submit(one, k, idea) for k, idea in todo]
+        for i, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            if row is None: continue
+            with lock:
+                done[row["id"]] = row
+                if i % flush_every == 0: _, path = write_output(done.values(), out)
+            if on_progress: on_progress(len(done), total)
+    df, path = write_output(done.values(), out)
+    return df, path
+
+
+def summarize(df) -> dict:
+    """Synthèse D.U.R vectorisée (pas de boucle Python par ligne)."""
+    import pandas as pd
+    if df.empty or not set(SCORES) <= set(df.columns): return {"ideas": len(df)}
+    scores = df[SCORES].apply(pd.to_numeric, errors="coerce")
+    total = scores.sum(axis=1, min_count=3)
+    ok = total.notna()
+    stats = scores[ok].agg(["mean", "median", "std", "min", "max"]).round(2)
+    verdicts = df.loc[ok, "verdict"].fillna("?").value_counts()
+    bands = pd.cut(total[ok], bins=[0, 12, 20, 30], labels=["faible (≤12)", "moyen (13-20)", "fort (21-30)"],
+                   include_lowest=True).value_counts().sort_index()
+    top = df.loc[ok].assign(total_dur=total[ok]).nlargest(10, "total_dur")[["idea", *SCORES, "total_dur", "verdict"]]
+    return {"ideas": len(df), "scored": int(ok.sum()), "errors": int((~ok).sum()), "share_vert": round(float(
+            (df.loc[ok, "verdict"] == "VERT").mean()) if ok.any() else 0.0, 3),
+            "scores": stats, "verdicts": verdicts, "bands": bands, "top": top}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", help="CSV (chemin ou URL d'export Google Sheets)")
+    ap.add_argument("--task", choices=["crash_test", "analyse"], default="crash_test")
+    ap.add_argument("--column", default="idea", help="colonne des idées (défaut : idea, sinon la 1re)")
+    ap.add_argument("--out", help="fichier de sortie (défaut : batch_<task>.parquet)")
+    ap.add_argument("--model")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--rpm", type=float, default=300, help="requêtes par minute max vers le fournisseur")
+    ap.add_argument("--flush-every", type=int, default=25, help="réécrit la sortie toutes les N idées")
+    args = ap.parse_args(argv)
+
+    ideas = load_ideas(args.source, args.column, args.task)
+    out = args.out or f"batch_{args.task}.parquet"
+    t0 = time.perf_counter()
+    df, path = run_batch(ideas, make_task(args.task, args.model, args.rpm), args.task, out, args.concurrency,
+                         args.flush_every, on_progress=lambda n, total: print(f"\r{n}/{total}", end="", flush=True))
+    print(f"\n{len(df)} idées en {time.perf_counter() - t0:.1f}s -> {path}")
+    summary = summarize(df)
+    for name, value in summary.items():
+        print(f"\n== {name} ==\n{value}" if hasattr(value, "to_string") else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
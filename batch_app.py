@@ -0,0 +1,116 @@
+"""
+Page admin du mode batch (voir batch.py) : crash-test de centaines d'idées depuis un CSV ou une Google Sheet.
+Le run tourne dans un thread du process : on peut fermer l'onglet et revenir suivre la progression.
+Accès : secret BATCH_ACCESS_CODE.
+"""
+import os
+import threading
+import time
+import streamlit as st
+import batch
+
+st.set_page_config(page_title="Batch GPS (admin)", page_icon="🧪", layout="wide")
+
+# ==========================================
+# 1. ACCÈS & RUNS
+# ==========================================
+
+code = st.secrets.get("BATCH_ACCESS_CODE")
+if not code or st.text_input("Code d'accès", type="password") != code:
+    st.warning("🔒 Réservé à l'administrateur.")
+    st.stop()
+
+OUT_DIR = st.secrets.get("BATCH_DIR", os.path.join(".cache", "batch"))
+os.makedirs(OUT_DIR, exist_ok=True)
+
+
+class BatchRun:
+    def __init__(self, name, ideas, task, task_fn, out, concurrency):
+        self.name, self.task, self.out = name, task, out
+        self.total, self.done, self.path, self.df, self.error = len(ideas), 0, out, None, None
+        self.started = time.time()
+        self.stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ideas, task_fn, concurrency), daemon=True)
+        self._thread.start()
+
+    def _run(self, ideas, task_fn, concurrency):
+        try:
+            self.df, self.path = batch.run_batch(ideas, task_fn, self.task, self.out, concurrency,
+                                                 on_progress=self._progress, stop=self.stop)
+        except Exception as e:
+            self.error = str(e)
+
+    def _progress(self, done, total): self.done = done
+
+    @property
+    def running(self): return self._thread.is_alive()
+
+
+@st.cache_resource
+def get_runs():
+    return {}  # nom -> BatchRun, partagé par toutes les sessions admin
+
+# ==========================================
+# 2. LANCEMENT
+# ==========================================
+
+st.title("🧪 Mode batch")
+c1, c2 = st.columns(2)
+with c1:
+    up = st.file_uploader("CSV d'idées", type="csv")
+    sheet_url = st.text_input("…ou URL d'une Google Sheet")
+    column = st.text_input("Colonne des idées", value="idea")
+with c2:
+    task = st.selectbox("Tâche", ["crash_test", "analyse"],
+                        format_func=lambda t: "Crash test D.U.R (OpenAI)" if t == "crash_test" else "Analyse critique (Gemini)")
+    concurrency = st.slider("Appels simultanés", 1, 32, 8)
+    rpm = st.number_input("Requêtes / minute max", 10, 5000, 300, step=10)
+    model = st.text_input("Modèle (vide = défaut)") or None
+
+if st.button("🚀 Lancer / reprendre", type="primary", disabled=not (up or sheet_url)):
+    if up: source, name = up, os.path.splitext(up.name)[0]
+    else:
+        from streamlit_gsheets import GSheetsConnection
+        source = st.connection("gsheets", type=GSheetsConnection).read(spreadsheet=sheet_url)
+        name = "sheet_" + batch.idea_id("url", sheet_url)[:8]
+    ideas = batch.load_ideas(source, column, task)
+    runs = get_runs()
+    key = f"{name}_{task}"
+    if key in runs and runs[key].running: st.warning("Ce run tourne déjà.")
+    else:
+        # Même nom + même tâche = même checkpoint : un run interrompu reprend là où il s'était arrêté
+        task_fn = batch.make_task(task, model, rpm, keys=st.secrets)
+        runs[key] = BatchRun(key, ideas, task, task_fn, os.path.join(OUT_DIR, f"{key}.parquet"), concurrency)
+        st.rerun()
+
+# ==========================================
+# 3. SUIVI & SYNTHÈSE
+# ==========================================
+
+for key, run in sorted(get_runs().items(), key=lambda kv: -kv[1].started):
+    st.divider()
+    st.subheader(f"{key} · {run.done}/{run.total}")
+    st.progress(run.done / run.total if run.total else 1.0)
+    if run.error: st.error(run.error)
+    if run.running:
+        c1, c2 = st.columns(2)
+        c1.button("🔄 Actualiser", key=f"refresh_{key}")
+        if c2.button("⏹️ Arrêter", key=f"stop_{key}"): run.stop.set()
+        continue
+    if run.df is None: continue
+    summary = batch.summarize(run.df)
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Idées", summary["ideas"])
+    m2.metric("Notées", summary.get("scored", "-"))
+    m3.metric("Erreurs", summary.get("errors", int(run.df["error"].notna().sum()) if "error" in run.df else 0))
+    m4.metric("Verdict VERT", f"{summary['share_vert']:.0%}" if "share_vert" in summary else "-")
+    if "scores" in summary:
+        c1, c2, c3 = st.columns(3)
+        c1.dataframe(summary["scores"])
+        c2.dataframe(summary["verdicts"])
+        c3.dataframe(summary["bands"])
+        st.dataframe(summary["top"], hide_index=True)
+    with open(run.path, "rb") as fh:
+        st.download_button("💾 Résultats", fh, os.path.basename(run.path), key=f"dl_{key}")
+    with st.expander("Toutes les lignes"):
+        st.dataframe(run.df, hide_index=True)
@@ -0,0 +1,52 @@
+"""
+Vérification de la fusion des éclats de la Phase G (gps_system.AngleMerger), sans réseau :
+des angles distincts au libellé proche survivent, les vrais doublons sont écartés, il en reste toujours 3.
+
+    python bench/check_angle_merge.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gps_system import MIN_ANGLES, AngleMerger  # noqa: E402
+
+
+def angle(titre, cible="PME industrielles"):
+    return {"id": 1, "titre": titre, "cible_precise": cible, "opportunite": "..."}
+
+
+def merged(*shards):
+    merger = AngleMerger()
+    for angles in shards: merger.add_shard({"angles": angles, "_model": "stub"})
+    return merger.result([{"angles": a} for a in shards])["angles"]
+
+
+CASES = [
+    # (éclats, titres attendus)
+    ([[angle("Offre B2B"), angle("Offre B2C")]], ["Offre B2B", "Offre B2C"]),
+    ([[angle("Cible PME", "Ateliers"), angle("Cible ETI", "Ateliers")]], ["Cible PME", "Cible ETI"]),
+    ([[angle("Location courte durée", "Touristes")], [angle("Location longue durée", "Touristes")]],
+     ["Location courte durée", "Location longue durée"]),
+    ([[angle(f"Angle {i}", f"Cible {i}") for i in range(1, 4)], [angle(f"Angle {i}", f"Cible {i}") for i in range(1, 3)]],
+     ["Angle 1", "Angle 2", "Angle 3"]),
+    ([[angle("Abonnement mensuel PME", "Les PME du bâtiment"), angle("Abonnement mensuel pour PME", "Les PME du batiment"),
+       angle("Marketplace"), angle("Formation")]], ["Abonnement mensuel PME", "Marketplace", "Formation"]),
+    ([[angle("Même angle"), angle("Meme angle !"), angle("MÊME ANGLE")]], ["Même angle", "Meme angle !", "MÊME ANGLE"]),
+]
+
+
+def main():
+    failures = 0
+    for shards, expected in CASES:
+        got = merged(*shards)
+        titles = [a["titre"] for a in got]
+        ok = titles == expected and [a["id"] for a in got] == list(range(1, len(got) + 1))
+        ok = ok and len(got) >= min(MIN_ANGLES, sum(map(len, shards)))
+        print(f"{'ok ' if ok else 'ÉCHEC'}  {titles}" + ("" if ok else f"   attendu {expected}"))
+        failures += not ok
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Test de charge : N sessions de beta_app.py ou ancien_app.py contre les remplaçants locaux de bench/stubs.py
+(sans réseau). Mesure la mémoire résidente (RSS) ajoutée par une session, le déversement sur disque (écritures,
+relectures) et la latence des reruns (p50 / p95 / p99), pour un budget mémoire par session donné.
+Code de sortie 1 si une session échoue, ou si le budget ne déclenche aucun déversement.
+Deux modes :
+- par défaut, une session par process (N en parallèle) : latences sous charge, mais la RSS mesurée est celle
+  d'une session seule dans un process neuf, pas celle de N sessions tenues par un même serveur ;
+- `--in-process` : les N sessions, l'une après l'autre, dans ce process et toutes gardées ouvertes (ressources
+  partagées, comme un serveur Streamlit) : RSS par session = croissance du process / N.
+
+    python bench/load_test.py --app beta --sessions 200 --concurrency 16
+    python bench/load_test.py --app beta --sessions 200 --in-process         # mémoire de N sessions, un serveur
+    python bench/load_test.py --app ancien --sessions 100 --budget-kb 0      # mesure seule, sans déversement
+    python bench/load_test.py --app beta --payload-size 20000 --json bench/results/load.json
+
+Chaque session suit le parcours complet (jobs attendus jusqu'au bout), puis `--idle-reruns` reruns sans action,
+comme un onglet laissé ouvert : chacun relit les champs déversés que la page affiche, puis reprend leur fichier
+(« fichiers repris ») au lieu de les réécrire.
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+from run_bench import bench_secrets, by_label, job_running, state_items, state_size  # noqa: E402
+from session_memory import MemoryBudget, Spilled, rss_bytes  # noqa: E402
+
+
+def load_secrets(tmp, budget_kb):
+    return {**bench_secrets(tmp), "IDEA_REUSE_THRESHOLD": 0, "WARMUP": False, "SESSION_MEMORY_KB": budget_kb}
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else None
+
+
+def peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def budget_counters(budgets=None) -> dict:
+    """Compteurs du MemoryBudget de l'app (ressource partagée du process)."""
+    budgets = budgets or [o for o in gc.get_objects() if isinstance(o, MemoryBudget)]
+    return {k: sum(b.counters[k] for b in budgets) for k in ("spills", "reused", "rehydrations", "sheds")}
+
+
+def spilled_fields(at) -> int:
+    """Marqueurs `Spilled` en session, y compris dans un sous-dict (projet de beta_app)."""
+    values = list(state_items(at).values())
+    values += [v for d in values if isinstance(d, dict) for v in d.values()]
+    return sum(isinstance(v, Spilled) for v in values)
+
+# ==========================================
+# 1. SESSION SIMULÉE
+# ==========================================
+
+class Session:
+    """Un onglet : une AppTest, ses reruns chronométrés."""
+    def __init__(self, app, secrets, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(os.path.join(ROOT, f"{app}_app.py"), default_timeout=timeout)
+        self.at.secrets.update(secrets)
+        self.timeout = timeout
+        self.latencies = []   # (action, ms)
+
+    def step(self, action, fn=None):
+        t0 = time.perf_counter()
+        (fn or (lambda: self.at.run(timeout=self.timeout)))()
+        self.latencies.append((action, (time.perf_counter() - t0) * 1000))
+        if self.at.exception: raise RuntimeError(f"{action} : {self.at.exception[0].value}")
+
+    def click(self, label):
+        self.step(label, lambda: (by_label(self.at.button, label).click(), self.at.run(timeout=self.timeout)))
+
+    def settle(self, poll=0.05):
+        """Relance la page tant qu'elle suit un job (voir jobs.render_job), comme le fragment de sondage."""
+        deadline = time.monotonic() + self.timeout
+        while job_running(self.at):
+            if time.monotonic() > deadline: raise TimeoutError("job non terminé")
+            time.sleep(poll)
+            self.step("poll")
+
+
+def journey_beta(s: Session, i: int):
+    s.step("open")
+    by_label(s.at.text_input, "Email Professionnel").input(f"load{i}@example.com")
+    s.click("Connexion")
+    by_label(s.at.text_area, "Votre idée :").input(f"Idée de test de charge n°{i} : location de matériel entre voisins")
+    s.click("Lancer (1 crédit)")
+    s.settle()
+    s.click("Aller aux Pivots ➡️")
+    s.settle()
+
+
+def journey_ancien(s: Session, i: int):
+    s.step("open")
+    s.at.text_area(key="input_idee").input(f"Idée de test de charge n°{i} : un SaaS de planning pour food-trucks")
+    s.click("🚀 Crash Test")
+    s.settle()
+    s.click("Valider -> Phase G")
+    s.settle()
+    for cb in list(s.at.checkbox)[:3]: cb.check()
+    s.step("select")
+    s.click("Valider -> Phase P")
+    s.settle()
+
+
+JOURNEYS = {"beta": journey_beta, "ancien": journey_ancien}
+
+# ==========================================
+# 2. EXÉCUTION
+# ==========================================
+# AppTest et le script runner de Streamlit ne supportent pas plusieurs sessions sur des threads d'un même process :
+# en parallèle, chaque session tourne dans son propre process (un process neuf par session), comme un worker par
+# onglet ; --in-process les enchaîne dans un seul process pour mesurer la mémoire de N sessions ouvertes ensemble.
+
+def init_worker(config):
+    stubs.install(config)
+    import streamlit  # noqa: F401  (chargé avant la mesure de référence)
+
+
+def one_session(app, i, tmp, budget_kb, idle_reruns, timeout):
+    """Dans un process dédié : parcours complet puis reruns à vide ; renvoie les mesures (jamais d'exception)."""
+    secrets = load_secrets(os.path.join(tmp, f"s{i}"), budget_kb)
+    os.makedirs(os.path.join(tmp, f"s{i}"), exist_ok=True)
+    os.environ.setdefault("TRACE_FILE", os.path.join(tmp, f"s{i}", "traces.jsonl"))
+    out = {"session": i, "error": None}
+    try:
+        Session(app, secrets, timeout).step("warmup")  # imports et ressources partagées hors mesure
+        before, baseline = budget_counters(), rss_bytes()
+        s = Session(app, secrets, timeout)
+        try:
+            JOURNEYS[app](s, i)
+            for _ in range(idle_reruns): s.step("idle")  # réhydrate ce qui a été déversé, puis re-déverse
+        except Exception as e:
+            out["error"] = f"session {i} : {e!r}"
+        after = budget_counters()
+        out.update(latencies=s.latencies, state_bytes=state_size(s.at), spilled=spilled_fields(s.at),
+                   rss=rss_bytes() - baseline, peak_rss=peak_rss(), **{k: after[k] - before[k] for k in after})
+    except Exception as e:
+        out["error"] = f"session {i} : {e!r}"
+    out["disk"] = dir_size(secrets["SPILL_DIR"]) if os.path.exists(secrets["SPILL_DIR"]) else 0
+    return out
+
+
+def run_in_process(app, sessions, tmp, budget_kb, idle_reruns, timeout, config):
+    """Toutes les sessions dans ce process, gardées ouvertes jusqu'au relevé de RSS : parcours l'un après l'autre
+    (AppTest ne tourne pas sur plusieurs threads), puis les reruns à vide de chacune."""
+    init_worker(config)
+    secrets = load_secrets(tmp, budget_kb)  # un seul serveur : fichiers, file de jobs et index partagés
+    os.environ.setdefault("TRACE_FILE", os.path.join(tmp, "traces.jsonl"))
+    t0 = time.perf_counter()
+    Session(app, secrets, timeout).step("warmup")
+    budgets = [o for o in gc.get_objects() if isinstance(o, MemoryBudget)]
+    baseline, live = rss_bytes(), []
+
+    def measured(out, fn):  # compteurs du budget attribués à la session qui vient de tourner
+        before = budget_counters(budgets)
+        try: fn()
+        except Exception as e: out["error"] = out["error"] or f"session {out['session']} : {e!r}"
+        for k, v in budget_counters(budgets).items(): out[k] = out.get(k, 0) + v - before[k]
+
+    for i in range(sessions):
+        s, out = Session(app, secrets, timeout), {"session": i, "error": None}
+        measured(out, lambda: JOURNEYS[app](s, i))
+        live.append((s, out))
+    for s, out in live:
+        if not out["error"]: measured(out, lambda: [s.step("idle") for _ in range(idle_reruns)])
+    rss = (rss_bytes() - baseline) / max(1, len(live))
+    results = []
+    for s, out in live:
+        out.update(latencies=s.latencies, state_bytes=state_size(s.at), spilled=spilled_fields(s.at),
+                   rss=rss, peak_rss=peak_rss(), disk=0)
+        results.append(out)
+    if results: results[0]["disk"] = dir_size(secrets["SPILL_DIR"]) if os.path.exists(secrets["SPILL_DIR"]) else 0
+    return results, time.perf_counter() - t0
+
+
+def run(app, sessions, concurrency, tmp, budget_kb, idle_reruns, timeout, config):
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrency, max_tasks_per_child=1, initializer=init_worker,
+                             initargs=(config,)) as pool:
+        futures = [pool.submit(one_session, app, i, tmp, budget_kb, idle_reruns, timeout) for i in range(sessions)]
+        for future in as_completed(futures):
+            try: results.append(future.result())
+            except Exception as e: results.append({"error": f"process : {e!r}", "disk": 0})  # process tué, pickle...
+    return results, time.perf_counter() - t0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", choices=["beta", "ancien"], default="beta")
+    ap.add_argument("--sessions", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=8, help="sessions (process) actives en même temps")
+    ap.add_argument("--budget-kb", type=int, default=16,
+                    help="SESSION_MEMORY_KB (0 : mesure seule) ; bas par défaut pour que le déversement serve")
+    ap.add_argument("--idle-reruns", type=int, default=3)
+    ap.add_argument("--latency", type=float, default=0.05, help="latence IA simulée (s)")
+    ap.add_argument("--payload-size", type=int, default=8000, help="taille des réponses IA (caractères)")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--in-process", action="store_true",
+                    help="toutes les sessions dans un même process, gardées ouvertes (RSS de N sessions d'un serveur)")
+    ap.add_argument("--json", help="écrit aussi les résultats dans ce fichier")
+    args = ap.parse_args(argv)
+
+    config = stubs.StubConfig(args.latency, payload_size=args.payload_size, db_latency=0.005)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.in_process:
+            results, elapsed = run_in_process(args.app, args.sessions, tmp, args.budget_kb, args.idle_reruns,
+                                              args.timeout, config)
+        else:
+            results, elapsed = run(args.app, args.sessions, args.concurrency, tmp, args.budget_kb, args.idle_reruns,
+                                   args.timeout, config)
+
+    errors = sorted((r["error"] for r in results if r["error"]), key=len)
+    done = [r for r in results if not r["error"]]  # mesures des seules sessions arrivées au bout
+    latencies = [ms for r in done for _, ms in r["latencies"]]
+    by_action = {}
+    for r in done:
+        for action, ms in r["latencies"]: by_action.setdefault(action, []).append(ms)
+    mb = lambda b: round(b / 1e6, 1)
+    kb = lambda b: round(b / 1024, 1) if b is not None else None
+    rss, states = [r["rss"] for r in done], [r["state_bytes"] for r in done]
+    report = {
+        "app": args.app, "mode": "in-process" if args.in_process else "process-per-session",
+        "sessions": args.sessions, "concurrency": 1 if args.in_process else args.concurrency, "budget_kb": args.budget_kb,
+        "payload_size": args.payload_size, "elapsed_s": round(elapsed, 1), "errors": errors,
+        "rss_per_session_kb": {"median": kb(statistics.median(rss)) if rss else None, "max": kb(max(rss, default=None))},
+        "process_peak_mb": mb(max((r["peak_rss"] for r in done), default=0)),
+        "session_state_kb": {"median": kb(statistics.median(states)) if states else None, "max": kb(max(states, default=None))},
+        "spill": {"sessions_spilled": sum(1 for r in done if r["spills"]), "spills": sum(r["spills"] for r in done),
+                  "reused": sum(r["reused"] for r in done),
+                  "rehydrations": sum(r["rehydrations"] for r in done), "sheds": sum(r["sheds"] for r in done),
+                  "fields_on_disk": sum(r["spilled"] for r in done), "disk_mb": mb(sum(r["disk"] for r in results))},
+        "rerun_ms": {"count": len(latencies), "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                     "p99": percentile(latencies, 0.99), "max": max(latencies, default=None)},
+        "p99_by_action_ms": {a: round(percentile(v, 0.99), 1) for a, v in by_action.items()},
+    }
+    for k in ("p50", "p95", "p99", "max"):
+        if report["rerun_ms"][k] is not None: report["rerun_ms"][k] = round(report["rerun_ms"][k], 1)
+
+    where = "toutes dans ce process" if args.in_process else f"une par process, {args.concurrency} en parallèle"
+    print(f"== {args.app}_app.py : {args.sessions} sessions ({where}), "
+          f"budget {args.budget_kb or '∞'} Ko, {report['elapsed_s']} s ==")
+    if errors:
+        print(f"  ÉCHEC : {len(errors)} session(s) en erreur, mesures non significatives")
+        for e in errors[:5]: print(f"    {e}")
+    r = report["rss_per_session_kb"]
+    print(f"  RSS par session      médiane {r['median']} Ko   max {r['max']} Ko   (pic d'un process {report['process_peak_mb']} Mo)")
+    if args.in_process: print(f"                       croissance du process / {len(done)} sessions ouvertes ensemble")
+    else: print("                       session seule dans un process neuf, pas N sessions d'un même serveur "
+                "(voir --in-process)")
+    print(f"  session_state        médiane {report['session_state_kb']['median']} Ko   max {report['session_state_kb']['max']} Ko")
+    sp = report["spill"]
+    print(f"  déversement          {sp['sessions_spilled']}/{len(done)} sessions   {sp['spills']} écritures   "
+          f"{sp['reused']} fichiers repris   {sp['rehydrations']} relectures   {sp['sheds']} délestages   {sp['disk_mb']} Mo sur disque")
+    l = report["rerun_ms"]
+    print(f"  reruns ({l['count']})       p50 {l['p50']} ms   p95 {l['p95']} ms   p99 {l['p99']} ms   max {l['max']} ms")
+    for action, p99 in sorted(report["p99_by_action_ms"].items(), key=lambda x: -x[1]):
+        print(f"    {action:<22} p99 {p99:>8.1f} ms")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as fh: json.dump(report, fh, indent=2, ensure_ascii=False)
+
+    if args.budget_kb and done and not (sp["spills"] and sp["rehydrations"]):
+        print("  ÉCHEC : aucun déversement / relecture avec ce budget (baisser --budget-kb ou monter --payload-size)")
+        return 1
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
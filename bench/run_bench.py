@@ -0,0 +1,277 @@
+"""
+Benchmarks hors ligne de beta_app.py et ancien_app.py (harnais AppTest de Streamlit + bench/stubs.py).
+
+    python bench/run_bench.py                           # les deux apps, résultats dans bench/results/
+    python bench/run_bench.py --app beta --latency 0.2 --payload-size 8000 --repeat 3
+    python bench/run_bench.py --compare bench/results/A.json bench/results/B.json
+
+Par page / phase : temps total du rerun, temps de script hors réseau simulé,
+allocations (tracemalloc) et taille de st.session_state.
+Interactions dans un fragment (note de beta_app, case à cocher de la Phase G) : `fragment_ms`, le temps du seul
+fragment (son span), à comparer au rerun complet mesuré sur la même interaction.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stubs  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+
+def bench_secrets(tmp):
+    return {
+        "GOOGLE_API_KEY": "bench", "SUPABASE_URL": "http://stub", "SUPABASE_KEY": "bench",
+        "LIEN_RECHARGE": "https://example.com/recharge", "OPENAI_API_KEY": "bench",
+        "LLM_CACHE_PATH": os.path.join(tmp, "llm_cache.sqlite3"), "JOB_DB": os.path.join(tmp, "jobs.sqlite3"),
+        "SPILL_DIR": os.path.join(tmp, "spill"), "IDEA_INDEX_DIR": os.path.join(tmp, "ideas"),
+        "REPORTS_DIR": os.path.join(tmp, "reports"),
+    }
+
+# ==========================================
+# 1. MESURE
+# ==========================================
+
+def state_items(at) -> dict:
+    state = at.session_state
+    try: return dict(state.filtered_state)
+    except AttributeError:
+        try: return {k: state[k] for k in state}
+        except TypeError: return {}
+
+
+def state_size(at):
+    """Taille sérialisée de st.session_state (octets) ; repr() pour ce qui ne se pickle pas."""
+    total = 0
+    for value in state_items(at).values():
+        try: total += len(pickle.dumps(value))
+        except Exception: total += len(repr(value))
+    return total
+
+
+def measure(app, phase, at, action):
+    """Exécute `action` (qui relance le script) et mesure ce rerun."""
+    stubs.NETWORK.reset()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    action()
+    wall = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    errors = [str(getattr(e, "value", e)) for e in at.exception]
+    return {
+        "app": app, "phase": phase,
+        "wall_ms": round(wall * 1000, 2),
+        "script_ms": round((wall - stubs.NETWORK.seconds) * 1000, 2),
+        "network_ms": round(stubs.NETWORK.seconds * 1000, 2),
+        "network_calls": stubs.NETWORK.calls,
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "alloc_retained_kb": round(current / 1024, 1),
+        "session_state_bytes": state_size(at),
+        "errors": errors,
+    }
+
+
+def measure_fragment(app, phase, at, action, span_name):
+    """Interaction dans un fragment. AppTest relance tout le script (wall_ms : le coût sans fragment) ; le span
+    du fragment donne ce que coûte le rerun partiel dans le serveur (fragment_ms)."""
+    from tracing import tracer
+    tracer.reset()
+    result = measure(app, phase, at, action)
+    row = next((r for r in tracer.summary() if r["span"] == span_name), None)
+    result["fragment_ms"] = row["p50_ms"] if row else None
+    if row is None: result["errors"].append(f"span {span_name} non mesuré")
+    return result
+
+
+def by_label(widgets, label):
+    found = [w for w in widgets if w.label == label]
+    if not found: raise LookupError(f"« {label} » introuvable ; présents : {[w.label for w in widgets]}")
+    return found[0]
+
+
+def job_running(at):
+    return "job" in at.session_state and bool(at.session_state["job"])
+
+
+def settle(at, timeout, poll=0.05):
+    """Relance la page tant qu'elle suit un job (voir jobs.render_job), comme le fragment de sondage."""
+    deadline = time.monotonic() + timeout
+    while job_running(at) and not at.exception:
+        if time.monotonic() > deadline: raise TimeoutError(f"job {at.session_state['job']} non terminé après {timeout} s")
+        time.sleep(poll)
+        at.run(timeout=timeout)
+
+
+def click(at, label, timeout):
+    """Clic, puis attente du job éventuellement lancé : le résultat arrive par le fragment de sondage."""
+    by_label(at.button, label).click()
+    at.run(timeout=timeout)
+    settle(at, timeout)
+
+# ==========================================
+# 2. SCÉNARIOS
+# ==========================================
+
+def scenario_beta(secrets, timeout):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "beta_app.py"), default_timeout=timeout)
+    at.secrets.update(secrets)
+    at.run()
+    results = []
+
+    def login():
+        by_label(at.text_input, "Email Professionnel").input("bench@example.com")
+        click(at, "Connexion", timeout)
+    results.append(measure("beta", "login", at, login))
+
+    def analysis():
+        by_label(at.text_area, "Votre idée :").input("Une marketplace de matériel de chantier d'occasion entre artisans")
+        click(at, "Lancer (1 crédit)", timeout)
+    results.append(measure("beta", "analysis", at, analysis))
+    results.append(measure("beta", "pivots", at, lambda: click(at, "Aller aux Pivots ➡️", timeout)))
+    results.append(measure("beta", "gps", at, lambda: click(at, "Valider et Voir le GPS ➡️", timeout)))
+    results.append(measure("beta", "idle_rerun", at, lambda: at.run(timeout=timeout)))
+
+    def note():
+        by_label(at.text_area, "Note").input("Budget 5 k€, lancement en septembre")
+        at.run(timeout=timeout)
+    results.append(measure_fragment("beta", "note_fragment", at, note, "fragment.note"))
+    return results
+
+
+def scenario_ancien(secrets, timeout, concurrent=False):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "ancien_app.py"), default_timeout=timeout)
+    at.secrets.update(secrets)
+    at.run()
+    if concurrent:
+        at.toggle(key="mode_concurrent").set_value(True)
+        at.run()
+    results = []
+
+    def crash_test():
+        at.text_area(key="input_idee").input("Un SaaS de planification pour food-trucks")
+        click(at, "🚀 Crash Test", timeout)
+    results.append(measure("ancien", "crash_test", at, crash_test))
+    results.append(measure("ancien", "generation", at, lambda: click(at, "Valider -> Phase G", timeout)))
+
+    def checkbox():
+        at.checkbox[0].check()
+        at.run(timeout=timeout)
+    results.append(measure_fragment("ancien", "checkbox_fragment", at, checkbox, "fragment.angle_picker"))
+
+    def priorisation():
+        for cb in list(at.checkbox)[1:3]: cb.check()
+        at.run(timeout=timeout)
+        click(at, "Valider -> Phase P", timeout)
+    results.append(measure("ancien", "priorisation", at, priorisation))
+    results.append(measure("ancien", "sequencage", at, lambda: click(at, "Générer le Plan -> Phase S", timeout)))
+    return results
+
+# ==========================================
+# 3. RÉSULTATS
+# ==========================================
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def aggregate(runs):
+    """Médiane par (app, phase) sur les répétitions."""
+    grouped = {}
+    for r in runs: grouped.setdefault((r["app"], r["phase"]), []).append(r)
+    out = []
+    for (app, phase), rows in grouped.items():
+        agg = {"app": app, "phase": phase, "runs": len(rows)}
+        for k in ("wall_ms", "script_ms", "network_ms", "network_calls", "alloc_peak_kb", "alloc_retained_kb",
+                  "session_state_bytes"):
+            agg[k] = statistics.median(r[k] for r in rows)
+        fragment = [r["fragment_ms"] for r in rows if r.get("fragment_ms") is not None]
+        if fragment: agg["fragment_ms"] = statistics.median(fragment)
+        agg["errors"] = sorted({e for r in rows for e in r["errors"]})
+        out.append(agg)
+    return out
+
+
+def compare(path_a, path_b):
+    a, b = (json.load(open(p, encoding="utf-8")) for p in (path_a, path_b))
+    index = {(r["app"], r["phase"]): r for r in a["results"]}
+    print(f"{'app/phase':28} {'wall A':>10} {'wall B':>10} {'Δ%':>7} {'script A':>10} {'script B':>10} {'Δ%':>7}")
+    for r in b["results"]:
+        old = index.get((r["app"], r["phase"]))
+        if not old: continue
+        def delta(k): return (r[k] - old[k]) / old[k] * 100 if old[k] else 0.0
+        print(f"{r['app'] + '/' + r['phase']:28} {old['wall_ms']:>10.1f} {r['wall_ms']:>10.1f} {delta('wall_ms'):>+7.1f}"
+              f" {old['script_ms']:>10.1f} {r['script_ms']:>10.1f} {delta('script_ms'):>+7.1f}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", choices=["beta", "ancien", "all"], default="all")
+    ap.add_argument("--latency", type=float, default=0.05, help="latence IA simulée (s)")
+    ap.add_argument("--chunk-latency", type=float, default=0.0)
+    ap.add_argument("--db-latency", type=float, default=0.01, help="latence Supabase simulée (s)")
+    ap.add_argument("--payload-size", type=int, default=2000, help="taille des réponses IA (caractères)")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--concurrent", action="store_true", help="ancien_app en mode concurrent")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--output", help="fichier JSON de sortie (défaut : bench/results/<date>-<commit>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("A", "B"), help="compare deux fichiers de résultats")
+    args = ap.parse_args(argv)
+
+    if args.compare: return compare(*args.compare)
+
+    config = stubs.StubConfig(args.latency, args.chunk_latency, payload_size=args.payload_size, db_latency=args.db_latency)
+    stubs.install(config)
+    import streamlit as st
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("TRACE_FILE", os.path.join(tmp, "traces.jsonl"))
+        for i in range(args.repeat):
+            st.cache_resource.clear()  # cache IA, registre de crédits... repartent de zéro à chaque passage
+            secrets = bench_secrets(os.path.join(tmp, str(i)))
+            os.makedirs(os.path.join(tmp, str(i)), exist_ok=True)
+            if args.app in ("beta", "all"): runs += scenario_beta(secrets, args.timeout)
+            if args.app in ("ancien", "all"): runs += scenario_ancien(secrets, args.timeout, args.concurrent)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(config),
+        "repeat": args.repeat,
+        "results": aggregate(runs),
+    }
+    path = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh: json.dump(report, fh, indent=2, ensure_ascii=False)
+
+    for r in report["results"]:
+        print(f"{r['app']:7} {r['phase']:13} wall={r['wall_ms']:>8.1f}ms script={r['script_ms']:>8.1f}ms "
+              f"alloc_peak={r['alloc_peak_kb']:>8.1f}KB state={r['session_state_bytes']:>7}B"
+              + (f"  fragment={r['fragment_ms']:.1f}ms ({r['fragment_ms'] / r['wall_ms']:.0%} du rerun complet)"
+                 if r.get("fragment_ms") is not None and r["wall_ms"] else "")
+              + (f"  ERREURS={r['errors']}" if r["errors"] else ""))
+    print(f"-> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Démarrage à froid de beta_app.py et ancien_app.py : temps d'import des SDK et temps jusqu'au premier affichage.
+
+    python bench/startup_time.py                      # les deux apps, 3 démarrages chacune
+    python bench/startup_time.py --app beta --runs 5 --json bench/results/startup.json
+
+Chaque mesure tourne dans un interpréteur neuf (rien en cache). Le premier affichage est mesuré avec le harnais
+AppTest de Streamlit sur de faux secrets (sans réseau) et WARMUP désactivé : la liste « SDK chargés » montre
+ce que la première page a importé elle-même (attendu : aucun).
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDKS = ["streamlit", "supabase", "google.generativeai", "openai", "httpx", "pandas", "fpdf", "numpy"]
+
+SECRETS = {
+    "beta": {"GOOGLE_API_KEY": "x", "SUPABASE_URL": "http://127.0.0.1:9", "SUPABASE_KEY": "x",
+             "LIEN_RECHARGE": "http://127.0.0.1:9", "WARMUP": False},
+    "ancien": {"WARMUP": False},
+}
+
+# Exécuté dans un interpréteur neuf : imprime une ligne JSON
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file({path!r}, default_timeout=120)
+for k, v in {secrets!r}.items(): at.secrets[k] = v
+at.run()
+t2 = time.perf_counter()
+print(json.dumps({{"harness_ms": round((t1 - t0) * 1000, 1), "first_render_ms": round((t2 - t1) * 1000, 1),
+                  "exception": [str(e.value) for e in at.exception],
+                  "sdk_loaded": [m for m in {sdks!r} if m in sys.modules]}}))
+"""
+
+
+def import_time(module: str):
+    """Temps d'import cumulé (ms) de `module` dans un interpréteur neuf, ou None s'il n'est pas installé."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0: return None
+    cumulative = None
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s*(\S+)$", line)
+        if m and m.group(2) == module: cumulative = int(m.group(1))
+    return round(cumulative / 1000, 1) if cumulative is not None else None
+
+
+def first_render(app: str) -> dict:
+    code = CHILD.format(path=os.path.join(ROOT, f"{app}_app.py"), secrets=SECRETS[app], sdks=SDKS[1:])
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    wall = round((time.perf_counter() - t0) * 1000, 1)
+    if proc.returncode != 0: return {"error": proc.stderr.strip().splitlines()[-1:] or ["?"], "process_ms": wall}
+    return {**json.loads(proc.stdout.strip().splitlines()[-1]), "process_ms": wall}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", choices=["beta", "ancien", "both"], default="both")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--json", help="écrit aussi les résultats dans ce fichier")
+    args = ap.parse_args(argv)
+
+    results = {"imports_ms": {m: import_time(m) for m in SDKS}, "apps": {}}
+    print("== Import (cumulé, interpréteur neuf) ==")
+    for m, ms in results["imports_ms"].items():
+        print(f"  {m:<22} {'absent' if ms is None else f'{ms:>8.1f} ms'}")
+
+    for app in (["beta", "ancien"] if args.app == "both" else [args.app]):
+        runs = [first_render(app) for _ in range(args.runs)]
+        ok = [r for r in runs if "error" not in r]
+        results["apps"][app] = {"runs": runs}
+        print(f"\n== {app}_app.py : premier affichage ({len(ok)}/{len(runs)} démarrages) ==")
+        if not ok:
+            print(f"  échec : {runs[0]['error']}")
+            continue
+        for field in ("first_render_ms", "process_ms"):
+            values = [r[field] for r in ok]
+            results["apps"][app][field] = {"median": statistics.median(values), "max": max(values)}
+            print(f"  {field:<22} médiane {statistics.median(values):>8.1f} ms   max {max(values):>8.1f} ms")
+        print(f"  SDK chargés            {', '.join(ok[-1]['sdk_loaded']) or 'aucun'}")
+        if ok[-1]["exception"]: print(f"  exception              {ok[-1]['exception']}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as fh: json.dump(results, fh, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Remplaçants locaux et déterministes de Gemini (google.generativeai), OpenAI et Supabase.
+install() les enregistre dans sys.modules : les apps tournent sans réseau ni clé.
+Latence et taille des réponses réglables (StubConfig) ; le temps passé à « attendre le réseau »
+est cumulé dans NETWORK pour pouvoir le retirer du temps d'exécution du script.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+import types
+from types import SimpleNamespace as NS
+
+
+class StubConfig:
+    def __init__(self, latency=0.05, chunk_latency=0.0, chunks=8, payload_size=2000, db_latency=0.01):
+        self.latency = latency              # délai avant la réponse IA (s)
+        self.chunk_latency = chunk_latency  # délai entre deux morceaux de flux (s)
+        self.chunks = chunks
+        self.payload_size = payload_size    # taille des textes générés (caractères)
+        self.db_latency = db_latency        # délai d'un aller-retour Supabase (s)
+
+
+class NetworkClock:
+    """Cumul (thread-safe) du temps simulé passé en attente réseau."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = 0.0
+        self.calls = 0
+
+    def wait(self, seconds):
+        time.sleep(seconds)
+        with self._lock:
+            self.seconds += seconds
+            self.calls += 1
+
+    async def await_(self, seconds):
+        await asyncio.sleep(seconds)
+        with self._lock:
+            self.seconds += seconds
+            self.calls += 1
+
+    def reset(self):
+        with self._lock: self.seconds, self.calls = 0.0, 0
+
+
+CONFIG = StubConfig()
+NETWORK = NetworkClock()
+
+
+def _pad(text, size):
+    return (text * (size // max(1, len(text)) + 1))[:size]
+
+
+def _split(text, n):
+    size = max(1, len(text) // n)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+# ==========================================
+# 1. GEMINI
+# ==========================================
+
+def _gemini_text(prompt):
+    return _pad(f"## Analyse simulée\n- Point clé sur : {str(prompt)[:60]}\n", CONFIG.payload_size)
+
+
+class _GeminiResponse:
+    def __init__(self, text, stream):
+        self._text = text
+        self._stream = stream
+        self.candidates = [NS(finish_reason=NS(name="STOP"), content=NS(parts=[NS(text=text)]))]
+        self.usage_metadata = NS(prompt_token_count=50, candidates_token_count=len(text) // 4)
+
+    @property
+    def text(self): return self._text
+
+    def __iter__(self):
+        for piece in _split(self._text, CONFIG.chunks):
+            if CONFIG.chunk_latency: NETWORK.wait(CONFIG.chunk_latency)
+            yield NS(text=piece)
+
+
+class GenerativeModel:
+    def __init__(self, model_name="gemini", system_instruction=None, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        NETWORK.wait(CONFIG.latency)
+        return _GeminiResponse(_gemini_text(prompt), stream)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await NETWORK.await_(CONFIG.latency)
+        return _GeminiResponse(_gemini_text(prompt), False)
+
+# ==========================================
+# 2. OPENAI
+# ==========================================
+
+def _openai_payload(system, user):
+    """JSON valide pour chacun des 4 formats de gps_system."""
+    filler = _pad("Texte simulé. ", max(20, CONFIG.payload_size // 10))
+    if "D.U.R" in system:
+        data = {"score_D": 8, "score_U": 7, "score_R": 6, "total": 21, "verdict": "VERT",
+                "analyse_critique": filler, "conseil_architecte": filler}
+    elif "angles" in system:
+        data = {"angles": [{"id": i, "titre": f"Angle {i}", "cible_precise": f"Cible {i}", "opportunite": filler}
+                           for i in range(1, 11)]}
+    elif "Matrice" in system:
+        data = {"evaluations": [{"id_option": i, "score_douleur": 7, "score_unicite": 6, "score_alignement": 8,
+                                 "score_total_pondere": 20 + i} for i in (1, 2, 3)],
+                "recommandation": {"id_gagnant": 3, "raison": filler}}
+    elif "Backcasting" in system:
+        data = {"resultat_j7": filler, "etapes_journalieres": [
+            {"jour": f"J+{j}", "action_principale": f"Action {j}", "detail_execution": filler} for j in range(7, 0, -1)]}
+    else:
+        data = {"resultat": filler}
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _messages(messages):
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    return system, messages[-1]["content"]
+
+
+def _completion(text, model):
+    return NS(choices=[NS(message=NS(content=text), finish_reason="stop")], model=model,
+              usage=NS(prompt_tokens=60, completion_tokens=len(text) // 4))
+
+
+def _stream(text, model):
+    for piece in _split(text, CONFIG.chunks):
+        if CONFIG.chunk_latency: NETWORK.wait(CONFIG.chunk_latency)
+        yield NS(choices=[NS(delta=NS(content=piece), finish_reason=None)], usage=None)
+    yield NS(choices=[NS(delta=NS(content=None), finish_reason="stop")], usage=None)
+    yield NS(choices=[], usage=NS(prompt_tokens=60, completion_tokens=len(text) // 4))
+
+
+class _Completions:
+    def create(self, model, messages, stream=False, **kwargs):
+        NETWORK.wait(CONFIG.latency)
+        text = _openai_payload(*_messages(messages))
+        return _stream(text, model) if stream else _completion(text, model)
+
+
+class _AsyncCompletions:
+    async def create(self, model, messages, **kwargs):
+        await NETWORK.await_(CONFIG.latency)
+        return _completion(_openai_payload(*_messages(messages)), model)
+
+
+class OpenAI:
+    def __init__(self, *args, **kwargs): self.chat = NS(completions=_Completions())
+    def with_options(self, **kwargs): return self
+
+
+class AsyncOpenAI:
+    def __init__(self, *args, **kwargs): self.chat = NS(completions=_AsyncCompletions())
+    def with_options(self, **kwargs): return self
+
+# ==========================================
+# 3. SUPABASE
+# ==========================================
+
+class FakeSupabase:
+    def __init__(self, default_credits=50):
+        self.default_credits = default_credits
+        self.tables = {"users": {}}
+        self._lock = threading.Lock()
+
+    def table(self, name): return _Query(self, name)
+
+    def rpc(self, fn, params): return _Rpc(self, fn, params)
+
+
+class _Rpc:
+    def __init__(self, db, fn, params): self.db, self.fn, self.params = db, fn, params
+
+    def execute(self):
+        NETWORK.wait(CONFIG.db_latency)
+        users = self.db.tables["users"]
+        with self.db._lock:
+            if self.fn == "login_user":
+                email = self.params["p_email"]
+                users.setdefault(email, {"email": email, "credits": self.db.default_credits,
+                                         "access_code": self.params.get("p_access_code")})
+                return NS(data=[dict(users[email])])
+            if self.fn == "consume_credits":
+                row = users.get(self.params["p_email"])
+                if not row or row["credits"] < self.params["p_amount"]: return NS(data=None)
+                row["credits"] -= self.params["p_amount"]
+                return NS(data=row["credits"])
+        return NS(data=None)
+
+
+class _Query:
+    """Sous-ensemble du client PostgREST : select/insert/update/upsert/delete + eq/order/range/limit."""
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+        self.op, self.payload, self.filters, self.cols = "select", None, [], "*"
+        self._order, self._range, self._conflict = None, None, None
+
+    def select(self, cols="*", **kw): self.cols = cols; return self
+    def insert(self, row, **kw): self.op, self.payload = "insert", row; return self
+    def upsert(self, row, on_conflict=None, **kw): self.op, self.payload, self._conflict = "upsert", row, on_conflict; return self
+    def update(self, values): self.op, self.payload = "update", values; return self
+    def delete(self): self.op = "delete"; return self
+    def eq(self, col, val): self.filters.append((col, val)); return self
+    def order(self, col, desc=False): self._order = (col, desc); return self
+    def range(self, start, end): self._range = (start, end); return self
+    def limit(self, n): self._range = (0, n - 1); return self
+
+    def _rows(self, table):
+        return [r for r in table.values() if all(r.get(c) == v for c, v in self.filters)]
+
+    def _project(self, row):
+        if self.cols in ("*", None): return dict(row)
+        return {c.strip(): row.get(c.strip()) for c in self.cols.split(",")}
+
+    def execute(self):
+        NETWORK.wait(CONFIG.db_latency)
+        table = self.db.tables.setdefault(self.name, {})
+        key_col = "email" if self.name == "users" else "id"
+        with self.db._lock:
+            if self.op in ("insert", "upsert"):
+                rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                out = []
+                for row in rows:
+                    row = dict(row)
+                    row.setdefault(key_col, f"{self.name}-{len(table) + 1}")
+                    key = tuple(row.get(c.strip()) for c in self._conflict.split(",")) if self._conflict else row[key_col]
+                    table[key] = {**table.get(key, {}), **row}
+                    out.append(dict(table[key]))
+                return NS(data=out)
+            rows = self._rows(table)
+            if self.op == "update":
+                for r in rows: r.update(self.payload)
+                return NS(data=[dict(r) for r in rows])
+            if self.op == "delete":
+                for k in [k for k, r in table.items() if any(r is x for x in rows)]: del table[k]
+                return NS(data=rows)
+            if self._order: rows.sort(key=lambda r: r.get(self._order[0]) or "", reverse=self._order[1])
+            if self._range: rows = rows[self._range[0]:self._range[1] + 1]
+            return NS(data=[self._project(r) for r in rows])
+
+# ==========================================
+# 4. INSTALLATION
+# ==========================================
+
+SUPABASE = FakeSupabase()
+
+
+def install(config: StubConfig = None):
+    """Remplace les SDK dans sys.modules (à appeler avant de lancer une app)."""
+    global CONFIG
+    if config is not None: CONFIG = config
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = GenerativeModel
+    try:
+        import google
+    except ImportError:
+        google = types.ModuleType("google")
+        google.__path__ = []
+        sys.modules["google"] = google
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+
+    openai = types.ModuleType("openai")
+    openai.OpenAI, openai.AsyncOpenAI = OpenAI, AsyncOpenAI
+    sys.modules["openai"] = openai
+
+    supabase = types.ModuleType("supabase")
+    supabase.create_client = lambda url, key, *args, **kwargs: SUPABASE
+    sys.modules["supabase"] = supabase
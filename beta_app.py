@@ -1,13 +1,26 @@
 import streamlit as st
-from supabase import create_client
-import google.generativeai as genai
-import json
 import time
 import os
 import urllib.parse
 import uuid 
 import re   
-import requests 
+from llm_cache import LLMCache, cache_key
+from prefetch import PrefetchEngine
+from singleflight import flights, flight_key
+import project_format
+from prompts import PROMPT_ANALYSE, PROMPT_PIVOTS, PROMPT_GPS
+import token_budget
+from token_budget import build_prompt, usage_store
+from derived import DerivedCache
+from reports import ReportEngine, beta_sections, report_key
+from jobs import JobQueue, build_backend as build_job_backend, render_job
+from session_memory import MemoryBudget
+from project_store import ProjectStore, build_backend, render_recent_projects
+from resources import get_supabase, get_gemini_llm, warm_up
+from model_router import router
+from llm_provider import breaker_states
+from tracing import span, traced, render_latency_panel
+from credit_ledger import CreditLedger, InsufficientCredits, SupabaseLedgerBackend, PostgresLedgerBackend, MemoryLedgerBackend
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(page_title="Stratège IA", page_icon="🎯", layout="wide")
@@ -17,27 +30,114 @@ try:
     URL_SUPA = st.secrets["SUPABASE_URL"]
     KEY_SUPA = st.secrets["SUPABASE_KEY"]
     LINK_RECHARGE = st.secrets["LIEN_RECHARGE"]
+    ADMIN_EMAILS = [e.strip().lower() for e in st.secrets.get("ADMIN_EMAILS", [])]
     
     BASE_FORM_URL = "https://docs.google.com/forms/d/e/1FAIpQLScKU17kIr4t_Wiwi6uTMd0a2CCUMtqOU0w_yEHb8uAXVfgCZw/viewform"
     ENTRY_EMAIL = "entry.121343077"
     ENTRY_IDEE  = "entry.1974870243"
     ENTRY_AUDIT = "entry.1147735867"
 
-    supabase = create_client(URL_SUPA, KEY_SUPA)
-    genai.configure(api_key=API_GOOGLE)
-    
-    model = genai.GenerativeModel('gemini-2.5-pro')
+    # Clients mis en cache au niveau process et construits au premier usage (db(), llm_for()) :
+    # la page de connexion s'affiche sans attendre les SDK
+    MODEL_NAME = 'gemini-2.5-pro'  # phases hors routage
+    GEMINI_ENDPOINT = st.secrets.get("GEMINI_ENDPOINT")
+    LLM_TIMEOUT = float(st.secrets.get("LLM_TIMEOUT", 90))
+    # Modèle par phase (analyse : le plus fort, pivots : rapide), descendu d'un cran si son p95 dérape :
+    # voir model_router.DEFAULT_ROUTES, surchargeable par le secret MODEL_ROUTES
+    router.configure(st.secrets.get("MODEL_ROUTES"))
+
+    # Politique cache : un résultat déjà en cache est servi sans débiter de crédit (pas d'appel IA).
+    CACHE_HIT_CONSUMES_CREDIT = bool(st.secrets.get("CACHE_HIT_CONSUMES_CREDIT", False))
+    # Idée très proche d'une idée déjà analysée (idea_index.py) : son analyse est proposée avant tout appel IA.
+    IDEA_REUSE_THRESHOLD = float(st.secrets.get("IDEA_REUSE_THRESHOLD", 0.8))  # 0 : désactivé
+    # Préchargement de la phase suivante (opt-in) : crédit débité seulement à l'affichage.
+    PREFETCH_ENABLED = bool(st.secrets.get("PREFETCH", False))
+    # Le GPS ne part qu'une fois le choix du pivot stable depuis ce délai (s) : essayer les options ne coûte rien
+    PREFETCH_GPS_DELAY = float(st.secrets.get("PREFETCH_GPS_DELAY", 8))
+    # Budgets de tokens par phase (entrée / sortie), voir token_budget.BUDGETS
+    token_budget.configure(st.secrets.get("TOKEN_BUDGETS"))
 
 except Exception as e:
     st.error(f"Erreur Config: {e}")
     st.stop()
 
+def db():
+    return get_supabase(URL_SUPA, KEY_SUPA)
+
+@st.cache_resource
+def get_llm_cache():
+    return LLMCache(st.secrets.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3"),
+                    max_entries=int(st.secrets.get("LLM_CACHE_MAX_ENTRIES", 2000)),
+                    ttl=float(st.secrets.get("LLM_CACHE_TTL_HOURS", 168)) * 3600)
+
+@st.cache_resource
+def get_idea_index():
+    from idea_index import OwnerIndexes  # NumPy chargé au premier usage, pas au premier affichage
+    # Un index par utilisateur : une idée (et son analyse) n'est jamais montrée qu'à son auteur
+    return OwnerIndexes(os.path.join(st.secrets.get("IDEA_INDEX_DIR", ".cache/ideas"), "analysis"))
+
+@st.cache_resource
+def get_memory():
+    # Budget par session (SESSION_MEMORY_KB, 0 : mesure seulement) ; rapports déversés dans SPILL_DIR
+    return MemoryBudget(st.secrets.get("SPILL_DIR", ".cache/spill"), budget=int(st.secrets.get("SESSION_MEMORY_KB", 256)) * 1024)
+
+@st.cache_resource
+def get_ledger():
+    kind = st.secrets.get("LEDGER_BACKEND", "supabase")
+    if kind == "postgres": backend = PostgresLedgerBackend(st.secrets["LEDGER_DSN"])
+    elif kind == "memory": backend = MemoryLedgerBackend()
+    else: backend = SupabaseLedgerBackend(db())
+    return CreditLedger(backend)
+
+@st.cache_resource
+def get_project_store():
+    # PROJECT_STORE : supabase (défaut) | postgres (instance locale, PROJECT_STORE_DSN) | memory
+    kind = st.secrets.get("PROJECT_STORE", "supabase")
+    return ProjectStore(build_backend(kind, db() if kind == "supabase" else None, st.secrets.get("PROJECT_STORE_DSN")))
+
+@st.cache_resource
+def get_reports():
+    return ReportEngine(st.secrets.get("REPORTS_DIR", ".cache/reports"), max_workers=int(st.secrets.get("REPORT_WORKERS", 2)),
+                        font=st.secrets.get("REPORT_FONT"))
+
+@st.cache_resource
+def get_prefetcher():
+    return PrefetchEngine(max_workers=int(st.secrets.get("PREFETCH_WORKERS", 4)))
+
+@st.cache_resource
+def get_jobs():
+    # JOB_STORE : sqlite (défaut, fichier JOB_DB) | supabase (table jobs, voir sql/jobs.sql)
+    kind = st.secrets.get("JOB_STORE", "sqlite")
+    queue = JobQueue(build_job_backend(kind, db() if kind == "supabase" else None, st.secrets.get("JOB_DB")),
+                     max_workers=int(st.secrets.get("JOB_WORKERS", 4)))
+    cache, store, ledger, ideas = get_llm_cache(), get_project_store(), get_ledger(), get_idea_index()
+
+    def on_generated(job):
+        # Job réussi, session ouverte ou non : résultat en cache (et l'analyse dans l'index des idées),
+        # un crédit débité, puis enregistré avec le projet. Solde épuisé entre-temps : le job passe en erreur,
+        # le résultat reste en cache (servi sans nouvel appel IA une fois les crédits rechargés)
+        p = job["payload"]
+        cache.put(job["model"], p["template"], p["fields"], job["result"])
+        if p["field"] == "analysis": ideas.add(job["owner"], p["fields"]["idea"], job["result"], model=job["model"])
+        if not ledger.debit(job["owner"]): raise InsufficientCredits("Crédits insuffisants")
+        store.save(job["owner"], "beta", p["project_id"], {**p["updates"], p["field"]: job["result"]},
+                   title=p["title"][:80], step=p["field"])
+
+    queue.register("generate", run_generation, on_generated)
+    queue.recover()
+    return queue
+
 # --- 2. INITIALISATION ---
 if "user" not in st.session_state: st.session_state.user = None
 if "current_page" not in st.session_state: st.session_state.current_page = 1
 if "user_note" not in st.session_state: st.session_state.user_note = "" 
 if "project" not in st.session_state:
-    st.session_state.project = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None}
+    st.session_state.project = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None, "models": {}}
+if "prefetch" not in st.session_state: st.session_state.prefetch = {}
+if "project_id" not in st.session_state: st.session_state.project_id = None
+if "derived" not in st.session_state: st.session_state.derived = DerivedCache()
+if "job" not in st.session_state: st.session_state.job = st.query_params.get("job")  # rattachement après déconnexion
+if "sid" not in st.session_state: st.session_state.sid = uuid.uuid4().hex  # fichiers de déversement de la session
 
 ################################################################################
 # BLOC TEMPORAIRE : OFFRE BÊTA PODIA (À SUPPRIMER DANS 8 JOURS)
@@ -48,37 +148,238 @@ if st.query_params.get("beta") == "mastery20":
 
 # --- 3. FONCTIONS ---
 
+@traced("supabase.login")
 def login_user(email):
     email = str(email).strip().lower()
+    # Un seul aller-retour : insert ... on conflict ... returning (voir sql/login_user.sql)
+    params = {
+        "p_email": email,
+        "p_credits": st.session_state.get("bonus_beta", 2), # Cherche le bonus, sinon met 2
+        "p_access_code": str(uuid.uuid4())
+    }
+    try:
+        res = db().rpc("login_user", params).execute()
+        if res.data: return res.data[0]
+    except Exception:
+        pass  # fonction SQL absente ou en échec : repli ci-dessous
+    # Repli : l'ancien parcours en deux requêtes, inscription comprise
     try:
-        res = supabase.table("users").select("*").eq("email", email).execute()
+        res = db().table("users").select("*").eq("email", email).execute()
         if res.data: return res.data[0]
-        
-        unique_code = str(uuid.uuid4())
-        new = {
-            "email": email, 
-            "credits": st.session_state.get("bonus_beta", 2), # Cherche le bonus, sinon met 2
-            "access_code": unique_code 
-        }        
-        res = supabase.table("users").insert(new).execute()
+        res = db().table("users").insert({"email": email, "credits": params["p_credits"],
+                                          "access_code": params["p_access_code"]}).execute()
         if res.data: return res.data[0]
+        st.error("Erreur Login : compte introuvable et création impossible.")
     except Exception as e:
-        try:
-            res = supabase.table("users").select("*").eq("email", email).execute()
-            if res.data: return res.data[0]
-        except: 
-            st.error(f"Erreur Login: {e}")
+        st.error(f"Erreur Login: {e}")
     return None
 
+@traced("credits.consume")
 def consume_credit():
-    if st.session_state.user:
-        email = st.session_state.user['email']
-        new_val = max(0, st.session_state.user['credits'] - 1)
-        try: 
-            supabase.table("users").update({"credits": new_val}).eq("email", email).execute()
-        except: 
-            pass
-        st.session_state.user['credits'] = new_val
+    # Débit atomique côté serveur, envoyé en tâche de fond par le registre (pas d'aller-retour ici)
+    if not st.session_state.user: return False
+    ledger = get_ledger()
+    email = st.session_state.user['email']
+    ok = ledger.debit(email)
+    st.session_state.user['credits'] = ledger.balance(email)
+    if not ok: st.toast("⚠️ Crédits insuffisants : rechargez vos crédits.")
+    return ok
+
+def gemini_llm(model, fallback=None):
+    # Délais, reprises, disjoncteur et repli : voir llm_provider.py
+    return get_gemini_llm(API_GOOGLE, model, fallback, GEMINI_ENDPOINT, LLM_TIMEOUT)
+
+def llm_for(phase):
+    """(client, modèle) de la phase selon le routeur ; le palier suivant sert de repli."""
+    model, fallback = router.choose(phase, MODEL_NAME)
+    return gemini_llm(model, fallback), model
+
+def run_generation(job, progress):
+    """Exécuté par un worker de la file (sans st.*) : flux Gemini, texte partiel publié au fil de l'eau.
+    Retourne (texte complet, modèle utilisé) ; lève IncompleteResponse si le flux s'arrête avant la fin."""
+    p = job["payload"]
+    llm = gemini_llm(p["model"], p["fallback"])
+
+    def call():
+        with span("gemini.generate", model=p["model"], job=True) as sp:
+            t0 = time.perf_counter()
+            stream = llm.stream(p["prompt"], max_tokens=p["max_tokens"], phase=p["field"])
+            for _ in stream:
+                if "ttft_ms" not in sp["attrs"]: sp["attrs"]["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                progress(stream.text)
+            sp["attrs"].update(chars=len(stream.text), served_by=stream.model)
+        return stream.text, stream.model
+    # La même demande lancée ailleurs (autre session, préchargement) est attendue, pas relancée
+    return flights.do(job["key"], call)[0]
+
+def generate_text(llm, model, prompt, phase, max_tokens):
+    """Version bloquante (sans st.*) pour les threads de préchargement ; retourne (texte, modèle utilisé)."""
+    def call():
+        with span("gemini.generate", model=model, prefetch=True):
+            res = llm.generate(prompt, max_tokens=max_tokens, phase=phase)
+        return res.text, res.model
+    return flights.do(flight_key(model, prompt), call)[0]
+
+def prefetch(phase, template, fields, delay=0):
+    """Lance en fond la génération d'une phase que l'utilisateur va très probablement ouvrir.
+    `delay` : seulement si les entrées restent les mêmes pendant `delay` s (voir PrefetchEngine.start)."""
+    if not PREFETCH_ENABLED or st.session_state.user.get('credits', 0) <= 0: return
+    primary = router.primary(phase, MODEL_NAME)
+    if get_llm_cache().contains(primary, template, fields): return
+    llm, model = llm_for(phase)
+    prompt, max_tokens = build_prompt(phase, template, fields, model)
+    get_prefetcher().start(st.session_state.prefetch, phase, cache_key(primary, template, fields),
+                           generate_text, llm, model, prompt, phase, max_tokens, delay=delay)
+
+def save_project(*names):
+    """Sauvegarde serveur incrémentale : seuls les champs nommés (ceux qui viennent de changer) sont écrits."""
+    if not st.session_state.user: return
+    project = st.session_state.project
+    if not st.session_state.project_id:  # premier enregistrement : tout ce qui est déjà rempli
+        st.session_state.project_id = get_project_store().new_id()
+        names = [k for k, v in project.items() if v]
+    get_memory().rehydrate(project, names)
+    try:
+        with span("projects.save", fields=len(names)):
+            get_project_store().save(st.session_state.user['email'], "beta", st.session_state.project_id,
+                                     {n: project[n] for n in names}, title=project["idea"][:80], step=names[-1] if names else None)
+    except Exception as e:
+        st.toast(f"⚠️ Sauvegarde en ligne impossible : {e}")
+
+def open_project(project_id):
+    with span("projects.load"):
+        data = get_project_store().load(st.session_state.user['email'], project_id)
+    if not data:
+        st.error("Projet introuvable.")
+        return
+    get_prefetcher().discard(st.session_state.prefetch)
+    st.session_state.project = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None, "models": {}}
+    st.session_state.project.update(project_format.validate("beta", data))
+    st.session_state.project_id = project_id
+    st.session_state.current_page = 1
+    st.rerun()
+
+def commit_result(field, template, fields, res, updates=None, charge=True, cached=False, model=None):
+    # Une réponse d'un palier inférieur est rangée sous son propre nom : jamais servie comme résultat principal
+    model = model or router.primary(field, MODEL_NAME)
+    if not cached: get_llm_cache().put(model, template, fields, res)
+    if charge and not consume_credit(): return  # refusé : rien d'affiché ni d'enregistré (le cache le garde)
+    if updates and "idea" in updates: get_prefetcher().discard(st.session_state.prefetch)
+    st.session_state.project.update(updates or {})
+    st.session_state.project[field] = res
+    st.session_state.project.setdefault("models", {})[field] = model  # affiché sous le résultat
+    save_project(*(updates or {}), field, "models")
+    if field == "analysis": prefetch("pivots", PROMPT_PIVOTS, {"idea": st.session_state.project["idea"]})
+
+def generate_into(field, template, fields, label, step, done_label, updates=None, reuse_similar=True):
+    """Génère `field` via la file de jobs (voir jobs.py). Rien n'est enregistré ni débité tant que le job n'a pas réussi.
+    Analyse d'une idée très proche d'une idée déjà analysée : proposée d'abord (voir similar_offer)."""
+    primary = router.primary(field, MODEL_NAME)
+    with span("cache.get", phase=field):
+        cached = get_llm_cache().get(primary, template, fields)
+    if cached:
+        commit_result(field, template, fields, cached, updates, charge=CACHE_HIT_CONSUMES_CREDIT, cached=True)
+        st.toast("⚡ Résultat déjà calculé, servi depuis le cache")
+        st.rerun()
+    if field == "analysis" and reuse_similar and IDEA_REUSE_THRESHOLD:
+        match = get_idea_index().best(st.session_state.user['email'], fields["idea"], IDEA_REUSE_THRESHOLD)
+        if match:
+            st.session_state.similar = {"match": match, "args": [field, template, fields, label, step, done_label, updates]}
+            st.rerun()
+    future = get_prefetcher().take(st.session_state.prefetch, field, cache_key(primary, template, fields))
+    if future is not None:
+        with st.status(label, expanded=True) as status, span(field, prefetched=True):
+            st.write("Résultat préparé en avance...")
+            try:
+                res, served_by = future.result()
+            except Exception:
+                res = None # échec du préchargement : on repasse en génération normale
+            if res:
+                commit_result(field, template, fields, res, updates, model=served_by)
+                status.update(label=done_label, state="complete", expanded=False)
+        if res: st.rerun()
+    if job_error(field): return
+    model, fallback = router.choose(field, MODEL_NAME)
+    gemini_llm(model, fallback)  # client prêt pour le worker
+    prompt, max_tokens = build_prompt(field, template, fields, model)  # entrées ramenées au budget de la phase
+    if not st.session_state.project_id: st.session_state.project_id = get_project_store().new_id()
+    payload = {"field": field, "template": template, "fields": fields, "updates": updates or {},
+               "prompt": prompt, "max_tokens": max_tokens, "model": model, "fallback": fallback,
+               "project_id": st.session_state.project_id, "title": (updates or {}).get("idea", st.session_state.project["idea"]),
+               "label": label, "step": step, "done_label": done_label}
+    with span(field, job=True):
+        st.session_state.job = get_jobs().submit(st.session_state.user['email'], "beta", "generate", payload,
+                                                 key=flight_key(model, prompt))
+    st.query_params["job"] = st.session_state.job  # pour se rattacher au job après une déconnexion
+    st.rerun()
+
+def similar_offer():
+    """Idée proche déjà analysée : reprendre son analyse (comme un résultat en cache) ou analyser quand même."""
+    offer = st.session_state.get("similar")
+    if not offer: return False
+    m, (field, template, fields, *_, updates) = offer["match"], offer["args"]
+    st.info(f"💡 Idée très proche déjà analysée ({m['score']:.0%}) : « {m['idea'][:200]} »")
+    with st.expander("Voir cette analyse"): st.markdown(m["result"])
+    c1, c2 = st.columns(2)
+    if c1.button("♻️ Reprendre cette analyse", type="primary"):
+        del st.session_state.similar
+        commit_result(field, template, fields, m["result"], updates, charge=CACHE_HIT_CONSUMES_CREDIT, cached=True,
+                      model=m.get("model"))
+        st.rerun()
+    if c2.button("Analyser quand même (1 crédit)"):
+        del st.session_state.similar
+        generate_into(*offer["args"], reuse_similar=False)
+    return True
+
+PAGES = {"analysis": 1, "pivots": 2, "gps": 3}  # champ -> page qui l'affiche
+
+def enforce_budget():
+    """Fin d'exécution : au-delà du budget mémoire de la session, les rapports que la page n'affiche pas partent
+    sur disque (puis les artefacts dérivés sont libérés), voir session_memory.py."""
+    page = st.session_state.current_page
+    get_memory().enforce(st.session_state.sid, st.session_state, st.session_state.project, spillable=list(PAGES),
+                         keep=[f for f, p in PAGES.items() if p == page], shed=st.session_state.derived.clear)
+
+def finish_job(job):
+    """Fin du job suivi : résultat repris dans la session, ou projet rechargé si la session a été perdue entre-temps."""
+    st.session_state.job = None
+    st.query_params.pop("job", None)
+    if job and job["status"] == "done":
+        p = job["payload"]
+        if st.session_state.project_id == p["project_id"]:
+            if "idea" in p["updates"]: get_prefetcher().discard(st.session_state.prefetch)
+            st.session_state.project.update(p["updates"])
+            st.session_state.project[p["field"]] = job["result"]
+        else:  # le worker a déjà tout enregistré
+            st.session_state.project = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None, "models": {}}
+            st.session_state.project.update(project_format.validate(
+                "beta", get_project_store().load(st.session_state.user['email'], p["project_id"])))
+            st.session_state.project_id = p["project_id"]
+        st.session_state.project.setdefault("models", {})[p["field"]] = job["model"]
+        save_project("models")
+        st.session_state.current_page = PAGES[p["field"]]
+        st.session_state.user['credits'] = get_ledger().balance(st.session_state.user['email'])  # débité par le worker
+        if p["field"] == "analysis": prefetch("pivots", PROMPT_PIVOTS, {"idea": st.session_state.project["idea"]})
+    elif job:
+        st.session_state.job_error = {"field": job["payload"]["field"], "type": job["error_type"], "message": job["error"]}
+    st.rerun()
+
+def job_error(field, retry=True):
+    """Affiche l'échec du dernier job de `field` ; True tant que l'utilisateur n'a pas cliqué sur « Relancer »."""
+    failed = st.session_state.get("job_error")
+    if not failed or failed["field"] != field: return False
+    if failed["type"] == "IncompleteResponse": st.warning(f"{failed['message']}. Aucun crédit débité, relancez.")
+    elif failed["type"] == "InsufficientCredits": st.warning("Crédits insuffisants : rechargez vos crédits puis relancez (le résultat est gardé, sans nouvel appel IA).")
+    elif failed["type"] == "CircuitOpen": st.warning("Le service IA est momentanément saturé. Aucun crédit débité, réessayez dans une minute.")
+    else: st.error(f"Erreur IA: {failed['message']}")
+    if not retry or st.button("🔄 Relancer", key=f"retry_{field}"):
+        st.session_state.job_error = None
+        return False
+    return True
+
+def model_caption(field):
+    model = st.session_state.project.get("models", {}).get(field)
+    if model: st.caption(f"🤖 {model}")
 
 def clean_markdown(text):
     if not text: return ""
@@ -87,13 +388,29 @@ def clean_markdown(text):
     text = re.sub(r'^\s*[\-\*]\s+', '- ', text, flags=re.MULTILINE)
     return text.strip()
 
+@traced("form_link")
 def generate_form_link():
+    # Recalculé seulement si l'email, l'idée, l'analyse ou la note ont changé
     if not st.session_state.user: return BASE_FORM_URL
-    email = st.session_state.user['email']
-    idee = st.session_state.project.get("idea", "")
-    note_client = st.session_state.user_note
-    raw_audit = st.session_state.project.get("analysis", "")
-    clean_audit = clean_markdown(raw_audit)
+    project = st.session_state.project
+    email, idea, note = st.session_state.user['email'], project.get("idea", ""), st.session_state.user_note
+    sources = (email, idea, get_memory().source(st.session_state.sid, project, "analysis"), note)
+
+    def build():  # l'analyse n'est relue du disque que si le lien doit être refait
+        get_memory().rehydrate(project, ["analysis"])
+        return build_form_link(email, idea, project.get("analysis", ""), note)
+    return st.session_state.derived.get("form_link", sources, build)
+
+def project_sources():
+    """Clé de cache des artefacts tirés de tout le projet (export, rapport), sans relire les champs déversés."""
+    return tuple((k, get_memory().source(st.session_state.sid, st.session_state.project, k)) for k in st.session_state.project)
+
+def full_project():
+    get_memory().rehydrate(st.session_state.project)
+    return st.session_state.project
+
+def build_form_link(email, idee, raw_audit, note_client):
+    clean_audit = st.session_state.derived.get("clean_audit", (raw_audit,), lambda: clean_markdown(raw_audit))
     
     final_content = f"--- PROJET CLIENT ---\n{idee}\n\n"
     if note_client:
@@ -104,18 +421,24 @@ def generate_form_link():
     return f"{BASE_FORM_URL}?{urllib.parse.urlencode(params)}"
 
 def reset_project():
-    st.session_state.project = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None}
+    get_prefetcher().discard(st.session_state.prefetch)
+    get_memory().forget(st.session_state.sid)
+    st.session_state.project = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None, "models": {}}
+    st.session_state.project_id = None
     st.session_state.user_note = ""
+    st.session_state.pop("similar", None)
     st.session_state.current_page = 1
     st.rerun()
 
 def load_json(uploaded_file):
+    # Accepte le format compressé (.gpsp) et les anciens .json ; seuls les champs connus sont repris
     try:
-        uploaded_file.seek(0)
-        data = json.load(uploaded_file)
-        clean_data = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None}
-        clean_data.update(data.get("data", {}))
+        clean_data = {"idea": "", "analysis": "", "pivots": "", "gps": "", "choice": None, "models": {}}
+        clean_data.update(project_format.load(uploaded_file, "beta"))
+        get_prefetcher().discard(st.session_state.prefetch)
         st.session_state.project = clean_data
+        st.session_state.project_id = None
+        save_project()  # un dossier importé devient un nouveau projet en ligne
         st.session_state.current_page = 1
         st.session_state.last_loaded_signature = f"{uploaded_file.name}_{uploaded_file.size}"
         st.success("Dossier chargé !")
@@ -135,33 +458,34 @@ if not st.session_state.user:
             if "@" in email_in:
                 u = login_user(email_in)
                 if u:
+                    get_ledger().seed(u['email'], u.get('credits', 0))
                     st.session_state.user = u
                     st.rerun()
             else: st.warning("Email invalide")
+    # Formulaire affiché : les SDK se chargent pendant que l'utilisateur tape son email
+    if st.secrets.get("WARMUP", True): warm_up("supabase", "google.generativeai")
     st.stop()
 
 # --- 5. APP ---
 user = st.session_state.user
-credits = user.get("credits", 0)
+credits = get_ledger().balance(user['email'])
+# Seul le rapport de la page courante est relu ; les autres restent sur disque tant qu'on ne les lit pas
+get_memory().rehydrate(st.session_state.project, [f for f, p in PAGES.items() if p == st.session_state.current_page])
+user['credits'] = credits
 
-with st.sidebar:
-    if os.path.exists("logo.png"): st.image("logo.png", use_container_width=True)
-    st.write(f"👤 **{user['email']}**")
-    if credits > 0: 
-        st.metric("Crédits", credits)
-    else: 
-        st.error("0 Crédits")
-    
-    # RECHARGE DIRECTE SÉCURISÉE (C'est Lemon Squeezy qui contactera Make)
-    st.link_button("⚡ Recharger mes crédits", LINK_RECHARGE, type="primary", use_container_width=True)
-    
-    st.divider()
-    st.info("💎 **Expert Humain**")
-    st.write("Une précision pour l'expert ?")
-    st.session_state.user_note = st.text_area("Note", value=st.session_state.user_note, height=70, placeholder="Ex: Budget...", label_visibility="collapsed")
-    st.link_button("Réserver Audit (Pré-rempli)", generate_form_link(), type="primary", use_container_width=True)
+# Blocs de la sidebar en fragments : un clic ou une saisie n'y ré-exécute que le bloc concerné.
+# st.rerun() (toute l'app) seulement quand la page principale doit changer.
+@st.fragment
+def sidebar_note():
+    with span("fragment.note"):
+        note = st.text_area("Note", value=st.session_state.user_note, height=70, placeholder="Ex: Budget...", label_visibility="collapsed")
+        changed = note != st.session_state.user_note
+        st.session_state.user_note = note
+        st.link_button("Réserver Audit (Pré-rempli)", generate_form_link(), type="primary", use_container_width=True)
+    if changed and st.session_state.current_page == 3: st.rerun()  # la page GPS affiche aussi ce lien
 
-    st.divider()
+@st.fragment
+def sidebar_navigation():
     st.write("### 🧭 Navigation")
     if st.button("1. Analyse"): 
         st.session_state.current_page = 1
@@ -174,27 +498,98 @@ with st.sidebar:
         st.rerun()
     st.divider()
     if st.button("✨ Nouvelle Analyse"): reset_project()
+
+@st.fragment
+def sidebar_export():
+    # Export construit seulement à la demande, puis gardé tant que le projet ne change pas.
+    # Les champs déversés ne sont relus (full_project) que pour construire l'export ou la clé du rapport.
+    sources = project_sources()
+    export = st.session_state.derived.get("export", sources)
+    if export:
+        st.download_button("⬇️ Télécharger le dossier", export, "projet_ia.gpsp", mime="application/octet-stream")
+    elif st.button("💾 Sauver le dossier"):
+        with span("sidebar.export"):
+            st.session_state.derived.put("export", sources, project_format.dump("beta", full_project()))
+        st.rerun(scope="fragment")
+
+    # Rapport PDF rendu en fond ; même contenu = même fichier, jamais rendu deux fois
+    if st.session_state.project["analysis"]:
+        key = st.session_state.derived.get("report_key", sources, lambda: report_key("Stratège IA", beta_sections(full_project())))
+        report = get_reports().status(key)
+        pdf = get_reports().read(key, "Stratège IA", lambda: beta_sections(full_project())) if report == "ready" else None
+        if pdf:
+            st.download_button("📄 Télécharger le PDF", pdf, "rapport_ia.pdf", mime="application/pdf")
+        elif report in ("ready", "pending"):  # "ready" sans fichier : élagué entre-temps, rendu relancé
+            st.caption("📄 PDF en préparation...")
+            st.button("🔄 Actualiser", key="report_refresh")
+        else:
+            if report == "error": st.caption("⚠️ Échec du PDF, relancez.")
+            if st.button("📄 Rapport PDF"):
+                get_reports().submit(key, "Stratège IA", beta_sections(full_project()))
+                st.rerun(scope="fragment")
+
+@st.fragment
+def sidebar_files():
+    # Choisir / retirer un fichier ne relance que ce bloc ; load_json relance l'app une fois le dossier chargé
+    up = st.file_uploader("📂 Charger un dossier", type=["gpsp", "json"])
+    if up and st.session_state.get("last_loaded_signature") != f"{up.name}_{up.size}":
+        load_json(up)
+    render_recent_projects(st, get_project_store(), user['email'], "beta", open_project, st.session_state.project_id,
+                           rerun_scope="fragment")
+
+with st.sidebar:
+    if os.path.exists("logo.png"): st.image("logo.png", use_container_width=True)
+    st.write(f"👤 **{user['email']}**")
+    if credits > 0: 
+        st.metric("Crédits", credits)
+    else: 
+        st.error("0 Crédits")
     
-    json_str = json.dumps({"data": st.session_state.project}, indent=4)
-    st.download_button("💾 Sauver JSON", json_str, "projet_ia.json", mime="application/json")
+    # RECHARGE DIRECTE SÉCURISÉE (C'est Lemon Squeezy qui contactera Make)
+    st.link_button("⚡ Recharger mes crédits", LINK_RECHARGE, type="primary", use_container_width=True)
     
-    up = st.file_uploader("📂 Charger JSON", type="json")
-    if up:
-        load_json(up)
+    st.divider()
+    st.info("💎 **Expert Humain**")
+    st.write("Une précision pour l'expert ?")
+    sidebar_note()
+    st.divider()
+    sidebar_navigation()
+    sidebar_export()
+    sidebar_files()
     
     if st.button("Déconnexion"):
+        get_prefetcher().discard(st.session_state.prefetch)
+        get_memory().forget(st.session_state.sid)
         st.session_state.clear()
         st.rerun()
 
+    if user['email'] in ADMIN_EMAILS:
+        render_latency_panel(st, extra={"Cache IA": get_llm_cache().stats(), "Crédits": get_ledger().stats(),
+                                        "Préchargement": get_prefetcher().stats(), "Regroupement": flights.stats(),
+                                        "Projets": get_project_store().stats(), "Dérivés (session)": st.session_state.derived.stats(),
+                                        "Rapports PDF": get_reports().stats(), "Tokens": usage_store.summary(),
+                                        "Routage": router.states(), "Jobs": get_jobs().stats(),
+                                        "Idées (index)": get_idea_index().stats(), "Mémoire (sessions)": get_memory().totals(),
+                                        "Disjoncteurs": breaker_states()})
+
 st.title("🧠 Stratège IA")
 st.progress(st.session_state.current_page / 3)
 
+# Génération en cours (ou reprise après une déconnexion) : la page suit le job sans bloquer de thread
+if st.session_state.job:
+    render_job(st, get_jobs(), st.session_state.job, user['email'], finish_job)
+    enforce_budget()
+    st.stop()
+
 # PAGE 1 : ANALYSE
 if st.session_state.current_page == 1:
     st.subheader("1️⃣ Analyse Crash-Test")
+    job_error("analysis", retry=False)  # échec du dernier lancement, affiché une fois
+    if similar_offer(): st.stop()
     if st.session_state.project["analysis"]:
         st.info(f"Sujet : {st.session_state.project['idea']}")
         st.markdown(st.session_state.project["analysis"])
+        model_caption("analysis")
         c1, c2 = st.columns(2)
         with c1:
             if st.button("Aller aux Pivots ➡️", type="primary"):
@@ -205,21 +600,9 @@ if st.session_state.current_page == 1:
                 new_txt = st.text_area("Correction", value=st.session_state.project["idea"])
                 if st.button("Relancer"):
                     if credits > 0:
-                        st.session_state.project["idea"] = new_txt
-                        with st.status("🕵️‍♂️ L'Avocat du Diable analyse...", expanded=True) as status:
-                            st.write("Analyse macro...")
-                            time.sleep(1)
-                            try:
-                                res = model.generate_content(f"Analyse critique business: {new_txt}").text
-                                st.session_state.project["analysis"] = res
-                                status.update(label="✅ Analyse terminée !", state="complete", expanded=False)
-                                st.session_state.project["pivots"] = ""
-                                st.session_state.project["gps"] = ""
-                                consume_credit()
-                                st.rerun() 
-                            except Exception as e:
-                                status.update(label="❌ Erreur", state="error")
-                                st.error(f"Erreur IA: {e}")
+                        generate_into("analysis", PROMPT_ANALYSE, {"idea": new_txt},
+                                      "🕵️‍♂️ L'Avocat du Diable analyse...", "Analyse macro...", "✅ Analyse terminée !",
+                                      updates={"idea": new_txt, "pivots": "", "gps": ""})
                     else: 
                         st.error("Pas de crédit")
     else:
@@ -227,19 +610,9 @@ if st.session_state.current_page == 1:
             idea_input = st.text_area("Votre idée :", height=150)
             if st.button("Lancer (1 crédit)", type="primary"):
                 if idea_input:
-                    st.session_state.project["idea"] = idea_input
-                    with st.status("🧠 Activation Stratège IA...", expanded=True) as status:
-                        st.write("Analyse en cours...")
-                        time.sleep(1)
-                        try:
-                            res = model.generate_content(f"Analyse critique business: {idea_input}").text
-                            st.session_state.project["analysis"] = res
-                            status.update(label="✅ Rapport généré !", state="complete", expanded=False)
-                            consume_credit()
-                            st.rerun()
-                        except Exception as e:
-                            status.update(label="❌ Erreur", state="error")
-                            st.error(f"Erreur IA: {e}")
+                    generate_into("analysis", PROMPT_ANALYSE, {"idea": idea_input},
+                                  "🧠 Activation Stratège IA...", "Analyse en cours...", "✅ Rapport généré !",
+                                  updates={"idea": idea_input})
         else: st.warning("Rechargez vos crédits")
 
 # PAGE 2 : PIVOTS
@@ -249,26 +622,19 @@ elif st.session_state.current_page == 2:
         st.info(f"📌 Projet : {st.session_state.project['idea']}")
     if not st.session_state.project["pivots"]:
         if credits > 0: 
-            with st.status("💡 Recherche de Pivots...", expanded=True) as status:
-                st.write("Brainstorming...")
-                time.sleep(1)
-                try:
-                    res = model.generate_content(f"3 Pivots business pour: {st.session_state.project['idea']}").text
-                    st.session_state.project["pivots"] = res
-                    consume_credit()
-                    status.update(label="✅ Stratégies trouvées !", state="complete", expanded=False)
-                    st.rerun()
-                except Exception as e:
-                    status.update(label="❌ Erreur", state="error")
-                    st.error(f"Erreur IA: {e}")
+            generate_into("pivots", PROMPT_PIVOTS, {"idea": st.session_state.project["idea"]},
+                          "💡 Recherche de Pivots...", "Brainstorming...", "✅ Stratégies trouvées !")
+            st.stop()
         else:
             st.warning("⚠️ Rechargez pour voir les Pivots.")
             st.stop()
     st.markdown(st.session_state.project["pivots"])
+    model_caption("pivots")
     opts = ["Idée Initiale", "Pivot 1", "Pivot 2", "Pivot 3"]
     cur = st.session_state.project.get("choice")
     idx = opts.index(cur) if cur in opts else 0
     choice = st.radio("Choix :", opts, index=idx)
+    prefetch("gps", PROMPT_GPS, {"idea": st.session_state.project["idea"], "choice": choice}, delay=PREFETCH_GPS_DELAY)
     if st.button("Valider et Voir le GPS ➡️", type="primary"):
         st.session_state.project["choice"] = choice
         st.session_state.project["gps"] = ""
@@ -282,22 +648,17 @@ elif st.session_state.current_page == 3:
     st.info(f"Objectif : {tgt}")
     if not st.session_state.project["gps"]:
         if credits > 0:
-            with st.status("🗺️ Calcul itinéraire...", expanded=True) as status:
-                st.write("Plan d'action...")
-                time.sleep(1)
-                try:
-                    res = model.generate_content(f"Plan d'action opérationnel (GPS) pour: {tgt}").text
-                    st.session_state.project["gps"] = res
-                    consume_credit()
-                    status.update(label="✅ Itinéraire prêt !", state="complete", expanded=False)
-                    st.rerun()
-                except Exception as e:
-                    status.update(label="❌ Erreur", state="error")
-                    st.error(f"Erreur IA: {e}")
+            choice = st.session_state.project["choice"]  # enregistré avec le plan : un projet rouvert garde son pivot
+            generate_into("gps", PROMPT_GPS, {"idea": st.session_state.project["idea"], "choice": choice},
+                          "🗺️ Calcul itinéraire...", "Plan d'action...", "✅ Itinéraire prêt !", updates={"choice": choice})
+            st.stop()
         else:
             st.warning("⚠️ Rechargez pour le GPS.")
             st.stop()
     st.markdown(st.session_state.project["gps"])
+    model_caption("gps")
     st.divider()
     st.success("Terminé.")
     st.link_button("💎 Réserver Audit (Pré-rempli)", generate_form_link(), type="primary")
+
+enforce_budget()
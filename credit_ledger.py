@@ -0,0 +1,208 @@
+"""
+Registre de crédits : débit atomique côté serveur, soldes en cache, écriture différée par lots.
+Le rendu Streamlit ne fait jamais d'aller-retour Supabase pour débiter : le débit est réservé
+localement puis envoyé en tâche de fond (regroupé par email), avec file de reprise en cas d'échec.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+
+class InsufficientCredits(Exception):
+    """Débit refusé : solde insuffisant."""
+
+# ==========================================
+# 1. BACKENDS
+# ==========================================
+
+class MemoryLedgerBackend:
+    """Remplaçant en mémoire (tests / dev local), mêmes garanties que la fonction SQL."""
+    def __init__(self, balances=None):
+        self.balances = dict(balances or {})
+        self._lock = threading.Lock()
+
+    def balance(self, email):
+        with self._lock: return self.balances.get(email, 0)
+
+    def debit(self, email, amount):
+        with self._lock:
+            cur = self.balances.get(email, 0)
+            if cur < amount: return None
+            self.balances[email] = cur - amount
+            return self.balances[email]
+
+
+class SupabaseLedgerBackend:
+    """Utilise la fonction `consume_credits` (voir sql/consume_credits.sql)."""
+    def __init__(self, client):
+        self.client = client
+
+    def balance(self, email):
+        res = self.client.table("users").select("credits").eq("email", email).execute()
+        return res.data[0]["credits"] if res.data else 0
+
+    def debit(self, email, amount):
+        res = self.client.rpc("consume_credits", {"p_email": email, "p_amount": amount}).execute()
+        data = res.data
+        if isinstance(data, list): data = data[0] if data else None
+        if isinstance(data, dict): data = next(iter(data.values()), None)
+        return data
+
+
+class PostgresLedgerBackend:
+    """Postgres direct (instance locale de test), même requête conditionnelle que la fonction SQL."""
+    def __init__(self, dsn):
+        import psycopg  # optionnel : uniquement pour ce backend
+        self._conn = psycopg.connect(dsn, autocommit=True)
+        self._lock = threading.Lock()
+
+    def balance(self, email):
+        with self._lock:
+            row = self._conn.execute("SELECT credits FROM users WHERE email = %s", (email,)).fetchone()
+        return row[0] if row else 0
+
+    def debit(self, email, amount):
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE users SET credits = credits - %s WHERE email = %s AND credits >= %s RETURNING credits",
+                (amount, email, amount),
+            ).fetchone()
+        return row[0] if row else None
+
+# ==========================================
+# 2. REGISTRE
+# ==========================================
+
+class CreditLedger:
+    def __init__(self, backend, balance_ttl: float = 30, flush_interval: float = 0.5,
+                 max_attempts: int = 6, base_backoff: float = 0.5):
+        self.backend = backend
+        self.balance_ttl = balance_ttl
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self._cv = threading.Condition()
+        self._balances = {}                 # email -> (solde serveur, horodatage)
+        self._pending = defaultdict(int)    # débits réservés, pas encore envoyés
+        self._inflight = defaultdict(int)   # débits en cours d'envoi
+        self._retry = []                    # [(email, montant, tentatives, prochain_essai)]
+        self.counters = defaultdict(int)
+        self._worker = threading.Thread(target=self._run, name="credit-ledger", daemon=True)
+        self._worker.start()
+
+    # --- Lecture ---
+    def seed(self, email, credits):
+        """Renseigne le solde connu (ex: ligne renvoyée par le login) sans aller-retour."""
+        with self._cv: self._balances[email] = (credits, time.monotonic())
+
+    def invalidate(self, email):
+        with self._cv: self._balances.pop(email, None)
+
+    def balance(self, email) -> int:
+        """Solde disponible = solde serveur (en cache) - débits pas encore confirmés."""
+        with self._cv:
+            cached = self._balances.get(email)
+            if cached and time.monotonic() - cached[1] < self.balance_ttl:
+                return max(0, cached[0] - self._reserved(email))
+        server = self.backend.balance(email)
+        self.counters["balance_reads"] += 1
+        with self._cv:
+            self._balances[email] = (server, time.monotonic())
+            return max(0, server - self._reserved(email))
+
+    def _reserved(self, email):
+        queued = sum(r[1] for r in self._retry if r[0] == email)
+        return self._pending[email] + self._inflight[email] + queued
+
+    # --- Écriture ---
+    def debit(self, email, amount: int = 1) -> bool:
+        """Réserve le débit et rend la main immédiatement. False si le solde est insuffisant."""
+        self.balance(email)  # rafraîchit le cache si besoin, hors verrou
+        with self._cv:
+            server = self._balances.get(email, (0, 0))[0]
+            if server - self._reserved(email) < amount:
+                self.counters["refused"] += 1
+                return False
+            self._pending[email] += amount
+            self.counters["debits"] += 1
+            self._cv.notify()
+        return True
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Attend que tous les débits soient confirmés (tests, arrêt propre)."""
+        deadline = time.monotonic() + timeout
+        with self._cv:
+            self._cv.notify()
+            while self._pending or self._inflight or self._retry:
+                left = deadline - time.monotonic()
+                if left <= 0: return False
+                self._cv.wait(min(left, self.flush_interval))
+        return True
+
+    def stats(self) -> dict:
+        with self._cv:
+            return dict(self.counters, pending=sum(self._pending.values()), retry_queue=len(self._retry))
+
+    # --- Tâche de fond ---
+    def _take_batch(self):
+        now = time.monotonic()
+        batch = defaultdict(lambda: [0, 0])  # email -> [montant, tentatives]
+        for email, amount in self._pending.items():
+            batch[email][0] += amount
+        self._pending.clear()
+        keep = []
+        for email, amount, attempts, next_at in self._retry:
+            if next_at <= now:
+                batch[email][0] += amount
+                batch[email][1] = max(batch[email][1], attempts)
+            else:
+                keep.append((email, amount, attempts, next_at))
+        self._retry = keep
+        for email, (amount, _) in batch.items():
+            self._inflight[email] += amount
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cv:
+                self._cv.wait(self.flush_interval)
+                batch = self._take_batch()
+            for email, (amount, attempts) in batch.items():
+                self._send(email, amount, attempts)
+
+    def _send(self, email, amount, attempts):
+        # Lot refusé (débit concurrent ailleurs) : on débite ce que le solde réel permet encore,
+        # seul le reste est perdu, pas tout le lot
+        left, ask, new_balance, error = amount, amount, None, None
+        try:
+            for _ in range(3):
+                res = self.backend.debit(email, ask)
+                if res is not None: left, new_balance = left - ask, res
+                if not left: break
+                ask = min(left, self.backend.balance(email))
+                if ask <= 0: break
+        except Exception as e:
+            error = e
+        with self._cv:
+            self._inflight[email] -= amount
+            if not self._inflight[email]: del self._inflight[email]
+            if new_balance is not None: self._balances[email] = (new_balance, time.monotonic())
+            self.counters["flushed"] += amount - left
+            if error is not None:
+                attempts += 1
+                if attempts < self.max_attempts:
+                    delay = self.base_backoff * (2 ** attempts) * (0.5 + random.random())
+                    self._retry.append((email, left, attempts, time.monotonic() + delay))
+                    self.counters["retries"] += 1
+                else:
+                    self.counters["dropped"] += 1
+                    log.error("Débit abandonné pour %s (%s crédits) : %s", email, left, error)
+            elif left:
+                self._balances.pop(email, None)  # on relira le vrai solde
+                self.counters["rejected"] += left
+                log.warning("Débit refusé par le serveur pour %s (%s crédits sur %s)", email, left, amount)
+            self._cv.notify_all()
@@ -0,0 +1,57 @@
+"""
+Cache (par session) des artefacts dérivés du projet : texte nettoyé, lien de formulaire, exports...
+Un artefact est recalculé seulement quand ses sources changent : la clé est le nom de l'artefact
+et le tuple des sources. Les chaînes Python gardent leur hash en mémoire et la comparaison commence
+par l'identité, donc un rerun où rien n'a bougé coûte quelques comparaisons, pas un parcours du texte.
+Une seule version par artefact (l'ancienne est remplacée) et un plafond en octets par session.
+"""
+from collections import OrderedDict
+
+
+def _size(value) -> int:
+    return len(value) if isinstance(value, (str, bytes)) else 0
+
+
+class DerivedCache:
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # nom -> (sources, valeur)
+        self._bytes = 0
+        self.counters = {"hits": 0, "builds": 0, "evictions": 0}
+
+    def get(self, name: str, sources: tuple, build=None):
+        """Valeur de `name` pour ces sources ; la calcule avec `build()` si besoin (None si pas de `build`)."""
+        cached = self._items.get(name)
+        if cached is not None and cached[0] == sources:
+            self._items.move_to_end(name)
+            self.counters["hits"] += 1
+            return cached[1]
+        if build is None: return None
+        value = build()
+        self.put(name, sources, value)
+        return value
+
+    def put(self, name: str, sources: tuple, value):
+        self.discard(name)
+        self._items[name] = (sources, value)
+        self._bytes += _size(value)
+        self.counters["builds"] += 1
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            oldest = next(iter(self._items))
+            self.discard(oldest)
+            self.counters["evictions"] += 1
+
+    def discard(self, name: str):
+        cached = self._items.pop(name, None)
+        if cached is not None: self._bytes -= _size(cached[1])
+
+    def clear(self):
+        """Tout libérer (budget mémoire de la session dépassé, voir session_memory) : recalculé au besoin."""
+        self._items.clear()
+        self._bytes = 0
+
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict:
+        return {**self.counters, "entries": len(self._items), "bytes": self._bytes}
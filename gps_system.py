@@ -0,0 +1,419 @@
+"""
+Moteur IA-BrainStormer GPS : prompts système, appels OpenAI et enchaînement des phases.
+Séparé de l'UI (ancien_app.py) pour être réutilisable hors Streamlit.
+"""
+import asyncio
+import inspect
+import logging
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from llm_json import (parse_json, validate, plan_fixups, apply_fixup, IncrementalParser,
+                      FIXUP_SYSTEM_PROMPT)
+from llm_provider import LLMError
+from model_router import router
+from resources import get_openai_llm
+from singleflight import flights, flight_key
+from tracing import span, traced
+from token_budget import BUDGETS, fit, output_cap, trim
+
+log = logging.getLogger(__name__)
+
+# ==========================================
+# 0. OUTILS DE NETTOYAGE
+# ==========================================
+
+@traced("parse_json")
+def clean_json_response(raw_content):
+    # Réparations locales uniquement (voir llm_json) ; la correction par le modèle est dans finalize()
+    return parse_json(raw_content)
+
+# ==========================================
+# 1. PROMPTS SYSTÈME
+# ==========================================
+
+SYSTEM_PROMPT_CRASH_TEST = """Tu es un Auditeur Stratégique ("Devil's Advocate").
+Analyse l'idée selon D.U.R. (Douloureux, Urgent, Reconnu).
+FORMAT JSON STRICT :
+{
+  "score_D": 0, "score_U": 0, "score_R": 0, "total": 0,
+  "verdict": "VERT ou ROUGE",
+  "analyse_critique": "Phrase courte",
+  "conseil_architecte": "Action concrète"
+}"""
+
+# Phase G en éclats : une requête courte par famille d'angles, lancées en parallèle (10 angles au total)
+ANGLE_FAMILIES = [
+    ("Cibles & marchés", "nouveaux segments de clients, niches, géographies", 3),
+    ("Offre & modèle économique", "produit, service, prix, abonnement, packaging", 3),
+    ("Canaux & partenariats", "acquisition, distribution, alliances, communauté", 2),
+    ("Technologie & différenciation", "automatisation, données, IA, barrière à l'entrée", 2),
+]
+
+SYSTEM_PROMPT_PHASE_G_SHARD = """Génère {n} angles stratégiques uniques, tous de la famille « {famille} » ({exemples}).
+Titre : 6 mots max. Cible et opportunité : une phrase courte chacune.
+FORMAT JSON STRICT :
+{{ "angles": [ {{"id": 1, "titre": "Titre court", "cible_precise": "...", "opportunite": "..."}} ] }}"""
+
+PHASE_G_SHARDS = [SYSTEM_PROMPT_PHASE_G_SHARD.format(n=n, famille=f, exemples=e) for f, e, n in ANGLE_FAMILIES]
+
+SYSTEM_PROMPT_PHASE_P = """Tu es Expert Stratège. Utilise la Matrice de Conviction.
+On te donne 3 options numérotées 1, 2 et 3.
+FORMAT JSON STRICT :
+{
+  "evaluations": [
+    { "id_option": 1, "score_douleur": 0, "score_unicite": 0, "score_alignement": 0, "score_total_pondere": 0 },
+    { "id_option": 2, ... }, { "id_option": 3, ... }
+  ],
+  "recommandation": { "id_gagnant": 1, "raison": "Explication courte" }
+}"""
+
+SYSTEM_PROMPT_PHASE_S = """Backcasting de J+7 à J+1.
+Chaque détail d'exécution : 2 phrases max.
+FORMAT JSON STRICT :
+{ "resultat_j7": "...", "etapes_journalieres": [ {"jour": "J+7", "action_principale": "...", "detail_execution": "..."} ] }"""
+
+# Schémas des formats ci-dessus (voir llm_json.validate)
+SCHEMA_CRASH_TEST = {"fields": {"score_D": "number", "score_U": "number", "score_R": "number", "total": "number",
+                                "verdict": "string", "analyse_critique": "string", "conseil_architecte": "string"}}
+SCHEMA_PHASE_G = {"fields": {"angles": "array"},
+                  "items": ("angles", {"id": "number", "titre": "string", "cible_precise": "string", "opportunite": "string"})}
+SCHEMA_PHASE_P = {"fields": {"evaluations": "array", "recommandation": "object"},
+                  "items": ("evaluations", {"id_option": "number", "score_total_pondere": "number"})}
+SCHEMA_PHASE_S = {"fields": {"resultat_j7": "string", "etapes_journalieres": "array"},
+                  "items": ("etapes_journalieres", {"jour": "string", "action_principale": "string"})}
+
+SCHEMAS = {
+    SYSTEM_PROMPT_CRASH_TEST: SCHEMA_CRASH_TEST,
+    **{shard: SCHEMA_PHASE_G for shard in PHASE_G_SHARDS},
+    SYSTEM_PROMPT_PHASE_P: SCHEMA_PHASE_P,
+    SYSTEM_PROMPT_PHASE_S: SCHEMA_PHASE_S,
+}
+
+# Nom de phase de chaque prompt : budget de tokens (token_budget.BUDGETS) et relevé d'usage
+PHASES = {
+    SYSTEM_PROMPT_CRASH_TEST: "crash_test", **{shard: "phase_g" for shard in PHASE_G_SHARDS},
+    SYSTEM_PROMPT_PHASE_P: "phase_p", SYSTEM_PROMPT_PHASE_S: "phase_s", FIXUP_SYSTEM_PROMPT: "fixup",
+}
+
+AUTO = "auto"  # modèle choisi par phase (model_router.DEFAULT_ROUTES), descendu d'un cran si le SLO est dépassé
+
+# ==========================================
+# 2. MÉCANIQUE API
+# ==========================================
+
+def options_message(angles):
+    # Chaque option reçoit une part égale du budget : aucune n'est coupée au profit des autres
+    share = BUDGETS["phase_p"][0] // max(1, len(angles))
+    txt = ""
+    for index, a in enumerate(angles):
+        txt += f"OPTION {index + 1} : " + trim(f"{a['titre']} ({a['cible_precise']})", share) + "\n"
+    return f"Classe ces 3 options :\n{txt}"
+
+def error_result(e, raw=None) -> dict:
+    res = {"error": True, "message": str(e), "retryable": bool(getattr(e, "retryable", False))}
+    if raw: res["raw"] = raw
+    return res
+
+def tag_model(data, model):
+    """Garde dans le résultat (`_model`) le modèle qui l'a réellement produit."""
+    if isinstance(data, dict) and not data.get("error"): data["_model"] = model
+    return data
+
+# --- Fusion des éclats de la Phase G ---
+SHARD_ATTEMPTS = 2      # un éclat en échec est relancé seul, les autres gardent leur résultat
+NEAR_DUPLICATE = 0.8    # part de mots communs (titre + cible) à partir de laquelle deux angles sont le même
+MIN_ANGLES = 3          # la sélection de la Phase P en demande 3 : la fusion ne descend jamais en dessous
+
+def title_key(titre) -> str:
+    """Titre comparable : sans accents, casse ni ponctuation."""
+    t = unicodedata.normalize("NFKD", str(titre or "")).encode("ascii", "ignore").decode().lower()
+    return " ".join(re.findall(r"[a-z0-9]+", t))
+
+def angle_words(angle) -> frozenset:
+    """Mots du titre et de la cible : « B2B » / « B2C » ou « courte » / « longue durée » restent distincts."""
+    return frozenset(f"{title_key(angle.get('titre'))} {title_key(angle.get('cible_precise'))}".split())
+
+def same_angle(a: frozenset, b: frozenset) -> bool:
+    return a == b or len(a & b) / max(1, len(a | b)) >= NEAR_DUPLICATE
+
+
+class AngleMerger:
+    """Fusionne les angles au fil des éclats : doublons (mêmes mots, à la forme près) écartés, ids renumérotés (1..n).
+    `on_item(angle)` est appelé pour chaque angle retenu, dès qu'il arrive (add_item, en flux) ou avec son éclat."""
+    def __init__(self, on_item=None):
+        self.angles, self._words, self._held = [], [], []
+        self._streamed = set()  # angles déjà reçus en flux : pas repris (ni comptés doublons) avec l'éclat complet
+        self.on_item = on_item
+        self._lock = threading.Lock()
+
+    @property
+    def dropped(self): return len(self._held)
+
+    def _keep(self, a):
+        self.angles.append({**a, "id": len(self.angles) + 1})
+        if self.on_item: self.on_item(self.angles[-1])
+
+    def _add(self, a):
+        words = angle_words(a)
+        if not words: return
+        if any(same_angle(words, w) for w in self._words):
+            self._held.append(a)  # repris si la fusion finit sous MIN_ANGLES
+            return
+        self._words.append(words)
+        self._keep(a)
+
+    def add_item(self, a: dict):
+        """Un angle complet lu dans le flux d'un éclat (voir GPSSystem.stream_gpt)."""
+        with self._lock:
+            self._streamed.add(angle_words(a))
+            self._add(a)
+
+    def add_shard(self, res: dict):
+        if res.get("error"): return
+        with self._lock:
+            for a in res.get("angles", []):
+                if angle_words(a) not in self._streamed: self._add(a)
+
+    def result(self, shards: list) -> dict:
+        """Résultat de la phase : erreur seulement si aucun éclat n'a abouti."""
+        ok = [r for r in shards if not r.get("error")]
+        with self._lock:
+            while len(self.angles) < MIN_ANGLES and self._held: self._keep(self._held.pop(0))
+        if not ok or not self.angles: return next((r for r in shards if r.get("error")), {"error": True, "raw": ""})
+        res = {"angles": list(self.angles), "_model": ok[0].get("_model")}
+        if len(ok) < len(shards): res["_shards_failed"] = len(shards) - len(ok)
+        return res
+
+
+class _Routed:
+    """Client par phase : modèle fixe (`llm` fourni ou modèle explicite) ou routé selon la latence (model='auto')."""
+    def __init__(self, api_key: str, model: str = AUTO, fallback: str = "gpt-4o-mini", base_url: str = None, llm=None):
+        # Délais, reprises, disjoncteur et repli : voir llm_provider.py ; routage : voir model_router.py
+        self.api_key, self.base_url, self.fallback = api_key, base_url, fallback
+        self.llm = llm  # sinon construit au premier appel : le SDK OpenAI n'est pas importé avant
+        self.model = llm.model if llm else model
+        self.scope = f"{base_url}|{api_key}"  # regroupement des appels identiques limité à une même clé
+
+    def _route(self, phase):
+        """(client, modèle) pour la phase."""
+        if self.llm is not None: return self.llm, self.model
+        if self.model != AUTO:
+            self.llm = get_openai_llm(self.api_key, self.model, self.fallback, self.base_url)
+            return self.llm, self.model
+        model, fallback = router.choose(phase, "gpt-4o")
+        return get_openai_llm(self.api_key, model, fallback, self.base_url), model
+
+
+class GPSSystem(_Routed):
+    def _complete(self, system_prompt: str, user_message: str):
+        phase = PHASES.get(system_prompt)
+        llm, model = self._route(phase)
+        user_message = fit(phase, user_message, model)
+        key = flight_key(model, system_prompt, user_message, scope=self.scope)
+        res, _ = flights.do(key, lambda: llm.generate(user_message, system=system_prompt, json_mode=True,
+                                                      max_tokens=output_cap(phase), phase=phase))
+        return res
+
+    def call_gpt(self, system_prompt: str, user_message: str) -> dict:
+        try:
+            with span("openai.call_gpt", model=self.model):
+                res = self._complete(system_prompt, user_message)
+            return tag_model(self.finalize(system_prompt, res.text), res.model)
+        except LLMError as e:
+            return error_result(e)
+        except Exception as e:  # erreur du SDK non classée : carte d'erreur plutôt qu'une page cassée
+            log.exception("call_gpt : erreur inattendue")
+            return error_result(e)
+
+    def stream_gpt(self, system_prompt: str, user_message: str, on_item) -> dict:
+        """Comme call_gpt, mais appelle `on_item(objet)` dès qu'un élément de la liste du schéma est complet."""
+        key, fields = SCHEMAS[system_prompt]["items"]
+        parser = IncrementalParser(key, fields)
+        raw, stream = "", None
+        try:
+            with span("openai.call_gpt", model=self.model, stream=True):
+                phase = PHASES.get(system_prompt)
+                llm, model = self._route(phase)
+                stream = llm.stream(fit(phase, user_message, model), system=system_prompt, json_mode=True,
+                                    max_tokens=output_cap(phase), phase=phase)
+                for delta in stream:
+                    raw += delta
+                    for item in parser.feed(delta): on_item(item)
+            return tag_model(self.finalize(system_prompt, raw), stream.model)
+        except LLMError as e:
+            return error_result(e, raw)
+        except Exception as e:
+            log.exception("stream_gpt : erreur inattendue")
+            return error_result(e, raw)
+        finally:
+            if stream is not None: stream.close()  # flux abandonné (on_item en échec...) : disjoncteur libéré
+
+    def finalize(self, system_prompt: str, raw: str) -> dict:
+        """Parse + valide ; ce qui reste cassé est corrigé par le modèle, morceau par morceau."""
+        data = clean_json_response(raw)
+        schema = SCHEMAS.get(system_prompt)
+        if schema is None: return data if data else {"error": True, "raw": raw}
+        errors = []
+        if data is not None:
+            data, errors = validate(data, schema)
+            if not errors: return data
+        for fixup in plan_fixups(data, errors, schema, raw):
+            try:
+                with span("openai.fixup", target=fixup.target[0]):
+                    repaired = clean_json_response(self._complete(FIXUP_SYSTEM_PROMPT, fixup.message).text)
+            except LLMError:
+                continue  # on garde ce qui est déjà valide
+            data = apply_fixup(data, fixup, repaired, schema)
+        if data is None: return {"error": True, "raw": raw}
+        return validate(data, schema)[0]
+
+    @traced("crash_test")
+    def crash_test_dur(self, idee): return self.call_gpt(SYSTEM_PROMPT_CRASH_TEST, f"Idée: {idee}")
+    @traced("phase_g")
+    def phase_g_generation(self, idee, on_item=None):
+        """Un éclat par famille d'angles (ANGLE_FAMILIES), en parallèle. Avec `on_item(angle)`, chaque éclat est lu
+        en flux et chaque angle publié dès qu'il est complet (llm_json.IncrementalParser)."""
+        merger = AngleMerger(on_item)
+        def shard(system):
+            for _ in range(SHARD_ATTEMPTS):
+                with span("phase_g.shard", family=PHASE_G_SHARDS.index(system)):
+                    if on_item is None: res = self.call_gpt(system, f"Idée validée: {idee}")
+                    else: res = self.stream_gpt(system, f"Idée validée: {idee}", merger.add_item)
+                if not res.get("error") and res.get("angles"): break
+            merger.add_shard(res)
+            return res
+        with ThreadPoolExecutor(max_workers=len(PHASE_G_SHARDS), thread_name_prefix="phase-g") as pool:
+            return merger.result(list(pool.map(shard, PHASE_G_SHARDS)))
+    @traced("phase_p")
+    def phase_p_priorisation(self, angles): return self.call_gpt(SYSTEM_PROMPT_PHASE_P, options_message(angles))
+    @traced("phase_s")
+    def phase_s_sequencage(self, angle): return self.call_gpt(SYSTEM_PROMPT_PHASE_S, f"Plan pour: {angle.get('titre')}")
+
+# ==========================================
+# 3. MODE CONCURRENT (ASYNC)
+# ==========================================
+
+class AsyncGPSSystem(_Routed):
+    """Même API que GPSSystem, en coroutines : plusieurs appels peuvent tourner en parallèle."""
+    async def _complete(self, system_prompt: str, user_message: str):
+        phase = PHASES.get(system_prompt)
+        llm, model = self._route(phase)
+        user_message = fit(phase, user_message, model)
+        key = flight_key(model, system_prompt, user_message, scope=self.scope)
+        res, _ = await flights.ado(key, lambda: llm.agenerate(user_message, system=system_prompt, json_mode=True,
+                                                              max_tokens=output_cap(phase), phase=phase))
+        return res
+
+    async def call_gpt(self, system_prompt: str, user_message: str) -> dict:
+        try:
+            with span("openai.call_gpt", model=self.model, mode="async"):
+                res = await self._complete(system_prompt, user_message)
+            return tag_model(await self.finalize(system_prompt, res.text), res.model)
+        except LLMError as e:
+            return error_result(e)
+        except Exception as e:
+            log.exception("call_gpt (async) : erreur inattendue")
+            return error_result(e)
+
+    async def finalize(self, system_prompt: str, raw: str) -> dict:
+        """Comme GPSSystem.finalize, les corrections ciblées partant en parallèle."""
+        data = clean_json_response(raw)
+        schema = SCHEMAS.get(system_prompt)
+        if schema is None: return data if data else {"error": True, "raw": raw}
+        errors = []
+        if data is not None:
+            data, errors = validate(data, schema)
+            if not errors: return data
+        fixups = plan_fixups(data, errors, schema, raw)
+        with span("openai.fixup", count=len(fixups), mode="async"):
+            repaired = await asyncio.gather(*(self._complete(FIXUP_SYSTEM_PROMPT, f.message) for f in fixups),
+                                            return_exceptions=True)
+        for fixup, content in zip(fixups, repaired):
+            if isinstance(content, BaseException): continue
+            data = apply_fixup(data, fixup, clean_json_response(content.text), schema)
+        if data is None: return {"error": True, "raw": raw}
+        return validate(data, schema)[0]
+
+    async def crash_test_dur(self, idee): return await self.call_gpt(SYSTEM_PROMPT_CRASH_TEST, f"Idée: {idee}")
+    async def phase_g_generation(self, idee):
+        merger = AngleMerger()
+        async def shard(system):
+            for _ in range(SHARD_ATTEMPTS):
+                res = await self.call_gpt(system, f"Idée validée: {idee}")
+                if not res.get("error") and res.get("angles"): break
+            merger.add_shard(res)
+            return res
+        return merger.result(await asyncio.gather(*(shard(s) for s in PHASE_G_SHARDS)))
+    async def phase_p_priorisation(self, angles): return await self.call_gpt(SYSTEM_PROMPT_PHASE_P, options_message(angles))
+    async def phase_s_sequencage(self, angle): return await self.call_gpt(SYSTEM_PROMPT_PHASE_S, f"Plan pour: {angle.get('titre')}")
+
+
+class PhaseError(Exception):
+    def __init__(self, phase, result):
+        super().__init__(f"{phase}: {result}")
+        self.phase = phase
+        self.result = result
+
+
+def auto_select_angles(phase_g_result):
+    """Choix automatique (mode sans intervention) : les 3 premiers angles."""
+    return phase_g_result.get("angles", [])[:3]
+
+def auto_choose_angle(phase_p_result, angles):
+    """Choix automatique : l'option recommandée par la Phase P."""
+    idx = phase_p_result.get("recommandation", {}).get("id_gagnant", 1) - 1
+    return angles[idx] if 0 <= idx < len(angles) else angles[0]
+
+# Graphe des phases : clé produite -> (dépendances, fonction(gps, *deps)).
+# Les clés sont celles de st.session_state dans ancien_app.py ; les étapes humaines
+# (reformulation, sélection, choix final) ont une valeur par défaut automatique,
+# remplacée dès que la clé est fournie dans le contexte.
+PHASE_GRAPH = {
+    "crash_test_result":   (("idee_initiale",), lambda gps, idee: gps.crash_test_dur(idee)),
+    "idee_validee":        (("idee_initiale",), lambda gps, idee: idee),
+    "phase_g_result":      (("idee_validee",), lambda gps, idee: gps.phase_g_generation(idee)),
+    "angles_selectionnes": (("phase_g_result",), lambda gps, res: auto_select_angles(res)),
+    "phase_p_result":      (("angles_selectionnes",), lambda gps, angles: gps.phase_p_priorisation(angles)),
+    "angle_choisi":        (("phase_p_result", "angles_selectionnes"), lambda gps, res, angles: auto_choose_angle(res, angles)),
+    "phase_s_result":      (("angle_choisi",), lambda gps, angle: gps.phase_s_sequencage(angle)),
+}
+
+
+async def run_graph(gps: AsyncGPSSystem, context: dict, targets, graph: dict = PHASE_GRAPH) -> dict:
+    """Calcule `targets` en lançant chaque phase dès que ses vraies dépendances sont prêtes.
+    Ex: crash test et Phase G démarrent ensemble, la Phase G n'attend pas le score."""
+    ctx = dict(context)
+    tasks = {}
+
+    async def resolve(key):
+        if key in ctx: return ctx[key]
+        if key not in tasks: tasks[key] = asyncio.ensure_future(run(key))
+        return await tasks[key]
+
+    async def run(key):
+        deps, fn = graph[key]
+        args = await asyncio.gather(*(resolve(d) for d in deps))
+        with span(f"graph.{key}"):
+            result = fn(gps, *args)
+            if inspect.isawaitable(result): result = await result
+        if isinstance(result, dict) and result.get("error"): raise PhaseError(key, result)
+        ctx[key] = result
+        return result
+
+    try:
+        await asyncio.gather(*(resolve(t) for t in targets))
+    finally:
+        for t in tasks.values():
+            if not t.done(): t.cancel()
+    return ctx
+
+
+PIPELINE_TARGETS = ("crash_test_result", "phase_s_result")
+
+def run_pipeline(gps: AsyncGPSSystem, idee: str, loop) -> dict:
+    """Parcours complet crash test + G -> P -> S sans intervention (bouton du mode concurrent d'ancien_app).
+    `loop` : la boucle permanente (resources.get_background_loop), celle des clients async en cache ;
+    jamais asyncio.run, dont la boucle fermée après l'appel rendrait ces clients inutilisables."""
+    return loop.submit(run_graph(gps, {"idee_initiale": idee}, PIPELINE_TARGETS)).result()
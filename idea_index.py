@@ -0,0 +1,290 @@
+"""
+Index local des idées déjà traitées : une reformulation d'une idée connue retrouve son analyse / son crash test.
+Le cache IA (llm_cache) ne sert que la même saisie au mot près ; ici on compare le texte lui-même.
+- Vecteur d'une idée : n-grammes de caractères hachés (signe compris) dans DIM cases, normé : cosinus = produit scalaire.
+- Recherche : produit matrice-vecteur, top-k par argpartition (NumPy, sans dépendance ML). Au-delà de EXACT_MAX
+  entrées, une empreinte de 128 bits par idée (SimHash : signes de projections aléatoires) présélectionne les
+  CANDIDATES plus proches en distance de Hamming, rescorés exactement : < 10 ms pour quelques centaines de milliers.
+- Stockage dans un dossier : vecteurs, empreintes et positions en fichiers mappés en mémoire (np.memmap, agrandis
+  par blocs), entrées (idée, résultat, modèle) en JSONL, lues seulement pour les k meilleurs.
+
+    python idea_index.py build batch_crash_test.parquet.checkpoint.jsonl --kind crash_test
+    python idea_index.py search "Une appli qui aide les PME à ..." --kind analysis --owner moi@example.com
+
+Un index par type de résultat (analysis : beta_app.py, crash_test : ancien_app.py / batch.py) et par propriétaire
+(OwnerIndexes) : une idée et son résultat ne sont jamais proposés qu'à celui qui les a soumis.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+from tracing import span
+
+DIM = 256               # cases de hachage : 256 Ko de vecteurs pour 1 000 idées
+NGRAMS = (3, 4)         # tailles des n-grammes de caractères
+MAX_CHARS = 2000        # au-delà, le début de l'idée suffit à la reconnaître
+DUPLICATE = 0.995       # même idée (à la forme près) : pas de nouvelle entrée
+GROW = 4096             # agrandissement minimal des fichiers mappés (lignes)
+OWNER_GROW = 64         # idem pour l'index d'un propriétaire (quelques dizaines d'idées)
+SKETCH_BITS = 128       # empreinte SimHash : 2 x uint64 par idée
+EXACT_MAX = 50_000      # jusque-là, balayage exact de tous les vecteurs
+CANDIDATES = 1024       # au-delà, candidats présélectionnés par empreinte puis rescorés
+DEFAULT_DIR = os.path.join(".cache", "ideas")
+
+# ==========================================
+# 1. VECTEURS
+# ==========================================
+
+def normalize_idea(text) -> str:
+    """Sans accents, casse ni ponctuation, espaces compactés."""
+    t = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode().casefold()
+    return " ".join(re.findall(r"[a-z0-9]+", t))[:MAX_CHARS]
+
+
+def vectorize(texts, dim: int = DIM) -> np.ndarray:
+    """(len(texts), dim) float32, lignes normées (une ligne nulle pour un texte vide)."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        t = f" {normalize_idea(text)} "
+        h = np.fromiter((zlib.crc32(t[i:i + n].encode()) for n in NGRAMS for i in range(len(t) - n + 1)),
+                        dtype=np.uint32)
+        if h.size: np.add.at(out[row], h % dim, np.where(h & 0x80000000, -1.0, 1.0).astype(np.float32))
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.maximum(norms, 1e-12)
+
+
+@functools.lru_cache(maxsize=4)
+def _planes(dim: int) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((dim, SKETCH_BITS)).astype(np.float32)  # graine fixe : fichiers stables
+
+
+def sketch(vectors: np.ndarray) -> np.ndarray:
+    """(n, 2) uint64 : bits d'empreinte ; bits différents / 128 ≈ angle / π entre deux idées."""
+    bits = np.packbits(vectors @ _planes(vectors.shape[1]) > 0, axis=1)
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+# ==========================================
+# 2. INDEX
+# ==========================================
+
+class IdeaIndex:
+    def __init__(self, path: str = os.path.join(DEFAULT_DIR, "analysis"), dim: int = DIM, grow: int = GROW):
+        os.makedirs(path, exist_ok=True)
+        self.path, self.grow = path, grow
+        meta = self._read_meta() or {"dim": dim, "count": 0}
+        if meta["dim"] != dim: raise ValueError(f"{path} : index en dimension {meta['dim']}, pas {dim}")
+        self.dim, self.count = dim, meta["count"]
+        self._lock = threading.Lock()
+        self._open(max(grow, self.count))
+        self.counters = {"lookups": 0, "hits": 0, "added": 0, "duplicates": 0}
+
+    # --- Fichiers ---
+    def _file(self, name): return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json"), encoding="utf-8") as fh: return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh: json.dump({"dim": self.dim, "count": self.count}, fh)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _map(self, name, dtype, shape):
+        path, size = self._file(name), int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as fh:
+            if fh.tell() < size: fh.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open(self, rows):
+        offsets = self._file("offsets.i64")
+        if os.path.exists(offsets): rows = max(rows, os.path.getsize(offsets) // 8)
+        self._vectors = self._map("vectors.f32", np.float32, (rows, self.dim))
+        self._sketches = self._map("sketches.u64", np.uint64, (rows, SKETCH_BITS // 64))
+        self._offsets = self._map("offsets.i64", np.int64, (rows,))
+
+    def _reserve(self, n):
+        capacity = len(self._offsets)
+        if self.count + n <= capacity: return
+        self._flush()
+        # Les recherches en cours gardent l'ancienne vue : elle reste valide, le fichier ne fait que grandir
+        self._open(max(2 * capacity, self.count + n, self.grow))
+
+    def _flush(self):
+        for m in (self._vectors, self._sketches, self._offsets): m.flush()
+
+    def _entry(self, row) -> dict:
+        with open(self._file("entries.jsonl"), "rb") as fh:
+            fh.seek(int(self._offsets[row]))
+            return json.loads(fh.readline())
+
+    # --- Écriture ---
+    def add_many(self, rows, dedupe: bool = True) -> int:
+        """`rows` : dicts avec au moins `idea` et `result` ; renvoie le nombre d'entrées ajoutées.
+        `dedupe=False` (construction en masse, entrées déjà uniques) évite une recherche par ligne."""
+        rows = [r for r in rows if normalize_idea(r.get("idea"))]
+        if not rows: return 0
+        vectors = vectorize([r["idea"] for r in rows], self.dim)
+        sketches = sketch(vectors)
+        added = 0
+        with self._lock, open(self._file("entries.jsonl"), "ab") as fh:
+            for row, vector, bits in zip(rows, vectors, sketches):
+                n = self.count
+                if dedupe and n and self._scores(vector, bits, n)[1].max() >= DUPLICATE:
+                    self.counters["duplicates"] += 1
+                    continue
+                self._reserve(1)
+                self._offsets[n] = fh.tell()
+                fh.write((json.dumps({"created_at": time.time(), **row}, ensure_ascii=False) + "\n").encode("utf-8"))
+                self._vectors[n], self._sketches[n] = vector, bits
+                self.count = n + 1  # visible des recherches une fois la ligne écrite
+                added += 1
+            fh.flush()
+            self._flush()
+            self._write_meta()
+            self.counters["added"] += added
+        return added
+
+    def add(self, idea: str, result, **meta) -> bool:
+        """Enregistre un résultat ; une idée déjà présente (à la forme près) n'est pas dupliquée."""
+        return self.add_many([{"idea": idea, "result": result, **meta}]) == 1
+
+    # --- Recherche ---
+    def _scores(self, vector, bits, n):
+        """(lignes, scores cosinus) : toutes les lignes, ou les candidats les plus proches par empreinte."""
+        vectors, sketches = self._vectors, self._sketches  # vues du moment (voir _reserve)
+        if n <= EXACT_MAX: return np.arange(n), vectors[:n] @ vector
+        distances = sum(np.bitwise_count(sketches[:n, j] ^ bits[j]) for j in range(len(bits)))  # uint8, 0..128
+        # Distance de coupure par histogramme (plus rapide qu'argpartition) : au moins CANDIDATES lignes
+        cutoff = int(np.searchsorted(np.cumsum(np.bincount(distances, minlength=SKETCH_BITS + 1)), CANDIDATES))
+        rows = np.flatnonzero(distances <= cutoff)
+        return rows, vectors[rows] @ vector
+
+    def search(self, text: str, k: int = 5, threshold: float = 0.0) -> list:
+        """Les k idées les plus proches (score cosinus décroissant, au moins `threshold`), avec leur résultat."""
+        n = self.count
+        if not n or not normalize_idea(text): return []
+        vector = vectorize([text], self.dim)
+        with span("ideas.search", entries=n):
+            rows, scores = self._scores(vector[0], sketch(vector)[0], n)
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        return [{**self._entry(rows[i]), "score": round(float(scores[i]), 4)} for i in top if scores[i] >= threshold]
+
+    def best(self, text: str, threshold: float = 0.9):
+        """L'idée la plus proche si elle dépasse `threshold`, sinon None."""
+        matches = self.search(text, k=1, threshold=threshold)
+        with self._lock:
+            self.counters["lookups"] += 1
+            if matches: self.counters["hits"] += 1
+        return matches[0] if matches else None
+
+    def stats(self) -> dict:
+        with self._lock: counters = dict(self.counters)
+        return {"entries": self.count, **counters,
+                "hit_rate": counters["hits"] / counters["lookups"] if counters["lookups"] else 0.0,
+                "mb": round(self.count * (self.dim * 4 + 8) / 1e6, 1)}
+
+
+def owner_dir(root: str, owner: str) -> str:
+    return os.path.join(root, hashlib.sha256(str(owner).encode()).hexdigest()[:32])
+
+
+class OwnerIndexes:
+    """Un IdeaIndex par propriétaire (email, identifiant de visiteur) sous `root`, ouverts à la demande ;
+    au-delà de `max_open`, les moins récemment utilisés sont refermés (leurs fichiers restent)."""
+    def __init__(self, root: str, max_open: int = 128):
+        self.root, self.max_open = root, max_open
+        self._open = {}   # owner -> IdeaIndex, du moins au plus récemment utilisé
+        self._lock = threading.Lock()
+
+    def get(self, owner: str) -> IdeaIndex:
+        with self._lock:
+            index = self._open.pop(owner, None) or IdeaIndex(owner_dir(self.root, owner), grow=OWNER_GROW)
+            self._open[owner] = index
+            while len(self._open) > self.max_open: self._open.pop(next(iter(self._open)))
+            return index
+
+    def add(self, owner: str, idea: str, result, **meta) -> bool:
+        return self.get(owner).add(idea, result, **meta)
+
+    def best(self, owner: str, text: str, threshold: float = 0.9):
+        return self.get(owner).best(text, threshold)
+
+    def stats(self) -> dict:
+        with self._lock: indexes = list(self._open.values())
+        totals = {"owners_open": len(indexes), "entries": 0, "lookups": 0, "hits": 0, "added": 0, "duplicates": 0}
+        for index in indexes:
+            totals["entries"] += index.count
+            for k in ("lookups", "hits", "added", "duplicates"): totals[k] += index.counters[k]
+        totals["hit_rate"] = totals["hits"] / totals["lookups"] if totals["lookups"] else 0.0
+        return totals
+
+# ==========================================
+# 3. CONSTRUCTION HORS LIGNE
+# ==========================================
+
+RESULT_FIELDS = {
+    "crash_test": ["score_D", "score_U", "score_R", "total", "verdict", "analyse_critique", "conseil_architecte"],
+    "analysis": ["analysis"],
+}
+
+def rows_from_jsonl(path: str, kind: str):
+    """Lignes (idée, résultat) d'un checkpoint batch.py ou d'un JSONL {"idea", "result"[, "model"]}."""
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try: row = json.loads(line)
+            except ValueError: continue
+            if row.get("error") or not row.get("idea"): continue
+            if "result" in row: yield {"idea": row["idea"], "result": row["result"], "model": row.get("model")}
+            elif kind == "analysis" and row.get("analysis"):
+                yield {"idea": row["idea"], "result": row["analysis"], "model": row.get("model")}
+            elif kind == "crash_test" and row.get("verdict"):
+                yield {"idea": row["idea"], "result": {k: row.get(k) for k in RESULT_FIELDS["crash_test"]}}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    build = sub.add_parser("build", help="ajoute des fichiers JSONL à l'index")
+    build.add_argument("sources", nargs="+")
+    search = sub.add_parser("search", help="idées les plus proches")
+    search.add_argument("text")
+    search.add_argument("-k", type=int, default=5)
+    for p in (build, search):
+        p.add_argument("--kind", choices=sorted(RESULT_FIELDS), default="analysis")
+        p.add_argument("--dir", default=DEFAULT_DIR)
+        p.add_argument("--owner", help="index de ce propriétaire (celui que lisent les apps) ; sinon index commun")
+    args = ap.parse_args(argv)
+
+    root = os.path.join(args.dir, args.kind)
+    index = IdeaIndex(owner_dir(root, args.owner), grow=OWNER_GROW) if args.owner else IdeaIndex(root)
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        for source in args.sources:
+            # Le checkpoint batch.py est déjà sans doublons (même idée normalisée = même ligne)
+            rows, added = list(rows_from_jsonl(source, args.kind)), 0
+            for i in range(0, len(rows), 5000): added += index.add_many(rows[i:i + 5000], dedupe=False)
+            print(f"{source} : {added}/{len(rows)} ajoutées")
+        print(f"{index.count} entrées en {time.perf_counter() - t0:.1f}s -> {index.path}")
+    else:
+        t0 = time.perf_counter()
+        matches = index.search(args.text, args.k)
+        print(f"{len(matches)} résultats en {(time.perf_counter() - t0) * 1000:.1f} ms")
+        for m in matches: print(f"  {m['score']:.3f}  {m['idea'][:100]}")
+
+
+if __name__ == "__main__":
+    main()
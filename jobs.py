@@ -0,0 +1,239 @@
+"""
+File persistante des générations IA (voir sql/jobs.sql).
+- La page enregistre un job et le suit par sondage : la session ne tient aucun thread pendant l'appel,
+  et fermer l'onglet ne perd rien (on se rattache par l'id du job, gardé dans l'URL).
+- Un pool borné de workers exécute les jobs ; un job n'est pris qu'une fois (passage queued -> running atomique).
+- `on_done(job)` (débit du crédit, cache, sauvegarde) est appelé une seule fois, quand le job réussit, et AVANT
+  que le job ne passe à done : une session qui voit « done » trouve le projet enregistré et le crédit débité.
+  S'il échoue, le job passe en erreur (le résultat reste en cache : relancer ne coûte pas d'appel IA).
+- Au démarrage puis toutes les `sweep_every` s, les jobs restés en file ou abandonnés par un process mort sont
+  relancés (SQLite, un seul process : au démarrage, tout job « running » est orphelin).
+Backends : SQLite (local), Supabase (prod).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ["id", "owner", "app", "kind", "key", "status", "payload", "result", "model", "error", "error_type",
+           "attempts", "created_at", "started_at", "finished_at"]
+ACTIVE = ("queued", "running")
+
+# ==========================================
+# 1. BACKENDS
+# ==========================================
+
+class SQLiteJobBackend:
+    single_process = True  # fichier local à un process : au démarrage, aucun job n'est réellement en cours
+
+    def __init__(self, path: str = os.path.join(".cache", "jobs.sqlite3")):
+        if path != ":memory:": os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, owner TEXT, app TEXT, kind TEXT, key TEXT, status TEXT,
+            payload TEXT, result TEXT, model TEXT, error TEXT, error_type TEXT, attempts INTEGER DEFAULT 0,
+            created_at REAL, started_at REAL, finished_at REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_active ON jobs (owner, key, status)")
+        self._lock = threading.Lock()
+
+    def _row(self, row):
+        if row is None: return None
+        job = dict(zip(COLUMNS, row))
+        for k in ("payload", "result"): job[k] = json.loads(job[k]) if job[k] is not None else None
+        return job
+
+    def insert(self, job):
+        values = [json.dumps(job.get(c), ensure_ascii=False) if c in ("payload", "result") else job.get(c) for c in COLUMNS]
+        with self._lock:
+            self._conn.execute(f"INSERT INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", values)
+
+    def claim(self, job_id):
+        with self._lock:
+            cur = self._conn.execute("UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                                     "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+        return cur.rowcount == 1
+
+    def finish(self, job_id, status, result=None, model=None, error=None, error_type=None):
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, model = ?, error = ?, error_type = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (status, json.dumps(result, ensure_ascii=False), model, error, error_type, time.time(), job_id))
+        return cur.rowcount == 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._row(self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def find_active(self, owner, key):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE owner = ? AND key = ? "
+                                     "AND status IN ('queued', 'running') LIMIT 1", (owner, key)).fetchone()
+        return self._row(row)
+
+    def requeue_stale(self, before):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND started_at < ?", (before,))
+            return [r[0] for r in self._conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+
+    def prune(self, before):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND created_at < ?", (before,))
+
+
+class SupabaseJobBackend:
+    single_process = False
+
+    def __init__(self, client):
+        self.client = client
+
+    def insert(self, job):
+        self.client.table("jobs").insert(job).execute()
+
+    def claim(self, job_id):
+        res = (self.client.table("jobs").update({"status": "running", "started_at": time.time()})
+               .eq("id", job_id).eq("status", "queued").execute())
+        return bool(res.data)
+
+    def finish(self, job_id, status, result=None, model=None, error=None, error_type=None):
+        res = (self.client.table("jobs").update({"status": status, "result": result, "model": model, "error": error,
+                                                 "error_type": error_type, "finished_at": time.time()})
+               .eq("id", job_id).eq("status", "running").execute())
+        return bool(res.data)
+
+    def get(self, job_id):
+        res = self.client.table("jobs").select("*").eq("id", job_id).execute()
+        return res.data[0] if res.data else None
+
+    def find_active(self, owner, key):
+        res = (self.client.table("jobs").select("*").eq("owner", owner).eq("key", key)
+               .in_("status", list(ACTIVE)).limit(1).execute())
+        return res.data[0] if res.data else None
+
+    def requeue_stale(self, before):
+        self.client.table("jobs").update({"status": "queued"}).eq("status", "running").lt("started_at", before).execute()
+        res = self.client.table("jobs").select("id").eq("status", "queued").order("created_at").execute()
+        return [r["id"] for r in res.data or []]
+
+    def prune(self, before):
+        self.client.table("jobs").delete().not_.in_("status", list(ACTIVE)).lt("created_at", before).execute()
+
+
+def build_backend(kind: str, client=None, path: str = None):
+    if kind == "supabase": return SupabaseJobBackend(client)
+    return SQLiteJobBackend(path or os.path.join(".cache", "jobs.sqlite3"))
+
+# ==========================================
+# 2. FILE & WORKERS
+# ==========================================
+
+class JobQueue:
+    def __init__(self, backend, max_workers: int = 4, stale_after: float = 600, keep: float = 7 * 86400,
+                 sweep_every: float = 60):
+        self.backend = backend
+        self._handlers = {}   # type -> (fn, on_done)
+        self._progress = {}   # id -> avancement publié par le worker (mémoire du process)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self.stale_after = stale_after
+        self.keep = keep
+        self.sweep_every = sweep_every
+        self._sweeper = None
+        self.counters = {"submitted": 0, "reattached": 0, "done": 0, "errors": 0, "recovered": 0}
+
+    def register(self, kind: str, fn, on_done=None):
+        """`fn(job, progress)` -> (résultat, modèle) ; `progress(valeur)` publie l'avancement (texte partiel...)."""
+        self._handlers[kind] = (fn, on_done)
+
+    def recover(self):
+        """À appeler une fois les types enregistrés : relance les jobs en file ou abandonnés par un process mort,
+        puis démarre le balayage périodique (un process mort pendant un job ne le laisse jamais « running »)."""
+        now = time.time()
+        self.backend.prune(now - self.keep)
+        self._requeue(now if getattr(self.backend, "single_process", False) else now - self.stale_after)
+        if self.sweep_every and self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep, name="job-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _requeue(self, before):
+        ids = self.backend.requeue_stale(before)
+        with self._lock: self.counters["recovered"] += len(ids)
+        for job_id in ids: self._pool.submit(self._run, job_id)  # déjà en file ici : claim() n'en prend qu'un
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.sweep_every)
+            try: self._requeue(time.time() - self.stale_after)
+            except Exception: log.exception("jobs : balayage des jobs abandonnés en échec")
+
+    def submit(self, owner: str, app: str, kind: str, payload: dict, key: str = None) -> str:
+        """Id du job ; la même demande (même `key`) encore en cours pour ce propriétaire est reprise, pas relancée."""
+        if key:
+            active = self.backend.find_active(owner, key)
+            if active:
+                with self._lock: self.counters["reattached"] += 1
+                return active["id"]
+        job = {"id": str(uuid.uuid4()), "owner": owner, "app": app, "kind": kind, "key": key, "status": "queued",
+               "payload": payload, "attempts": 0, "created_at": time.time()}
+        self.backend.insert(job)
+        with self._lock: self.counters["submitted"] += 1
+        self._pool.submit(self._run, job["id"])
+        return job["id"]
+
+    def _run(self, job_id):
+        if not self.backend.claim(job_id): return  # déjà pris ailleurs
+        job = self.backend.get(job_id)
+        fn, on_done = self._handlers[job["kind"]]
+        try:
+            result, model = fn(job, lambda value: self._progress.__setitem__(job_id, value))
+        except Exception as e:
+            self.backend.finish(job_id, "error", error=str(e)[:500], error_type=type(e).__name__)
+            with self._lock: self.counters["errors"] += 1
+            return
+        finally:
+            self._progress.pop(job_id, None)
+        if on_done:  # sauvegarde et débit avant « done » : c'est ce que la session lira en le voyant
+            try: on_done({**job, "status": "done", "result": result, "model": model})
+            except Exception as e:
+                log.exception("job %s : on_done en échec", job_id)
+                self.backend.finish(job_id, "error", error=f"Enregistrement impossible : {e}"[:500], error_type=type(e).__name__)
+                with self._lock: self.counters["errors"] += 1
+                return
+        if not self.backend.finish(job_id, "done", result, model): return
+        with self._lock: self.counters["done"] += 1
+
+    def get(self, job_id: str, owner: str = None):
+        """Le job (avec `partial`, l'avancement en cours), ou None s'il n'existe pas / n'appartient pas à `owner`."""
+        job = self.backend.get(job_id)
+        if not job or (owner is not None and job["owner"] != owner): return None
+        return {**job, "partial": self._progress.get(job_id)}
+
+    def stats(self) -> dict:
+        with self._lock: return {**self.counters, "in_progress": len(self._progress)}
+
+# ==========================================
+# 3. UI (suivi par sondage)
+# ==========================================
+
+def render_job(st, queue: JobQueue, job_id: str, owner: str, on_finish, show_partial=None, interval: float = 1.0):
+    """Suit le job dans un fragment relancé toutes les `interval` s (seul ce bloc est ré-exécuté).
+    `on_finish(job)` est appelé une fois le job terminé (succès ou erreur), ou avec None s'il est introuvable."""
+    @st.fragment(run_every=interval)
+    def poll():
+        job = queue.get(job_id, owner)
+        if job is None or job["status"] not in ACTIVE:
+            on_finish(job)
+            return
+        payload = job["payload"] or {}
+        with st.status(payload.get("label", "Génération..."), expanded=True):
+            st.write("En file d'attente..." if job["status"] == "queued" else
+                     f"{payload.get('step', 'Génération en cours...')} Vous pouvez fermer l'onglet : le résultat vous attendra.")
+            if job.get("partial"): (show_partial or (lambda p: st.markdown(f"{p} ▌")))(job["partial"])
+    poll()
@@ -0,0 +1,104 @@
+"""
+Cache persistant des réponses IA (SQLite local).
+Partagé entre toutes les sessions Streamlit du process (et entre process sur la même machine).
+Clé = modèle + template du prompt + champs normalisés. Éviction TTL puis LRU au-delà du plafond.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(".cache", "llm_cache.sqlite3")
+
+
+def normalize_input(text) -> str:
+    """Espaces compactés + casse ignorée : deux saisies qui ne diffèrent que par la forme partagent la clé."""
+    return re.sub(r"\s+", " ", str(text or "")).strip().casefold()
+
+
+def cache_key(model: str, template: str, fields: dict) -> str:
+    payload = json.dumps(
+        {"model": model, "template": template, "fields": {k: normalize_input(v) for k, v in fields.items()}},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = 2000, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, model TEXT, template TEXT, value TEXT,
+                created_at REAL, last_access REAL, hits INTEGER DEFAULT 0)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            self._conn.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+
+    def _bump(self, name, n=1):
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (n, name))
+
+    def get(self, model: str, template: str, fields: dict):
+        key = cache_key(model, template, fields)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._conn.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                self._bump("hits")
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._bump("evictions")
+            self._bump("misses")
+        return None
+
+    def contains(self, model: str, template: str, fields: dict) -> bool:
+        """Présence d'une entrée valide, sans toucher aux compteurs ni à l'ordre LRU."""
+        key = cache_key(model, template, fields)
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        return bool(row) and time.time() - row[0] <= self.ttl
+
+    def put(self, model: str, template: str, fields: dict, value: str):
+        if not value: return
+        key = cache_key(model, template, fields)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, model, template, value, created_at, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, template, value, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        expired = self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if expired + overflow: self._bump("evictions", expired + overflow)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            counters["entries"] = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / total if total else 0.0
+        return counters
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("UPDATE stats SET value = 0")
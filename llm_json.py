@@ -0,0 +1,265 @@
+"""
+Lecture robuste des réponses JSON des modèles.
+- parse_json : json.loads, puis réparations locales courantes (balises ```, texte autour,
+  guillemets typographiques hors chaînes, virgules en trop, commentaires, crochets non fermés).
+- validate : contrôle/conversion selon un schéma simple (types des champs, éléments des listes).
+- IncrementalParser : sur un flux, renvoie chaque objet d'une liste dès qu'il est fermé.
+- plan_fixups / apply_fixup : si la réparation locale ne suffit pas, on ne redemande au modèle
+  que la partie cassée (un élément, des champs manquants), pas toute la réponse.
+"""
+import json
+import re
+
+# ==========================================
+# 1. RÉPARATION LOCALE
+# ==========================================
+
+_OPEN_QUOTES, _CLOSE_QUOTES = "“«", "”»"
+
+
+def _delimiter_quotes(text):
+    """Guillemets typographiques servant de délimiteurs (hors chaîne) -> '"'.
+    Dans une chaîne, « » et “ ” sont du texte et restent tels quels."""
+    out, closer, esc = [], None, False  # closer : ce qui ferme la chaîne en cours (None : hors chaîne)
+    for c in text:
+        if closer is None:
+            if c == '"' or c in _OPEN_QUOTES or c in _CLOSE_QUOTES:
+                closer = '"' if c == '"' else _CLOSE_QUOTES
+                c = '"'
+        elif esc: esc = False
+        elif c == "\\": esc = True
+        elif c == '"' or (closer != '"' and c in closer):
+            closer, c = None, '"'
+        out.append(c)
+    return "".join(out)
+
+
+def _extract_object(text):
+    """Du premier '{' au '}' qui le ferme (en ignorant les accolades dans les chaînes)."""
+    start = text.find("{")
+    if start < 0: return text
+    depth, in_str, esc = 0, False, False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_str:
+            if esc: esc = False
+            elif c == "\\": esc = True
+            elif c == '"': in_str = False
+        elif c == '"': in_str = True
+        elif c in "{[": depth += 1
+        elif c in "}]":
+            depth -= 1
+            if depth == 0: return text[start:i + 1]
+    return text[start:]
+
+
+def _strip_comments(text):
+    """Retire les commentaires // hors des chaînes."""
+    out, in_str, esc, i = [], False, False, 0
+    while i < len(text):
+        c = text[i]
+        if in_str:
+            if esc: esc = False
+            elif c == "\\": esc = True
+            elif c == '"': in_str = False
+        elif c == '"': in_str = True
+        elif c == "/" and text[i + 1:i + 2] == "/":
+            while i < len(text) and text[i] != "\n": i += 1
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _close_open(text):
+    """Ferme une chaîne et les crochets restés ouverts (réponse coupée)."""
+    stack, in_str, esc = [], False, False
+    for c in text:
+        if in_str:
+            if esc: esc = False
+            elif c == "\\": esc = True
+            elif c == '"': in_str = False
+        elif c == '"': in_str = True
+        elif c in "{[": stack.append("}" if c == "{" else "]")
+        elif c in "}]" and stack: stack.pop()
+    if in_str: text += '"'
+    text = re.sub(r'[,:]\s*$', '', text.rstrip())
+    return text + "".join(reversed(stack))
+
+
+def repair(raw: str) -> str:
+    text = _delimiter_quotes(re.sub(r'```(?:json)?', '', raw or ""))
+    text = _extract_object(text)
+    text = _strip_comments(text)
+    text = re.sub(r',\s*([}\]])', r'\1', text)
+    return _close_open(text)
+
+
+def parse_json(raw):
+    """dict ou None. N'appelle jamais le modèle."""
+    if not raw: return None
+    try:
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else None
+    except (TypeError, ValueError): pass
+    try:
+        data = json.loads(repair(raw))
+        return data if isinstance(data, dict) else None
+    except ValueError:
+        return None
+
+# ==========================================
+# 2. SCHÉMAS
+# ==========================================
+# Schéma = {"fields": {champ: type}, "items": (clé_liste, {champ: type})}
+# types : "number", "string", "array", "object"
+
+def _coerce(value, kind):
+    if kind == "number":
+        if isinstance(value, bool): return None
+        if isinstance(value, (int, float)): return value
+        m = re.match(r'\s*(-?\d+(?:[.,]\d+)?)', str(value)) if value is not None else None
+        if not m: return None
+        num = float(m.group(1).replace(",", "."))
+        return int(num) if num.is_integer() else num
+    if kind == "string":
+        return value if isinstance(value, str) and value.strip() else (str(value) if isinstance(value, (int, float)) else None)
+    if kind == "array": return value if isinstance(value, list) else None
+    if kind == "object": return value if isinstance(value, dict) else None
+    return value
+
+
+def validate_item(item, fields):
+    """(élément nettoyé, champs en erreur)."""
+    if not isinstance(item, dict): return item, list(fields)
+    clean, bad = dict(item), []
+    for name, kind in fields.items():
+        value = _coerce(item.get(name), kind)
+        if value is None: bad.append(name)
+        else: clean[name] = value
+    return clean, bad
+
+
+def validate(data, schema):
+    """(données nettoyées, erreurs). Erreurs : [("field", nom)] ou [("item", index, [champs])]."""
+    clean, bad = validate_item(data, schema.get("fields", {}))
+    errors = [("field", name) for name in bad]
+    items = schema.get("items")
+    if items and isinstance(clean.get(items[0]), list):
+        new_items = []
+        for i, item in enumerate(clean[items[0]]):
+            item_clean, item_bad = validate_item(item, items[1])
+            if item_bad: errors.append(("item", i, item_bad))
+            new_items.append(item_clean)
+        clean[items[0]] = new_items
+    return clean, errors
+
+# ==========================================
+# 3. RÉPARATION CIBLÉE PAR LE MODÈLE
+# ==========================================
+
+FIXUP_SYSTEM_PROMPT = """Tu corriges un fragment JSON. Réponds UNIQUEMENT avec l'objet JSON corrigé,
+sans texte autour, en conservant le contenu existant et en complétant les champs demandés."""
+
+
+class Fixup:
+    def __init__(self, target, message):
+        self.target = target  # ("item", index) | ("fields", [noms]) | ("document",)
+        self.message = message
+
+
+def plan_fixups(data, errors, schema, raw=None):
+    """Liste minimale de demandes de correction. `data` None = document illisible."""
+    if data is None:
+        return [Fixup(("document",), f"Format attendu : {json.dumps(schema_example(schema), ensure_ascii=False)}\n"
+                                     f"Texte à corriger :\n{raw}")]
+    fixups = []
+    missing = [e[1] for e in errors if e[0] == "field"]
+    if missing:
+        example = {k: v for k, v in schema_example(schema).items() if k in missing}
+        context = {k: v for k, v in data.items() if k not in missing}
+        fixups.append(Fixup(("fields", missing),
+                            f"Champs manquants à produire : {json.dumps(example, ensure_ascii=False)}\n"
+                            f"Contexte : {json.dumps(context, ensure_ascii=False)[:1500]}"))
+    key = schema.get("items", (None,))[0]
+    for e in errors:
+        if e[0] == "item":
+            item = data[key][e[1]]
+            fixups.append(Fixup(("item", e[1]),
+                                f"Champs à corriger : {', '.join(e[2])}\n"
+                                f"Objet : {json.dumps(item, ensure_ascii=False)}"))
+    return fixups
+
+
+def apply_fixup(data, fixup, repaired, schema):
+    if not isinstance(repaired, dict): return data
+    kind = fixup.target[0]
+    if kind == "document": return repaired
+    if kind == "fields":
+        data.update({k: repaired[k] for k in fixup.target[1] if k in repaired})
+    elif kind == "item":
+        items = data[schema["items"][0]]
+        old = items[fixup.target[1]]
+        items[fixup.target[1]] = {**old, **repaired} if isinstance(old, dict) else repaired
+    return data
+
+
+def schema_example(schema):
+    sample = {"number": 0, "string": "...", "array": [], "object": {}}
+    ex = {k: sample[v] for k, v in schema.get("fields", {}).items()}
+    if schema.get("items"):
+        ex[schema["items"][0]] = [{k: sample[v] for k, v in schema["items"][1].items()}]
+    return ex
+
+# ==========================================
+# 4. FLUX INCRÉMENTAL
+# ==========================================
+
+class IncrementalParser:
+    """Reçoit les morceaux d'un flux JSON ; feed() renvoie les éléments de `array_key` terminés."""
+    def __init__(self, array_key, item_fields=None):
+        self.array_key = array_key
+        self.item_fields = item_fields or {}
+        self.text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_str = False
+        self._esc = False
+        self._str_start = None
+        self._last_key = None
+        self._array_depth = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_str:
+                if self._esc: self._esc = False
+                elif c == "\\": self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if len(self._stack) == 1: self._last_key = text[self._str_start + 1:i]
+                continue
+            if not self._stack and c != "{": continue  # texte avant l'objet (balises, etc.)
+            if c == '"':
+                self._in_str, self._str_start = True, i
+            elif c in "{[":
+                if c == "[" and len(self._stack) == 1 and self._last_key == self.array_key:
+                    self._array_depth = 2
+                self._stack.append(c)
+                if c == "{" and self._array_depth and len(self._stack) == self._array_depth + 1:
+                    self._item_start = i
+            elif c in "}]" and self._stack:
+                if c == "}" and self._item_start is not None and len(self._stack) == (self._array_depth or 0) + 1:
+                    item = parse_json(text[self._item_start:i + 1])
+                    if item is not None:
+                        items.append(validate_item(item, self.item_fields)[0] if self.item_fields else item)
+                    self._item_start = None
+                self._stack.pop()
+                if c == "]" and self._array_depth and len(self._stack) < self._array_depth:
+                    self._array_depth = None
+        self._pos = len(text)
+        return items
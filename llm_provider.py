@@ -0,0 +1,430 @@
+"""
+Couche fournisseurs IA commune aux deux apps (Gemini pour beta_app, OpenAI pour ancien_app).
+- délai max par tentative et pour l'appel complet (toutes reprises comprises),
+- reprises avec backoff exponentiel + jitter sur 429 / 5xx / timeouts / coupures réseau,
+- disjoncteur par modèle : échec immédiat tant que le fournisseur est dégradé,
+- repli sur un modèle secondaire.
+Aucune dépendance à Streamlit : les clients HTTP sont injectés (voir resources.py) et
+`base_url` / `endpoint` permettent de viser un faux serveur local (tools/fake_llm_server.py).
+"""
+import asyncio
+import random
+import threading
+import time
+
+from tracing import span
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = ("Timeout", "Connection", "RateLimit", "DeadlineExceeded", "ServiceUnavailable",
+                   "ResourceExhausted", "InternalServerError", "TooManyRequests", "RemoteProtocol")
+
+# ==========================================
+# 1. ERREURS
+# ==========================================
+
+class LLMError(Exception):
+    def __init__(self, message, retryable=False, status=None, model=None, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitOpen(LLMError):
+    """Le disjoncteur du modèle est ouvert : on n'appelle même pas le fournisseur."""
+
+
+class IncompleteResponse(LLMError):
+    """Réponse arrêtée avant la fin (flux coupé, filtre, limite de tokens, réponse vide)."""
+    def __init__(self, partial, reason, model=None):
+        super().__init__(f"Réponse incomplète ({reason})", retryable=False, model=model)
+        self.partial = partial
+        self.reason = reason
+
+
+def classify(exc) -> LLMError:
+    if isinstance(exc, LLMError): return exc
+    status = getattr(exc, "status_code", None)
+    if status is None: status = getattr(exc, "code", None)
+    if not isinstance(status, int): status = None
+    name = type(exc).__name__
+    retryable = status in RETRYABLE_STATUS or any(k in name for k in RETRYABLE_NAMES)
+    retry_after = None
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers:
+        try: retry_after = float(headers.get("retry-after"))
+        except (TypeError, ValueError): pass
+    return LLMError(f"{name}: {exc}", retryable=retryable, status=status, retry_after=retry_after)
+
+# ==========================================
+# 2. DISJONCTEUR
+# ==========================================
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None: return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed": return True
+            if state == "half_open" and not self._probing:
+                self._probing = True  # un seul appel test laissé passer
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probing = 0, None, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Appel terminé sans verdict sur le fournisseur (requête invalide, réponse filtrée, flux abandonné) :
+        compteurs inchangés, un nouvel appel test pourra passer."""
+        with self._lock:
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(key: str, **kwargs) -> CircuitBreaker:
+    """Un disjoncteur par fournisseur:modèle, partagé par tout le process."""
+    with _breakers_lock:
+        if key not in _breakers: _breakers[key] = CircuitBreaker(**kwargs)
+        return _breakers[key]
+
+def breaker_states() -> dict:
+    with _breakers_lock:
+        return {k: {"state": b.state, "failures": b.failures} for k, b in _breakers.items()}
+
+_usage_hooks = []
+
+def on_usage(fn):
+    """Enregistre `fn(phase, provider, model, usage, latency_ms, prompt_chars)`, appelée après chaque réponse."""
+    _usage_hooks.append(fn)
+    return fn
+
+def _emit_usage(phase, provider, model, usage, latency_ms, prompt, system):
+    for fn in _usage_hooks:
+        try: fn(phase, provider, model, usage, latency_ms, len(prompt) + len(system or ""))
+        except Exception: pass  # la télémétrie ne doit jamais casser un appel
+
+_failure_hooks = []
+
+def on_failure(fn):
+    """Enregistre `fn(phase, model, err)`, appelée après chaque échec réessayable (panne, délai, quota)."""
+    _failure_hooks.append(fn)
+    return fn
+
+def _emit_failure(phase, model, err):
+    for fn in _failure_hooks:
+        try: fn(phase, model, err)
+        except Exception: pass
+
+# ==========================================
+# 3. FOURNISSEURS
+# ==========================================
+
+class LLMResult:
+    def __init__(self, text, model, provider, usage=None, latency_ms=None):
+        self.text = text
+        self.model = model
+        self.provider = provider
+        self.usage = usage or {}
+        self.latency_ms = latency_ms
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key=None, base_url=None, client=None, async_client=None):
+        from openai import OpenAI, AsyncOpenAI
+        self.client = client or OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.async_client = async_client or AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    @staticmethod
+    def _kwargs(model, system, prompt, json_mode, max_tokens):
+        messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+        kwargs = {"model": model, "messages": messages, "temperature": 0.7}
+        if json_mode: kwargs["response_format"] = {"type": "json_object"}
+        if max_tokens: kwargs["max_tokens"] = max_tokens
+        return kwargs
+
+    @staticmethod
+    def _usage(u):
+        return {"input_tokens": u.prompt_tokens, "output_tokens": u.completion_tokens} if u else {}
+
+    def _result(self, response, model):
+        choice = response.choices[0]
+        text = choice.message.content or ""
+        if choice.finish_reason not in ("stop", None) or not text.strip():
+            raise IncompleteResponse(text, choice.finish_reason or "vide", model)
+        return LLMResult(text, model, self.name, self._usage(getattr(response, "usage", None)))
+
+    def complete(self, model, system, prompt, timeout, json_mode=False, max_tokens=None):
+        client = self.client.with_options(timeout=timeout, max_retries=0)
+        return self._result(client.chat.completions.create(**self._kwargs(model, system, prompt, json_mode, max_tokens)), model)
+
+    async def acomplete(self, model, system, prompt, timeout, json_mode=False, max_tokens=None):
+        client = self.async_client.with_options(timeout=timeout, max_retries=0)
+        return self._result(await client.chat.completions.create(**self._kwargs(model, system, prompt, json_mode, max_tokens)), model)
+
+    def stream(self, model, system, prompt, timeout, meta, json_mode=False, max_tokens=None):
+        client = self.client.with_options(timeout=timeout, max_retries=0)
+        kwargs = self._kwargs(model, system, prompt, json_mode, max_tokens)
+        finish = None
+        for chunk in client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs):
+            if getattr(chunk, "usage", None): meta["usage"] = self._usage(chunk.usage)
+            if not chunk.choices: continue
+            finish = chunk.choices[0].finish_reason or finish
+            if chunk.choices[0].delta.content: yield chunk.choices[0].delta.content
+        meta["finish_reason"] = finish
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, api_key, endpoint=None):
+        import google.generativeai as genai
+        options = {"api_key": api_key}
+        if endpoint: options.update(transport="rest", client_options={"api_endpoint": endpoint})
+        genai.configure(**options)
+        self._genai = genai
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, name, system):
+        with self._lock:
+            if (name, system) not in self._models:
+                self._models[(name, system)] = self._genai.GenerativeModel(name, system_instruction=system or None)
+            return self._models[(name, system)]
+
+    @staticmethod
+    def _config(json_mode, max_tokens):
+        config = {}
+        if json_mode: config["response_mime_type"] = "application/json"
+        if max_tokens: config["max_output_tokens"] = max_tokens
+        return config or None
+
+    @staticmethod
+    def _usage(u):
+        return {"input_tokens": u.prompt_token_count, "output_tokens": u.candidates_token_count} if u else {}
+
+    @staticmethod
+    def _finish(response):
+        return response.candidates[0].finish_reason.name if response.candidates else "VIDE"
+
+    @staticmethod
+    def _text(response):
+        try: return response.text
+        except ValueError: return ""  # pas de contenu (bloqué, vide)
+
+    def _result(self, response, model):
+        text = self._text(response)
+        reason = self._finish(response)
+        if reason != "STOP" or not text.strip(): raise IncompleteResponse(text, reason, model)
+        return LLMResult(text, model, self.name, self._usage(getattr(response, "usage_metadata", None)))
+
+    def complete(self, model, system, prompt, timeout, json_mode=False, max_tokens=None):
+        response = self._model(model, system).generate_content(
+            prompt, generation_config=self._config(json_mode, max_tokens), request_options={"timeout": timeout})
+        return self._result(response, model)
+
+    async def acomplete(self, model, system, prompt, timeout, json_mode=False, max_tokens=None):
+        response = await self._model(model, system).generate_content_async(
+            prompt, generation_config=self._config(json_mode, max_tokens), request_options={"timeout": timeout})
+        return self._result(response, model)
+
+    def stream(self, model, system, prompt, timeout, meta, json_mode=False, max_tokens=None):
+        response = self._model(model, system).generate_content(
+            prompt, stream=True, generation_config=self._config(json_mode, max_tokens), request_options={"timeout": timeout})
+        for chunk in response:
+            text = self._text(chunk)
+            if text: yield text
+        meta["finish_reason"] = "stop" if self._finish(response) == "STOP" else self._finish(response)
+        meta["usage"] = self._usage(getattr(response, "usage_metadata", None))
+
+# ==========================================
+# 4. CLIENT (REPRISES, DISJONCTEUR, REPLI)
+# ==========================================
+
+class LLMClient:
+    def __init__(self, routes, retries: int = 3, timeout: float = 90, deadline: float = 180,
+                 base_delay: float = 0.5, max_delay: float = 8, breaker_threshold: int = 5, breaker_reset: float = 30):
+        """`routes` : [(fournisseur, modèle), ...] ; le premier est le principal, les suivants des replis."""
+        self.routes = list(routes)
+        self.retries = retries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._breaker_kwargs = {"failure_threshold": breaker_threshold, "reset_timeout": breaker_reset}
+
+    @property
+    def model(self):
+        return self.routes[0][1]
+
+    def _breaker(self, provider, model):
+        return breaker_for(f"{provider.name}:{model}", **self._breaker_kwargs)
+
+    def _backoff(self, attempt, err):
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        return max(delay, err.retry_after or 0)
+
+    def _attempts(self, deadline):
+        """Séquence (fournisseur, modèle, disjoncteur, tentative, timeout) ; le repli passe au modèle suivant."""
+        for provider, model in self.routes:
+            breaker = self._breaker(provider, model)
+            for attempt in range(self.retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: return
+                if not breaker.allow():
+                    yield provider, model, None, attempt, 0
+                    break
+                yield provider, model, breaker, attempt, min(self.timeout, remaining)
+
+    def _handle(self, exc, model, breaker, attempt, deadline, phase=None):
+        """Classe l'erreur, met à jour le disjoncteur ; renvoie (erreur, attente avant nouvel essai ou None)."""
+        err = classify(exc)
+        err.model = model
+        if not err.retryable:
+            breaker.release()  # requête invalide ou réponse filtrée : ni panne ni preuve de rétablissement
+            raise err
+        breaker.failure()
+        _emit_failure(phase, model, err)
+        if attempt >= self.retries or breaker.state != "closed": return err, None
+        delay = self._backoff(attempt, err)
+        if time.monotonic() + delay >= deadline: return err, None
+        return err, delay
+
+    def generate(self, prompt, system=None, json_mode=False, max_tokens=None, phase=None) -> LLMResult:
+        deadline = time.monotonic() + self.deadline
+        last = LLMError("Délai global dépassé", retryable=True)
+        for provider, model, breaker, attempt, timeout in self._attempts(deadline):
+            if breaker is None:
+                last = CircuitOpen(f"{provider.name}:{model} indisponible (disjoncteur ouvert)", retryable=True, model=model)
+                continue
+            t0 = time.perf_counter()
+            try:
+                with span("llm.call", provider=provider.name, model=model, attempt=attempt):
+                    res = provider.complete(model, system, prompt, timeout, json_mode, max_tokens)
+                breaker.success()
+                res.latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+                _emit_usage(phase, provider.name, model, res.usage, res.latency_ms, prompt, system)
+                return res
+            except Exception as e:
+                last, delay = self._handle(e, model, breaker, attempt, deadline, phase)
+                if delay: time.sleep(delay)
+        raise last
+
+    async def agenerate(self, prompt, system=None, json_mode=False, max_tokens=None, phase=None) -> LLMResult:
+        deadline = time.monotonic() + self.deadline
+        last = LLMError("Délai global dépassé", retryable=True)
+        for provider, model, breaker, attempt, timeout in self._attempts(deadline):
+            if breaker is None:
+                last = CircuitOpen(f"{provider.name}:{model} indisponible (disjoncteur ouvert)", retryable=True, model=model)
+                continue
+            t0 = time.perf_counter()
+            try:
+                with span("llm.call", provider=provider.name, model=model, attempt=attempt, mode="async"):
+                    res = await asyncio.wait_for(
+                        provider.acomplete(model, system, prompt, timeout, json_mode, max_tokens), timeout)
+                breaker.success()
+                res.latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+                _emit_usage(phase, provider.name, model, res.usage, res.latency_ms, prompt, system)
+                return res
+            except Exception as e:
+                last, delay = self._handle(e, model, breaker, attempt, deadline, phase)
+                if delay: await asyncio.sleep(delay)
+        raise last
+
+    def stream(self, prompt, system=None, json_mode=False, max_tokens=None, phase=None):
+        return LLMStream(self, prompt, system, json_mode, max_tokens, phase)
+
+
+class LLMStream:
+    """Itère sur les morceaux de texte. Reprises et repli seulement avant le premier morceau :
+    une coupure après lève IncompleteResponse avec le texte partiel. `text`, `model`, `usage` à la fin.
+    Lecture arrêtée avant la fin : `close()` (ou la destruction du flux) ferme le flux du fournisseur."""
+    def __init__(self, client, prompt, system, json_mode, max_tokens, phase=None):
+        self.client = client
+        self.args = (prompt, system, json_mode, max_tokens)
+        self.phase = phase
+        self.text = ""
+        self.model = None
+        self.usage = {}
+        self._gen = None
+
+    def __iter__(self):
+        if self._gen is None: self._gen = self._run()
+        return self._gen
+
+    def close(self):
+        if self._gen is not None: self._gen.close()
+
+    def _run(self):
+        prompt, system, json_mode, max_tokens = self.args
+        c = self.client
+        deadline = time.monotonic() + c.deadline
+        last = LLMError("Délai global dépassé", retryable=True)
+        for provider, model, breaker, attempt, timeout in c._attempts(deadline):
+            if breaker is None:
+                last = CircuitOpen(f"{provider.name}:{model} indisponible (disjoncteur ouvert)", retryable=True, model=model)
+                continue
+            meta, settled = {}, False
+            t0 = time.perf_counter()
+            gen = provider.stream(model, system, prompt, timeout, meta, json_mode=json_mode, max_tokens=max_tokens)
+            try:
+                try:
+                    with span("llm.stream.first_chunk", provider=provider.name, model=model, attempt=attempt):
+                        first = next(gen, None)
+                except Exception as e:
+                    settled = True
+                    last, delay = c._handle(e, model, breaker, attempt, deadline, self.phase)
+                    if delay: time.sleep(delay)
+                    continue
+                self.model = model
+                if first is not None:
+                    self.text = first
+                    yield first
+                    try:
+                        for piece in gen:
+                            self.text += piece
+                            yield piece
+                    except Exception as e:
+                        err = classify(e)
+                        if err.retryable:
+                            settled = True
+                            breaker.failure()
+                            _emit_failure(self.phase, model, err)
+                        raise IncompleteResponse(self.text, str(err), model)
+                self.usage = meta.get("usage", {})
+                _emit_usage(self.phase, provider.name, model, self.usage, round((time.perf_counter() - t0) * 1000, 1), prompt, system)
+                settled = True
+                if meta.get("finish_reason") != "stop" or not self.text.strip():
+                    breaker.release()
+                    raise IncompleteResponse(self.text, meta.get("finish_reason") or "vide", model)
+                breaker.success()
+                return
+            finally:
+                if not settled: breaker.release()  # lecture abandonnée ou coupure non réessayable : appel test libéré
+                gen.close()
+        raise last
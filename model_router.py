@@ -0,0 +1,98 @@
+"""
+Routage des modèles par phase, selon la latence observée.
+Chaque phase a une liste de modèles du plus fort au plus rapide et un SLO (p95, taux d'erreur).
+Les mesures arrivent des hooks de llm_provider (succès et échecs), par (phase, modèle), sur une fenêtre
+glissante : si le modèle préféré dépasse son SLO, la phase descend d'un cran. Les mesures expirent,
+donc le modèle préféré est retenté une fois la fenêtre écoulée.
+"""
+import threading
+import time
+from collections import deque
+
+from llm_provider import on_failure, on_usage
+
+# phase -> modèles (du plus fort au plus rapide), p95 visé (ms), taux d'erreur max
+DEFAULT_ROUTES = {
+    # beta_app (Gemini) : l'analyse garde le modèle le plus fort, les pivots doivent sortir en quelques secondes
+    "analysis": {"tiers": ["gemini-2.5-pro", "gemini-2.5-flash"], "p95_ms": 60000, "max_error_rate": 0.2},
+    "pivots": {"tiers": ["gemini-2.5-flash", "gemini-2.5-flash-lite"], "p95_ms": 8000, "max_error_rate": 0.2},
+    "gps": {"tiers": ["gemini-2.5-pro", "gemini-2.5-flash"], "p95_ms": 60000, "max_error_rate": 0.2},
+    # ancien_app (OpenAI)
+    "crash_test": {"tiers": ["gpt-4o-mini", "gpt-3.5-turbo"], "p95_ms": 5000, "max_error_rate": 0.2},
+    "phase_g": {"tiers": ["gpt-4o", "gpt-4o-mini"], "p95_ms": 20000, "max_error_rate": 0.2},
+    "phase_p": {"tiers": ["gpt-4o-mini", "gpt-3.5-turbo"], "p95_ms": 6000, "max_error_rate": 0.2},
+    "phase_s": {"tiers": ["gpt-4o", "gpt-4o-mini"], "p95_ms": 20000, "max_error_rate": 0.2},
+    "fixup": {"tiers": ["gpt-4o-mini", "gpt-4o"], "p95_ms": 8000, "max_error_rate": 0.3},
+}
+
+
+class ModelRouter:
+    def __init__(self, routes: dict, window: float = 300, min_samples: int = 5, max_samples: int = 200):
+        self.routes = {p: dict(r) for p, r in routes.items()}
+        self.window = window
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self._samples = {}   # (phase, modèle) -> deque[(t, latence_ms, ok)]
+        self._lock = threading.Lock()
+
+    def configure(self, overrides: dict = None):
+        """Surcharge par phase, ex. secret MODEL_ROUTES = {pivots = {tiers = ["gemini-2.5-flash"], p95_ms = 5000}}."""
+        for phase, r in (overrides or {}).items():
+            self.routes[phase] = {**self.routes.get(phase, {"p95_ms": 30000, "max_error_rate": 0.2}), **dict(r)}
+
+    # --- Mesures ---
+    def observe(self, phase, model, latency_ms=None, ok=True):
+        if phase not in self.routes: return
+        with self._lock:
+            q = self._samples.setdefault((phase, model), deque(maxlen=self.max_samples))
+            q.append((time.monotonic(), latency_ms, ok))
+
+    def _window(self, phase, model):
+        q = self._samples.get((phase, model))
+        if not q: return []
+        limit = time.monotonic() - self.window
+        while q and q[0][0] < limit: q.popleft()
+        return list(q)
+
+    def health(self, phase, model) -> dict:
+        with self._lock: samples = self._window(phase, model)
+        lat = sorted(s[1] for s in samples if s[2] and s[1] is not None)
+        errors = sum(1 for s in samples if not s[2])
+        return {"samples": len(samples), "p95_ms": lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else None,
+                "error_rate": round(errors / len(samples), 3) if samples else 0.0}
+
+    def _breached(self, phase, model) -> bool:
+        h, slo = self.health(phase, model), self.routes[phase]
+        if h["samples"] < self.min_samples: return False  # pas assez de mesures : on fait confiance
+        return h["error_rate"] > slo["max_error_rate"] or (h["p95_ms"] or 0) > slo["p95_ms"]
+
+    # --- Choix ---
+    def primary(self, phase, default=None):
+        return self.routes[phase]["tiers"][0] if phase in self.routes else default
+
+    def choose(self, phase, default=None):
+        """(modèle, repli) pour la phase : le premier modèle dans son SLO, le suivant comme repli."""
+        if phase not in self.routes: return default, None
+        tiers = self.routes[phase]["tiers"]
+        for i, model in enumerate(tiers):
+            if not self._breached(phase, model):
+                return model, tiers[i + 1] if i + 1 < len(tiers) else None
+        # Tous hors SLO : le palier le plus rapide
+        return tiers[-1], None
+
+    def states(self) -> dict:
+        return {p: {"modèle": self.choose(p)[0], **{m: self.health(p, m) for m in r["tiers"]}}
+                for p, r in self.routes.items() if any((p, m) in self._samples for m in r["tiers"])}
+
+
+router = ModelRouter(DEFAULT_ROUTES)
+
+
+@on_usage
+def _on_usage(phase, provider, model, usage, latency_ms, prompt_chars):
+    router.observe(phase, model, latency_ms, ok=True)
+
+
+@on_failure
+def _on_failure(phase, model, err):
+    router.observe(phase, model, None, ok=False)
@@ -0,0 +1,70 @@
+"""
+Préchargement spéculatif de la phase suivante.
+Un pool de threads partagé par le process calcule en avance ; chaque session garde ses futures
+dans un dict (st.session_state) indexé par phase, avec la clé des entrées utilisées.
+Un résultat dont la clé ne correspond plus (idée modifiée, autre choix) est jeté.
+`delay` : départ différé, annulé sans frais si la clé change entre-temps (choix encore hésitant).
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class PrefetchEngine:
+    def __init__(self, max_workers: int = 4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self.counters = {"started": 0, "used": 0, "discarded": 0}
+
+    def start(self, store: dict, phase: str, key, fn, *args, delay: float = 0):
+        """Lance `fn(*args)` en fond pour `phase`, sauf si la même clé est déjà en cours / prête.
+        Avec `delay`, l'appel ne part qu'après `delay` secondes sans autre clé pour cette phase."""
+        current = store.get(phase)
+        if current and current[0] == key: return current[1]
+        self.discard(store, phase)
+        future = Future()
+        if delay:
+            timer = threading.Timer(delay, self._pool.submit, (self._run, future, fn, args))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._pool.submit(self._run, future, fn, args)
+        store[phase] = (key, future)
+        return future
+
+    def _run(self, future, fn, args):
+        if not future.set_running_or_notify_cancel(): return  # écarté avant le départ : rien n'est payé
+        self._count("started")
+        try: future.set_result(fn(*args))
+        except BaseException as e: future.set_exception(e)
+
+    def take(self, store: dict, phase: str, key):
+        """Retire et renvoie la future de `phase` si elle correspond à `key` (terminée ou encore en cours)."""
+        current = store.get(phase)
+        if not current: return None
+        if current[0] != key:
+            self.discard(store, phase)
+            return None
+        del store[phase]
+        if not current[1].running() and not current[1].done():  # pas encore parti : génération normale, sans attendre
+            current[1].cancel()
+            self._count("discarded")
+            return None
+        if current[1].done() and current[1].exception() is not None:
+            self._count("discarded")
+            return None
+        self._count("used")
+        return current[1]
+
+    def discard(self, store: dict, phase: str = None):
+        """Annule (ou ignore si déjà lancé) le préchargement d'une phase, ou de toutes."""
+        for p in ([phase] if phase else list(store)):
+            current = store.pop(p, None)
+            if current:
+                current[1].cancel()
+                self._count("discarded")
+
+    def _count(self, name):
+        with self._lock: self.counters[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock: return dict(self.counters)
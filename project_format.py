@@ -0,0 +1,122 @@
+"""
+Format de sauvegarde des projets (.gpsp) : en-tête versionné + JSON compressé.
+    b"GPSP" | version (1 octet) | codec (1 octet : z=zstd, g=gzip, n=aucun) | charge utile
+La charge utile est {"kind": "beta" | "ancien", "data": {...}}.
+zstd si le module `zstandard` est installé, gzip sinon. Les anciens fichiers .json sont toujours acceptés.
+La lecture décompresse en flux avec un plafond de taille et ne garde que les champs connus, bien typés.
+"""
+import gzip
+import io
+import json
+
+MAGIC = b"GPSP"
+VERSION = 1
+MAX_BYTES = 5 * 1024 * 1024  # taille max une fois décompressé
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_READ_ERRORS = (OSError, EOFError, ValueError) + ((zstandard.ZstdError,) if zstandard else ())  # flux corrompu
+
+
+class ProjectFormatError(ValueError):
+    pass
+
+# Champs acceptés par type de projet : nom -> types autorisés
+FIELDS = {
+    "beta": {
+        "idea": (str,), "analysis": (str,), "pivots": (str,), "gps": (str,), "choice": (str, type(None)),
+        "models": (dict,),  # champ -> modèle qui l'a produit
+    },
+    "ancien": {
+        "step": (str,), "idee_initiale": (str,), "idee_validee": (str,), "input_idee": (str,),
+        "crash_test_result": (dict,), "phase_g_result": (dict,), "angles_selectionnes": (list,),
+        "phase_p_result": (dict,), "angle_choisi": (dict,), "phase_s_result": (dict,),
+    },
+}
+# Listes lues par l'UI : champ -> (clé de la liste dans le champ, None = le champ lui-même ; clés requises de chaque
+# élément -> types). Un champ dont une liste contient autre chose que ces objets est ignoré.
+_ANGLE = {"id": (int, str), "titre": (str,)}
+ITEMS = {
+    "ancien": {
+        "phase_g_result": ("angles", _ANGLE), "angles_selectionnes": (None, _ANGLE),
+        "phase_p_result": ("evaluations", {"id_option": (int, type(None))}), "phase_s_result": ("etapes_journalieres", {}),
+    },
+}
+# Étape -> données nécessaires pour l'afficher
+STEPS = {"crash_test": (), "generation": ("idee_validee",), "priorisation": ("angles_selectionnes",),
+         "sequencage": ("angle_choisi",)}
+
+# ==========================================
+# 1. ÉCRITURE
+# ==========================================
+
+def dump(kind: str, data: dict, codec: str = None) -> bytes:
+    """Sérialise un projet (appelé seulement quand l'utilisateur demande le téléchargement)."""
+    clean = validate(kind, data)
+    payload = json.dumps({"kind": kind, "data": clean}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    codec = codec or ("z" if zstandard else "g")
+    if codec == "z": body = zstandard.ZstdCompressor(level=10).compress(payload)
+    elif codec == "g": body = gzip.compress(payload, compresslevel=6)
+    else: body = payload
+    return MAGIC + bytes([VERSION]) + codec.encode() + body
+
+# ==========================================
+# 2. LECTURE
+# ==========================================
+
+def _read_capped(stream, limit=MAX_BYTES) -> bytes:
+    out = io.BytesIO()
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk: break
+        out.write(chunk)
+        if out.tell() > limit: raise ProjectFormatError("Fichier trop volumineux")
+    return out.getvalue()
+
+
+def load(fileobj, kind: str) -> dict:
+    """Lit un .gpsp ou un ancien .json et renvoie les données validées du projet."""
+    if hasattr(fileobj, "seek"): fileobj.seek(0)
+    head = fileobj.read(6)
+    if head[:4] == MAGIC:
+        if len(head) < 6: raise ProjectFormatError("Fichier tronqué")
+        if head[4] > VERSION: raise ProjectFormatError(f"Version {head[4]} non supportée")
+        codec = chr(head[5])
+        if codec == "z":
+            if zstandard is None: raise ProjectFormatError("Fichier zstd : installez le module zstandard")
+            stream = zstandard.ZstdDecompressor().stream_reader(fileobj)
+        elif codec == "g": stream = gzip.GzipFile(fileobj=fileobj)
+        elif codec == "n": stream = fileobj
+        else: raise ProjectFormatError(f"Compression inconnue : {codec}")
+        try: doc = json.loads(_read_capped(stream))
+        except _READ_ERRORS as e: raise ProjectFormatError(f"Fichier illisible : {e}")
+        if not isinstance(doc, dict): raise ProjectFormatError("Fichier illisible : objet attendu")
+        if doc.get("kind") != kind: raise ProjectFormatError("Ce fichier appartient à l'autre application")
+        return validate(kind, doc.get("data", {}))
+    # Ancien format JSON en clair
+    try: doc = json.loads(head + _read_capped(fileobj, MAX_BYTES - len(head)))
+    except ValueError as e: raise ProjectFormatError(f"JSON invalide : {e}")
+    if not isinstance(doc, dict): raise ProjectFormatError("JSON invalide : objet attendu")
+    return validate(kind, doc.get("data", {}) if kind == "beta" else doc)
+
+
+def validate(kind: str, data: dict) -> dict:
+    """Ne garde que les champs connus et correctement typés ; le reste est ignoré."""
+    if kind not in FIELDS: raise ProjectFormatError(f"Type de projet inconnu : {kind}")
+    if not isinstance(data, dict): raise ProjectFormatError("Données de projet invalides")
+    clean = {k: v for k, v in data.items() if k in FIELDS[kind] and isinstance(v, FIELDS[kind][k])}
+    for name, (key, required) in ITEMS.get(kind, {}).items():
+        if name in clean and not _items_ok(clean[name] if key is None else clean[name].get(key, []), required):
+            del clean[name]
+    if kind == "ancien":
+        step = clean.get("step")
+        if step not in STEPS or any(k not in clean for k in STEPS[step]): clean["step"] = "crash_test"
+    return clean
+
+
+def _items_ok(items, required) -> bool:
+    return isinstance(items, list) and all(
+        isinstance(item, dict) and all(isinstance(item.get(k), t) for k, t in required.items()) for item in items)
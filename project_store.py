@@ -0,0 +1,237 @@
+"""
+Sauvegarde des projets côté serveur, champ par champ (voir sql/projects.sql).
+    projects        index léger (id, owner, app, title, step, updated_at) : la liste « projets récents »
+                    se lit sans jamais charger les contenus
+    project_fields  une ligne par champ (project_id, name, value) : chaque phase n'écrit que ce qui a changé
+Backends : Supabase (prod), Postgres direct (instance locale de test), mémoire (dev).
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+INDEX_COLUMNS = "id, owner, app, title, step, updated_at"
+
+
+class ProjectAccessError(PermissionError):
+    """L'id existe déjà au nom d'un autre propriétaire : rien n'est écrit."""
+
+# ==========================================
+# 1. BACKENDS
+# ==========================================
+
+class MemoryProjectBackend:
+    """Remplaçant en mémoire (dev local), même comportement que les tables SQL."""
+    def __init__(self):
+        self.projects = {}
+        self.fields = {}   # project_id -> {nom: valeur}
+        self._lock = threading.Lock()
+
+    def upsert_project(self, row) -> bool:
+        with self._lock:
+            current = self.projects.get(row["id"])
+            if current and current["owner"] != row["owner"]: return False
+            self.projects[row["id"]] = {**(current or {}), **row}
+            return True
+
+    def put_fields(self, project_id, values):
+        with self._lock: self.fields.setdefault(project_id, {}).update(values)
+
+    def get_project(self, project_id):
+        with self._lock: return dict(self.projects[project_id]) if project_id in self.projects else None
+
+    def list_projects(self, owner, app, offset, limit):
+        with self._lock:
+            rows = [dict(r) for r in self.projects.values() if r["owner"] == owner and r["app"] == app]
+        rows.sort(key=lambda r: r["updated_at"], reverse=True)
+        return rows[offset:offset + limit]
+
+    def get_fields(self, project_id):
+        with self._lock: return dict(self.fields.get(project_id, {}))
+
+    def delete_project(self, project_id):
+        with self._lock:
+            self.projects.pop(project_id, None)
+            self.fields.pop(project_id, None)
+
+
+class SupabaseProjectBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def upsert_project(self, row) -> bool:
+        # L'upsert REST ne prend pas de condition : le déclencheur projects_owner_guard (sql/projects.sql)
+        # refuse la mise à jour d'une ligne d'un autre propriétaire (code 42501)
+        try:
+            self.client.table("projects").upsert(row).execute()
+        except Exception as e:
+            if getattr(e, "code", None) == "42501": return False
+            raise
+        return True
+
+    def put_fields(self, project_id, values):
+        rows = [{"project_id": project_id, "name": k, "value": v, "updated_at": _now()} for k, v in values.items()]
+        self.client.table("project_fields").upsert(rows, on_conflict="project_id,name").execute()
+
+    def get_project(self, project_id):
+        res = self.client.table("projects").select(INDEX_COLUMNS).eq("id", project_id).execute()
+        return res.data[0] if res.data else None
+
+    def list_projects(self, owner, app, offset, limit):
+        res = (self.client.table("projects").select(INDEX_COLUMNS).eq("owner", owner).eq("app", app)
+               .order("updated_at", desc=True).range(offset, offset + limit - 1).execute())
+        return res.data or []
+
+    def get_fields(self, project_id):
+        res = self.client.table("project_fields").select("name, value").eq("project_id", project_id).execute()
+        return {r["name"]: r["value"] for r in res.data or []}
+
+    def delete_project(self, project_id):
+        self.client.table("projects").delete().eq("id", project_id).execute()  # champs : on delete cascade
+
+
+class PostgresProjectBackend:
+    """Postgres direct (instance locale de test), mêmes tables que Supabase."""
+    def __init__(self, dsn):
+        import psycopg  # optionnel : uniquement pour ce backend
+        from psycopg.types.json import Jsonb
+        self._jsonb = Jsonb
+        self._conn = psycopg.connect(dsn, autocommit=True)
+        self._lock = threading.Lock()
+
+    def _rows(self, sql, params):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            cols = [c.name for c in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def upsert_project(self, row) -> bool:
+        cols = list(row)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != "id")
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT INTO projects ({', '.join(cols)}) VALUES ({', '.join(['%s'] * len(cols))}) "
+                f"ON CONFLICT (id) DO UPDATE SET {updates} WHERE projects.owner = excluded.owner RETURNING id",
+                [row[c] for c in cols])
+            return cur.fetchone() is not None  # aucune ligne : l'id appartient à un autre propriétaire
+
+    def put_fields(self, project_id, values):
+        with self._lock, self._conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO project_fields (project_id, name, value, updated_at) VALUES (%s, %s, %s, now()) "
+                "ON CONFLICT (project_id, name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(project_id, k, self._jsonb(v)) for k, v in values.items()])
+
+    def get_project(self, project_id):
+        rows = self._rows(f"SELECT {INDEX_COLUMNS} FROM projects WHERE id = %s", (project_id,))
+        return rows[0] if rows else None
+
+    def list_projects(self, owner, app, offset, limit):
+        return self._rows(f"SELECT {INDEX_COLUMNS} FROM projects WHERE owner = %s AND app = %s "
+                          "ORDER BY updated_at DESC OFFSET %s LIMIT %s", (owner, app, offset, limit))
+
+    def get_fields(self, project_id):
+        return {r["name"]: r["value"] for r in self._rows(
+            "SELECT name, value FROM project_fields WHERE project_id = %s", (project_id,))}
+
+    def delete_project(self, project_id):
+        with self._lock: self._conn.execute("DELETE FROM projects WHERE id = %s", (project_id,))
+
+
+def build_backend(kind: str, client=None, dsn: str = None):
+    if kind == "postgres": return PostgresProjectBackend(dsn)
+    if kind == "memory": return MemoryProjectBackend()
+    return SupabaseProjectBackend(client)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+# ==========================================
+# 2. STORE
+# ==========================================
+
+class ProjectStore:
+    def __init__(self, backend, page_size: int = 8, index_ttl: float = 60):
+        self.backend = backend
+        self.page_size = page_size
+        self.index_ttl = index_ttl
+        self._pages = {}   # (owner, app, page) -> (lignes, encore, horodatage)
+        self._lock = threading.Lock()
+        self.counters = {"field_writes": 0, "index_reads": 0, "index_hits": 0, "loads": 0}
+
+    @staticmethod
+    def new_id() -> str:
+        return str(uuid.uuid4())
+
+    def save(self, owner: str, app: str, project_id: str, fields: dict, title: str = None, step: str = None):
+        """Écrit seulement `fields` (les champs qui viennent de changer) et rafraîchit la ligne d'index.
+        ProjectAccessError si `project_id` appartient à un autre propriétaire."""
+        row = {"id": project_id, "owner": owner, "app": app, "updated_at": _now()}
+        if title is not None: row["title"] = title[:120]
+        if step is not None: row["step"] = step
+        if not self.backend.upsert_project(row): raise ProjectAccessError(f"Projet {project_id} : accès refusé")
+        if fields: self.backend.put_fields(project_id, fields)
+        with self._lock:
+            self.counters["field_writes"] += len(fields)
+            for k in [k for k in self._pages if k[:2] == (owner, app)]: del self._pages[k]
+
+    def recent(self, owner: str, app: str, page: int = 0):
+        """Une page de l'index (sans contenus) ; renvoie (lignes, il_y_a_une_page_suivante)."""
+        key = (owner, app, page)
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached and time.monotonic() - cached[2] < self.index_ttl:
+                self.counters["index_hits"] += 1
+                return cached[0], cached[1]
+        rows = self.backend.list_projects(owner, app, page * self.page_size, self.page_size + 1)
+        more, rows = len(rows) > self.page_size, rows[:self.page_size]
+        with self._lock:
+            self.counters["index_reads"] += 1
+            self._pages[key] = (rows, more, time.monotonic())
+        return rows, more
+
+    def load(self, owner: str, project_id: str) -> dict:
+        """Contenu complet d'un projet, chargé seulement à l'ouverture. {} s'il n'appartient pas à `owner`."""
+        meta = self.backend.get_project(project_id)
+        if not meta or meta.get("owner") != owner: return {}
+        with self._lock: self.counters["loads"] += 1
+        return self.backend.get_fields(project_id)
+
+    def delete(self, owner: str, project_id: str):
+        meta = self.backend.get_project(project_id)
+        if not meta or meta.get("owner") != owner: return
+        self.backend.delete_project(project_id)
+        with self._lock:
+            for k in [k for k in self._pages if k[0] == owner]: del self._pages[k]
+
+    def stats(self) -> dict:
+        with self._lock: return dict(self.counters)
+
+# ==========================================
+# 3. UI (liste paginée)
+# ==========================================
+
+def render_recent_projects(st, store: ProjectStore, owner: str, app: str, on_open, current_id=None, rerun_scope="app"):
+    """Liste « projets récents » (à appeler dans `with st.sidebar:`). Pagination gardée dans st.session_state ;
+    `rerun_scope="fragment"` si la liste est dans un fragment : changer de page ne relance alors que lui."""
+    page_key = f"recent_page_{app}"
+    page = st.session_state.get(page_key, 0)
+    with st.expander("📁 Projets récents"):
+        try:
+            rows, more = store.recent(owner, app, page)
+        except Exception as e:
+            st.caption(f"Historique indisponible : {e}")
+            return
+        if not rows: st.caption("Aucun projet sauvegardé.")
+        for r in rows:
+            when = str(r.get("updated_at") or "")[:16].replace("T", " ")
+            label = f"{'▶ ' if r['id'] == current_id else ''}{r.get('title') or 'Sans titre'} · {when}"
+            if st.button(label, key=f"open_{app}_{r['id']}", use_container_width=True): on_open(r["id"])
+        c1, c2 = st.columns(2)
+        if page > 0 and c1.button("⬅️", key=f"{page_key}_prev"):
+            st.session_state[page_key] = page - 1
+            st.rerun(scope=rerun_scope)
+        if more and c2.button("➡️", key=f"{page_key}_next"):
+            st.session_state[page_key] = page + 1
+            st.rerun(scope=rerun_scope)
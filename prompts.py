@@ -0,0 +1,7 @@
+"""
+Prompts Gemini de beta_app.py, partagés avec le mode batch (batch.py).
+Toute modification change les clés du cache IA (llm_cache.cache_key inclut le template).
+"""
+PROMPT_ANALYSE = "Analyse critique business: {idea}"
+PROMPT_PIVOTS = "3 Pivots business pour: {idea}"
+PROMPT_GPS = "Plan d'action opérationnel (GPS) pour: {idea} ({choice})"
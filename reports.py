@@ -0,0 +1,221 @@
+"""
+Rapports PDF (fpdf2) rendus en tâche de fond.
+- Pool de threads partagé par le process : la session Streamlit ne bloque jamais pendant le rendu.
+- Un PDF est identifié par l'empreinte de son contenu : un projet inchangé n'est jamais re-rendu,
+  et deux demandes identiques (autre onglet, autre session) partagent le même rendu.
+- Les PDF finis sont écrits sur disque (.cache/reports) et servis depuis le fichier, jamais gardés en session.
+- Police TTF résolue une fois pour tout le process, gabarit de mise en page partagé,
+  markdown découpé en blocs avec un cache LRU.
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_DIR = os.path.join(".cache", "reports")
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+)
+
+# Gabarit commun aux deux apps (tailles en pt, marges en mm)
+LAYOUT = {"margin": 15, "title": 20, "h1": 15, "h2": 13, "h3": 12, "body": 10.5, "line": 5.5}
+
+# ==========================================
+# 1. POLICE & MARKDOWN
+# ==========================================
+
+@functools.lru_cache(maxsize=None)
+def resolve_font(path: str = None):
+    """(régulier, gras) d'une police TTF unicode, ou None : on retombe alors sur Helvetica (latin-1)."""
+    for candidate in ([path] if path else []) + list(FONT_CANDIDATES):
+        if candidate and os.path.exists(candidate):
+            bold = candidate.replace(".ttf", "-Bold.ttf")
+            return candidate, bold if os.path.exists(bold) else candidate
+    return None
+
+
+@functools.lru_cache(maxsize=512)
+def parse_markdown(text: str) -> tuple:
+    """Découpe le markdown des réponses IA en blocs (type, texte) ; gras / italique laissés en ligne."""
+    blocks = []
+    for line in text.splitlines():
+        s = line.strip()
+        if not s:
+            if blocks and blocks[-1][0] != "space": blocks.append(("space", ""))
+            continue
+        if re.fullmatch(r"[-*_]{3,}", s): blocks.append(("rule", "")); continue
+        m = re.match(r"(#{1,6})\s+(.*)", s)
+        if m: blocks.append((f"h{min(len(m.group(1)), 3)}", _inline(m.group(2)).replace("**", ""))); continue
+        m = re.match(r"(?:[-*+•]|\d+[.)])\s+(.*)", s)
+        if m: blocks.append(("bullet", _inline(m.group(1)))); continue
+        blocks.append(("p", _inline(s)))
+    return tuple(blocks)
+
+
+def _inline(text):
+    # Syntaxe « markdown » de fpdf2 : **gras**, __italique__, --souligné--
+    text = re.sub(r"-{2,}", "-", text)
+    text = re.sub(r"(?<![*\w])\*(?!\*)([^*]+)\*(?!\*)", r"__\1__", text)
+    return text.replace("`", "")
+
+# ==========================================
+# 2. CONTENU DES RAPPORTS
+# ==========================================
+
+def beta_sections(project: dict) -> list:
+    sections = [("Idée", project.get("idea", ""))]
+    if project.get("analysis"): sections.append(("1. Analyse crash-test", project["analysis"]))
+    if project.get("pivots"): sections.append(("2. Pivots", project["pivots"]))
+    if project.get("gps"):
+        sections.append((f"3. GPS{' : ' + project['choice'] if project.get('choice') else ''}", project["gps"]))
+    return sections
+
+
+def ancien_sections(state: dict) -> list:
+    sections = [("Idée", state.get("idee_validee") or state.get("idee_initiale", ""))]
+    crash = state.get("crash_test_result") or {}
+    if crash and not crash.get("error"):
+        sections.append(("Phase 0 : Crash test D.U.R", "\n".join([
+            f"**Douleur** {crash.get('score_D', 0)}/10 · **Urgence** {crash.get('score_U', 0)}/10 · "
+            f"**Reconnu** {crash.get('score_R', 0)}/10 · **Verdict** {crash.get('verdict', '')}",
+            "", str(crash.get("analyse_critique", "")), "", f"**Conseil** : {crash.get('conseil_architecte', '')}"])))
+    angles = state.get("angles_selectionnes") or []
+    if angles:
+        sections.append(("Phase G : Angles retenus", "\n".join(
+            f"- **{a.get('titre')}** ({a.get('cible_precise', '')}) : {a.get('opportunite', '')}" for a in angles)))
+    prio = state.get("phase_p_result") or {}
+    if prio.get("evaluations"):
+        lines = []
+        for e in prio["evaluations"]:
+            idx = e.get("id_option", 1) - 1
+            titre = angles[idx].get("titre") if 0 <= idx < len(angles) else f"Option {e.get('id_option')}"
+            lines.append(f"- **{titre}** : {e.get('score_total_pondere', 0)} points")
+        reco = prio.get("recommandation") or {}
+        if reco.get("raison"): lines += ["", f"**Recommandation** : {reco['raison']}"]
+        sections.append(("Phase P : Priorisation", "\n".join(lines)))
+    plan = state.get("phase_s_result") or {}
+    if plan and not plan.get("error"):
+        titre = (state.get("angle_choisi") or {}).get("titre", "")
+        lines = [f"**Objectif J+7** : {plan.get('resultat_j7', '')}", ""]
+        for j in plan.get("etapes_journalieres", []):
+            lines += [f"### {j.get('jour')} : {j.get('action_principale')}", str(j.get("detail_execution", ""))]
+        sections.append((f"Phase S : Plan{' - ' + titre if titre else ''}", "\n".join(lines)))
+    return sections
+
+
+def report_key(title: str, sections: list) -> str:
+    payload = json.dumps([title, sections], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ==========================================
+# 3. RENDU
+# ==========================================
+
+def render_pdf(title: str, sections: list, path: str, font: tuple = None):
+    """Écrit le PDF dans `path` (via un fichier temporaire : jamais de PDF à moitié écrit servi)."""
+    from fpdf import FPDF  # importé dans le thread de rendu : le chargement de la page n'en dépend pas
+
+    pdf = FPDF(format="A4")
+    pdf.set_margins(LAYOUT["margin"], LAYOUT["margin"])
+    pdf.set_auto_page_break(True, margin=LAYOUT["margin"])
+    if font:
+        for style, fname in (("", font[0]), ("B", font[1]), ("I", font[0]), ("BI", font[1])):
+            pdf.add_font("Report", style, fname)
+        family, clean = "Report", str
+    else:
+        family, clean = "Helvetica", lambda s: str(s).encode("latin-1", "replace").decode("latin-1")
+    pdf.set_title(clean(title))
+    pdf.add_page()
+    pdf.set_font(family, "B", LAYOUT["title"])
+    pdf.multi_cell(0, LAYOUT["title"] / 2, clean(title), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    for heading, body in sections:
+        pdf.set_font(family, "B", LAYOUT["h1"])
+        pdf.multi_cell(0, LAYOUT["line"] + 2, clean(heading), new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(1)
+        for kind, text in parse_markdown(str(body or "")):
+            if kind == "space": pdf.ln(2); continue
+            if kind == "rule":
+                pdf.line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y()); pdf.ln(2); continue
+            if kind in ("h2", "h3", "h1"):
+                pdf.set_font(family, "B", LAYOUT[kind if kind != "h1" else "h2"])
+                pdf.multi_cell(0, LAYOUT["line"] + 1, clean(text), new_x="LMARGIN", new_y="NEXT")
+                continue
+            pdf.set_font(family, "", LAYOUT["body"])
+            if kind == "bullet":
+                pdf.set_x(pdf.l_margin + 4)
+                text = "• " + text if font else "- " + text
+            pdf.multi_cell(0, LAYOUT["line"], clean(text), markdown=True, new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(4)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    pdf.output(tmp)
+    os.replace(tmp, path)
+
+
+class ReportEngine:
+    def __init__(self, directory: str = DEFAULT_DIR, max_workers: int = 2, max_files: int = 500, font: str = None):
+        self.directory = directory
+        self.max_files = max_files
+        self.font = resolve_font(font)
+        os.makedirs(directory, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._jobs = {}   # clé -> future du rendu en cours / terminé
+        self._lock = threading.Lock()
+        self.counters = {"renders": 0, "reused": 0, "errors": 0}
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def submit(self, key: str, title: str, sections: list):
+        """Lance le rendu en fond, sauf si ce contenu est déjà rendu ou en cours de rendu."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if os.path.exists(self.path(key)) or (job and not job.done()):
+                self.counters["reused"] += 1
+                return
+            self._jobs[key] = self._pool.submit(self._render, key, title, sections)
+
+    def _render(self, key, title, sections):
+        try:
+            render_pdf(title, sections, self.path(key), self.font)
+        except Exception:
+            with self._lock: self.counters["errors"] += 1
+            raise
+        with self._lock: self.counters["renders"] += 1
+        self._prune()
+
+    def status(self, key: str):
+        """'ready' | 'pending' | 'error' | None (jamais demandé)."""
+        if os.path.exists(self.path(key)): return "ready"
+        with self._lock: job = self._jobs.get(key)
+        if job is None: return None
+        if not job.done(): return "pending"
+        return "error" if job.exception() is not None else "ready"
+
+    def read(self, key: str, title: str, sections):
+        """Octets du PDF prêt, lus en entier (aucun fichier laissé ouvert d'un rerun à l'autre), pour st.download_button.
+        None s'il a été élagué depuis status() : le rendu est relancé (`sections` : liste, ou fonction qui la construit)."""
+        try:
+            with open(self.path(key), "rb") as fh: return fh.read()
+        except FileNotFoundError:
+            self.submit(key, title, sections() if callable(sections) else sections)
+            return None
+
+    def _prune(self):
+        """Garde les `max_files` PDF les plus récents ; oublie les rendus terminés."""
+        with self._lock:
+            for k in [k for k, job in self._jobs.items() if job.done() and job.exception() is None]: del self._jobs[k]
+        files = sorted((e for e in os.scandir(self.directory) if e.name.endswith(".pdf")),
+                       key=lambda e: e.stat().st_mtime, reverse=True)
+        for e in files[self.max_files:]:
+            try: os.remove(e.path)
+            except OSError: pass
+
+    def stats(self) -> dict:
+        with self._lock: return {**self.counters, "pending": sum(not j.done() for j in self._jobs.values())}
@@ -0,0 +1,92 @@
+"""
+Clients externes partagés par tout le process Streamlit (Supabase, Gemini, OpenAI).
+Créés une seule fois puis réutilisés à chaque rerun et par toutes les sessions :
+les connexions HTTP (keep-alive) et le canal gRPC de Gemini restent ouverts.
+Les appels IA passent par llm_provider.LLMClient (délais, reprises, disjoncteur, repli).
+Les SDK (supabase, openai, google.generativeai) ne sont importés qu'au premier client construit ;
+warm_up() les charge en fond une fois la première page affichée.
+"""
+import asyncio
+import importlib
+import threading
+import streamlit as st
+from tracing import span
+
+HTTP_LIMITS = {"max_connections": 100, "max_keepalive_connections": 20, "keepalive_expiry": 60}
+
+
+@st.cache_resource
+def get_supabase(url: str, key: str):
+    from supabase import create_client
+    return create_client(url, key)
+
+
+@st.cache_resource
+def get_gemini_llm(api_key: str, model: str, fallback: str = None, endpoint: str = None, timeout: float = 90):
+    from llm_provider import GeminiProvider, LLMClient
+    provider = GeminiProvider(api_key, endpoint)
+    return LLMClient([(provider, model)] + ([(provider, fallback)] if fallback else []), timeout=timeout)
+
+
+@st.cache_resource
+def get_http_client():
+    import httpx
+    return httpx.Client(limits=httpx.Limits(**HTTP_LIMITS), timeout=httpx.Timeout(120, connect=10))
+
+
+@st.cache_resource(max_entries=200)
+def get_openai_client(api_key: str, base_url: str = None):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=get_http_client(), max_retries=0)
+
+
+class BackgroundLoop:
+    """Boucle asyncio permanente dans un thread : les clients async y gardent leurs connexions
+    d'un rerun à l'autre, et les coroutines soumises renvoient des futures utilisables depuis Streamlit."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+@st.cache_resource
+def get_background_loop():
+    return BackgroundLoop()
+
+
+@st.cache_resource(max_entries=200)
+def get_async_openai_client(api_key: str, base_url: str = None):
+    import httpx
+    from openai import AsyncOpenAI
+    http_client = httpx.AsyncClient(limits=httpx.Limits(**HTTP_LIMITS), timeout=httpx.Timeout(120, connect=10))
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+@st.cache_resource(max_entries=200)
+def get_openai_llm(api_key: str, model: str, fallback: str = None, base_url: str = None, timeout: float = 90):
+    from llm_provider import OpenAIProvider, LLMClient
+    provider = OpenAIProvider(client=get_openai_client(api_key, base_url),
+                              async_client=get_async_openai_client(api_key, base_url))
+    return LLMClient([(provider, model)] + ([(provider, fallback)] if fallback and fallback != model else []), timeout=timeout)
+
+
+_warmed = set()
+_warmed_lock = threading.Lock()
+
+def warm_up(*modules):
+    """Importe en fond, une fois par process, les SDK dont la suite aura besoin.
+    À appeler après le premier affichage : la page n'attend jamais ces imports."""
+    with _warmed_lock:
+        todo = [m for m in modules if m not in _warmed]
+        _warmed.update(todo)
+    if not todo: return
+
+    def run():
+        for name in todo:
+            try:
+                with span(f"warmup.{name}"): importlib.import_module(name)
+            except Exception: pass  # SDK absent ou cassé : l'erreur remontera au premier vrai appel
+    threading.Thread(target=run, name="warmup", daemon=True).start()
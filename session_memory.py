@@ -0,0 +1,182 @@
+"""
+Budget mémoire par session Streamlit (plusieurs centaines de sessions par conteneur).
+- Mesure : taille en mémoire de st.session_state (dict / listes / tuples parcourus, objets partagés comptés une fois),
+  relevée à la fin de chaque exécution complète du script.
+- Budget : au-delà de `budget` octets, les champs volumineux déversables (résultats des phases, rapports) sont écrits
+  sur disque (pickle, un fichier par champ) et remplacés en session par un marqueur `Spilled`, du plus froid au plus
+  chaud : d'abord ceux que la page courante n'affiche pas, dans l'ordre donné (les plus anciennes phases d'abord),
+  puis `shed()` libère ce qui se recalcule (artefacts dérivés, export), enfin les champs de la page courante.
+- Réhydratation à la demande : `rehydrate()` remet en place les seules valeurs que la page (ou un fragment) va lire.
+  Le fichier est gardé : une valeur relue puis déversée de nouveau sans avoir changé reprend son marqueur, sans
+  nouvelle écriture. `source()` donne une clé de cache (derived.DerivedCache) identique, champ déversé ou non.
+- Totaux du process (toutes sessions) : `totals()`, affiché dans le panneau admin.
+Les fichiers d'une session disparaissent avec `forget()` (reset, déconnexion) ou après `idle` secondes sans activité.
+"""
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+
+DEFAULT_DIR = os.path.join(".cache", "spill")
+
+
+class Spilled:
+    """Marqueur laissé en session à la place d'un champ écrit sur disque ; vrai comme le champ qu'il remplace."""
+    __slots__ = ("path", "size")
+
+    def __init__(self, path: str, size: int):
+        self.path, self.size = path, size
+
+    def __bool__(self): return True
+
+    def __repr__(self): return f"Spilled({os.path.basename(self.path)}, {self.size} o)"
+
+
+def deep_size(value, seen: set = None) -> int:
+    """Taille en mémoire (octets) ; un objet déjà vu (`seen`) n'est pas recompté.
+    Les objets qui tiennent leur propre compte exposent `memory_bytes()` (ex. derived.DerivedCache)."""
+    seen = set() if seen is None else seen
+    if id(value) in seen: return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict): size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)): size += sum(deep_size(v, seen) for v in value)
+    elif hasattr(value, "memory_bytes"): size += value.memory_bytes()
+    return size
+
+
+def rss_bytes() -> int:
+    """Mémoire résidente du process (Linux : /proc ; ailleurs : pic, via resource)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"): return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryBudget:
+    def __init__(self, directory: str = DEFAULT_DIR, budget: int = 256 * 1024, min_field: int = 2048,
+                 idle: float = 6 * 3600):
+        self.directory = directory
+        self.budget = budget          # octets par session (0 : mesure seulement)
+        self.min_field = min_field    # un champ plus petit n'est pas déversé (le fichier coûterait plus qu'il ne libère)
+        self.idle = idle
+        self._sessions = {}           # id de session -> dernier relevé
+        self._loaded = {}             # chemin -> (valeur relue, son marqueur) tant que la valeur est en session
+        self._lock = threading.Lock()
+        self.counters = {"spills": 0, "reused": 0, "rehydrations": 0, "sheds": 0, "pruned": 0}
+
+    def _path(self, sid, key):
+        return os.path.join(self.directory, sid, f"{key}.pkl")
+
+    # --- Réhydratation ---
+    def rehydrate(self, fields, keys=None) -> int:
+        """Remet en place les champs déversés parmi `keys` (tous par défaut) ; renvoie le nombre relus."""
+        restored = 0
+        for key in list(fields.keys() if keys is None else keys):
+            marker = fields.get(key)
+            if not isinstance(marker, Spilled): continue
+            with open(marker.path, "rb") as fh: fields[key] = pickle.load(fh)
+            with self._lock: self._loaded[marker.path] = (fields[key], marker)
+            restored += 1
+        if restored:
+            with self._lock: self.counters["rehydrations"] += restored
+        return restored
+
+    def source(self, sid, fields, key):
+        """Le champ tel qu'une clé de cache dérivé doit le voir : son marqueur s'il est déversé ou relu sans changement
+        depuis (la clé ne change pas au gré des déversements), la valeur sinon. Ne lit jamais le disque."""
+        value = fields.get(key)
+        if isinstance(value, Spilled): return value
+        with self._lock: loaded = self._loaded.get(self._path(sid, key))
+        return loaded[1] if loaded and loaded[0] is value else value
+
+    # --- Budget ---
+    def enforce(self, sid: str, state, fields=None, spillable=(), keep=(), shed=None) -> dict:
+        """À la fin d'une exécution : mesure `state` (toute la session) et, au-delà du budget, déverse les champs
+        `spillable` de `fields` (st.session_state par défaut, ou un sous-dict comme le projet de beta_app)."""
+        fields = state if fields is None else fields
+        self._drop_changed(sid, fields, spillable)
+        total = self.measure(state)
+        if self.budget and total > self.budget:
+            total = self._spill_until(sid, state, fields, [k for k in spillable if k not in keep], total)
+        if self.budget and total > self.budget and shed is not None:
+            shed()
+            with self._lock: self.counters["sheds"] += 1
+            total = self.measure(state)
+        if self.budget and total > self.budget:  # en dernier recours, ce que la page affiche (relu à la prochaine exécution)
+            total = self._spill_until(sid, state, fields, [k for k in spillable if k in keep], total)
+        markers = [v for v in fields.values() if isinstance(v, Spilled)]
+        record = {"bytes": total, "spilled": len(markers), "disk": sum(m.size for m in markers), "at": time.time()}
+        with self._lock: self._sessions[sid] = record
+        self.prune()
+        return record
+
+    def measure(self, state) -> int:
+        seen = set()
+        return sum(deep_size(value, seen) for value in list(state.values()))
+
+    def _spill_until(self, sid, state, fields, keys, total):
+        for key in keys:
+            value = fields.get(key)
+            if value is None or isinstance(value, Spilled) or deep_size(value) < self.min_field: continue
+            self._spill(sid, fields, key, value)
+            total = self.measure(state)  # une valeur encore référencée ailleurs ne libère rien
+            if total <= self.budget: break
+        return total
+
+    def _drop_changed(self, sid, fields, keys):
+        """Oublie les valeurs relues qui ne sont plus en session (remplacées) : leur fichier sera réécrit."""
+        with self._lock:
+            for key in keys:
+                path = self._path(sid, key)
+                if path in self._loaded and self._loaded[path][0] is not fields.get(key): del self._loaded[path]
+
+    def _spill(self, sid, fields, key, value):
+        path = self._path(sid, key)
+        with self._lock: loaded = self._loaded.pop(path, None)
+        if loaded and loaded[0] is value and os.path.exists(path):  # relue et inchangée : le fichier est à jour
+            fields[key] = loaded[1]
+            with self._lock: self.counters["reused"] += 1
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as fh: pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        fields[key] = Spilled(path, os.path.getsize(path))
+        with self._lock: self.counters["spills"] += 1
+
+    # --- Fin de session ---
+    def forget(self, sid: str):
+        """Reset / déconnexion : fichiers et relevé de la session supprimés."""
+        with self._lock:
+            self._sessions.pop(sid, None)
+            self._forget_loaded([sid])
+        shutil.rmtree(os.path.join(self.directory, sid), ignore_errors=True)
+
+    def prune(self):
+        """Sessions fermées (sans activité depuis `idle` s) : relevé et fichiers supprimés."""
+        limit = time.time() - self.idle
+        with self._lock:
+            gone = [sid for sid, r in self._sessions.items() if r["at"] < limit]
+            for sid in gone: del self._sessions[sid]
+            self._forget_loaded(gone)
+            self.counters["pruned"] += len(gone)
+        for sid in gone: shutil.rmtree(os.path.join(self.directory, sid), ignore_errors=True)
+
+    def _forget_loaded(self, sids):
+        dirs = {os.path.join(self.directory, sid) for sid in sids}
+        for path in [p for p in self._loaded if os.path.dirname(p) in dirs]: del self._loaded[path]
+
+    def totals(self) -> dict:
+        with self._lock: sessions, counters = list(self._sessions.values()), dict(self.counters)
+        sizes = [r["bytes"] for r in sessions]
+        return {"sessions": len(sessions), "bytes": sum(sizes), "max_bytes": max(sizes, default=0),
+                "over_budget": sum(1 for s in sizes if self.budget and s > self.budget),
+                "spilled_fields": sum(r["spilled"] for r in sessions), "disk_bytes": sum(r["disk"] for r in sessions),
+                "rss_bytes": rss_bytes(), **counters}
@@ -0,0 +1,94 @@
+"""
+Regroupement des générations identiques en cours (« single-flight »), pour tout le process.
+Le premier appelant (meneur) fait l'appel IA ; ceux qui arrivent pendant ce temps avec la même clé
+(modèle + prompt normalisé) attendent sa future au lieu de relancer un appel complet.
+Chaque appelant reçoit le résultat et gère lui-même ses crédits, comme s'il avait fait l'appel.
+Si le meneur est interrompu (rerun Streamlit, annulation), les suivants relancent eux-mêmes.
+"""
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+from llm_cache import normalize_input
+
+
+class _Abandoned(Exception):
+    """Le meneur a été interrompu sans résultat : la demande est à refaire."""
+
+
+def flight_key(model: str, *parts, scope: str = "") -> str:
+    """`scope` sépare les clés API : on ne partage jamais une réponse payée par la clé d'un autre visiteur."""
+    payload = "\x1f".join([scope, model] + [normalize_input(p) for p in parts])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.counters = {"leaders": 0, "coalesced": 0, "abandoned": 0}
+
+    def _join(self, key):
+        """(future, True) pour le meneur, (future existante, False) pour un appel regroupé."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future, False
+            future = self._flights[key] = Future()
+            self.counters["leaders"] += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is future: del self._flights[key]
+            if isinstance(error, _Abandoned): self.counters["abandoned"] += 1
+        if error is not None: future.set_exception(error)
+        else: future.set_result(result)
+
+    def in_flight(self, key) -> bool:
+        with self._lock: return key in self._flights
+
+    def do(self, key, fn):
+        """Exécute `fn()` une seule fois pour tous les appels simultanés de même clé ; renvoie (résultat, regroupé)."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try: return future.result(), True
+                except _Abandoned: continue
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(key, future, error=e)
+                raise
+            except BaseException:  # arrêt / rerun Streamlit : les suivants reprennent la main
+                self._finish(key, future, error=_Abandoned())
+                raise
+            self._finish(key, future, result)
+            return result, False
+
+    async def ado(self, key, coro_fn):
+        """Version coroutine de `do` ; partage les mêmes vols que les appels bloquants."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                # shield : annuler un suivant ne doit pas annuler la future des autres
+                try: return await asyncio.shield(asyncio.wrap_future(future)), True
+                except _Abandoned: continue
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                self._finish(key, future, error=e)
+                raise
+            except BaseException:
+                self._finish(key, future, error=_Abandoned())
+                raise
+            self._finish(key, future, result)
+            return result, False
+
+    def stats(self) -> dict:
+        with self._lock: return {**self.counters, "in_flight": len(self._flights)}
+
+
+flights = SingleFlight()
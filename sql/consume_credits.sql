@@ -0,0 +1,13 @@
+-- Débit atomique et conditionnel des crédits (appelé par credit_ledger.SupabaseLedgerBackend).
+-- Retourne le nouveau solde, ou NULL si le solde est insuffisant : jamais de solde négatif,
+-- jamais de mise à jour perdue entre deux onglets / deux workers.
+create or replace function consume_credits(p_email text, p_amount int default 1)
+returns int
+language sql
+as $$
+  update users
+     set credits = credits - p_amount
+   where email = p_email
+     and credits >= p_amount
+  returning credits;
+$$;
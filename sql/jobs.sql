@@ -0,0 +1,22 @@
+-- File des générations IA (utilisée par jobs.py avec JOB_STORE = "supabase").
+-- Un job passe queued -> running (pris une seule fois : update ... where status = 'queued')
+-- puis done | error. Les jobs terminés sont purgés après une semaine.
+create table if not exists jobs (
+  id          uuid primary key,
+  owner       text not null,             -- email (beta_app) ; ancien_app : empreinte de la clé API, ou "visitor:<id>" (clé du serveur)
+  app         text not null,             -- 'beta' | 'ancien'
+  kind        text not null,
+  key         text,                      -- même demande encore en cours = même job
+  status      text not null default 'queued',
+  payload     jsonb,
+  result      jsonb,
+  model       text,
+  error       text,
+  error_type  text,
+  attempts    integer not null default 0,
+  created_at  double precision not null,  -- epoch (s)
+  started_at  double precision,
+  finished_at double precision
+);
+create index if not exists jobs_active on jobs (owner, key, status);
+create index if not exists jobs_queued on jobs (status, created_at);
@@ -0,0 +1,11 @@
+-- Login en un seul aller-retour : crée l'utilisateur s'il n'existe pas, renvoie la ligne dans tous les cas.
+-- Nécessite une contrainte unique sur users.email.
+create or replace function login_user(p_email text, p_credits int default 2, p_access_code text default null)
+returns setof users
+language sql
+as $$
+  insert into users (email, credits, access_code)
+  values (p_email, p_credits, coalesce(p_access_code, gen_random_uuid()::text))
+  on conflict (email) do update set email = excluded.email
+  returning *;
+$$;
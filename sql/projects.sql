@@ -0,0 +1,39 @@
+-- Projets sauvegardés côté serveur (utilisé par project_store.py).
+-- `projects` est l'index léger lu par la liste « projets récents » ; les contenus vivent dans
+-- `project_fields`, une ligne par champ, pour que chaque phase n'écrive que ce qui a changé.
+create table if not exists projects (
+  id         uuid primary key,
+  owner      text not null,            -- email (beta_app) ; ancien_app : empreinte de la clé API, ou "visitor:<id>" (clé du serveur)
+  app        text not null,            -- 'beta' | 'ancien'
+  title      text,
+  step       text,
+  created_at timestamptz not null default now(),
+  updated_at timestamptz not null default now()
+);
+create index if not exists projects_owner_recent on projects (owner, app, updated_at desc);
+
+create table if not exists project_fields (
+  project_id uuid not null references projects (id) on delete cascade,
+  name       text not null,
+  value      jsonb,
+  updated_at timestamptz not null default now(),
+  primary key (project_id, name)
+);
+
+-- Un projet ne change jamais de propriétaire : l'upsert (id) d'un autre utilisateur est refusé
+-- (project_store.SupabaseProjectBackend lit le code 42501 ; le backend Postgres filtre déjà dans son upsert).
+create or replace function projects_owner_guard()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.owner is distinct from old.owner then
+    raise exception 'projet % : accès refusé', old.id using errcode = '42501';
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists projects_owner_guard on projects;
+create trigger projects_owner_guard before update on projects
+  for each row execute function projects_owner_guard();
@@ -0,0 +1,146 @@
+"""
+Budget de tokens des prompts : comptage local avant envoi, compactage / coupe des entrées trop longues,
+plafond de sortie par phase, et relevé de l'usage réel (renvoyé par le fournisseur) dans un store local.
+Comptage exact avec `tiktoken` s'il est installé, estimation (caractères / 3.5) sinon.
+"""
+import functools
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from llm_provider import on_usage
+
+CHARS_PER_TOKEN = 3.5
+ELLIPSIS = "\n[…]\n"
+
+# Phase -> (tokens max pour les champs saisis / injectés, tokens max en sortie)
+# Gemini 2.5 compte sa réflexion dans max_output_tokens : plafonds larges côté beta_app.
+BUDGETS = {
+    "analysis": (1000, 8192), "pivots": (1000, 8192), "gps": (1200, 8192),
+    "crash_test": (800, 700), "phase_g": (800, 2200), "phase_p": (900, 600), "phase_s": (400, 1800),
+    "fixup": (3000, 1500),
+}
+DEFAULT_BUDGET = (2000, 4096)
+
+
+def configure(overrides: dict = None):
+    """Surcharge des budgets, ex. secret TOKEN_BUDGETS = {phase_g = {input = 600, output = 1800}}."""
+    for phase, b in (overrides or {}).items():
+        current = BUDGETS.get(phase, DEFAULT_BUDGET)
+        BUDGETS[phase] = (int(b.get("input", current[0])), int(b.get("output", current[1])))
+
+# ==========================================
+# 1. COMPTAGE & COUPE
+# ==========================================
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try: return tiktoken.encoding_for_model(model or "gpt-4o")
+    except KeyError: return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    enc = _encoding(model) if model is None or model.startswith("gpt") else None
+    if enc is not None: return len(enc.encode(text))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def compact(text) -> str:
+    """Espaces et lignes vides en trop retirés (gratuit, sans perte de sens)."""
+    text = re.sub(r"[ \t]+", " ", str(text or ""))
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+def trim(text: str, budget: int, model: str = None) -> str:
+    """Garde le début (70 %) et la fin (30 %) d'un texte trop long pour tenir dans `budget` tokens."""
+    text = compact(text)
+    if count_tokens(text, model) <= budget: return text
+    enc = _encoding(model) if model is None or model.startswith("gpt") else None
+    if enc is not None:
+        ids = enc.encode(text)
+        head = int(budget * 0.7)
+        return enc.decode(ids[:head]) + ELLIPSIS + enc.decode(ids[-(budget - head):])
+    chars = int(budget * CHARS_PER_TOKEN)
+    head = int(chars * 0.7)
+    return text[:head] + ELLIPSIS + text[-(chars - head):]
+
+
+def output_cap(phase: str) -> int:
+    return BUDGETS.get(phase, DEFAULT_BUDGET)[1]
+
+
+def fit(phase: str, text: str, model: str = None) -> str:
+    """Message utilisateur d'une phase ramené à son budget d'entrée."""
+    return trim(text, BUDGETS.get(phase, DEFAULT_BUDGET)[0], model)
+
+
+def build_prompt(phase: str, template: str, fields: dict, model: str = None):
+    """(prompt, max_tokens) : chaque champ reçoit une part du budget d'entrée au prorata de sa taille."""
+    budget = BUDGETS.get(phase, DEFAULT_BUDGET)[0]
+    clean = {k: compact(v) for k, v in fields.items()}
+    sizes = {k: count_tokens(v, model) for k, v in clean.items()}
+    if sum(sizes.values()) > budget:
+        total = sum(sizes.values())
+        clean = {k: trim(v, max(16, budget * sizes[k] // total), model) for k, v in clean.items()}
+    return template.format(**clean), output_cap(phase)
+
+# ==========================================
+# 2. USAGE RÉEL (STORE LOCAL)
+# ==========================================
+
+class UsageStore:
+    """Écriture en tâche de fond (SQLite) : l'appel IA n'attend jamais le disque. Totaux en mémoire pour l'admin."""
+    def __init__(self, path: str = os.path.join(".cache", "usage.sqlite3"), batch: int = 50):
+        self.path = path
+        self.batch = batch
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.totals = {}   # phase -> {calls, input_tokens, output_tokens, prompt_chars}
+        threading.Thread(target=self._run, name="usage-store", daemon=True).start()
+
+    def record(self, phase=None, provider=None, model=None, usage=None, latency_ms=None, prompt_chars=0):
+        usage = usage or {}
+        phase = phase or "autre"
+        row = (time.time(), phase, provider, model, usage.get("input_tokens"), usage.get("output_tokens"),
+               prompt_chars, latency_ms)
+        with self._lock:
+            t = self.totals.setdefault(phase, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "prompt_chars": 0})
+            t["calls"] += 1
+            t["input_tokens"] += usage.get("input_tokens") or 0
+            t["output_tokens"] += usage.get("output_tokens") or 0
+            t["prompt_chars"] += prompt_chars
+        self._queue.put(row)
+
+    def _run(self):
+        if self.path != ":memory:": os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS usage (
+            ts REAL, phase TEXT, provider TEXT, model TEXT, input_tokens INTEGER, output_tokens INTEGER,
+            prompt_chars INTEGER, latency_ms REAL)""")
+        while True:
+            rows = [self._queue.get()]
+            while len(rows) < self.batch:
+                try: rows.append(self._queue.get_nowait())
+                except queue.Empty: break
+            try: conn.executemany("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error: pass  # télémétrie : jamais bloquante
+
+    def summary(self) -> dict:
+        """Par phase : appels, tokens moyens en entrée / sortie, caractères par token mesurés."""
+        with self._lock:
+            return {p: {"calls": t["calls"], "avg_in": round(t["input_tokens"] / t["calls"]),
+                        "avg_out": round(t["output_tokens"] / t["calls"]),
+                        "chars_per_token": round(t["prompt_chars"] / t["input_tokens"], 2) if t["input_tokens"] else None}
+                    for p, t in self.totals.items()}
+
+
+usage_store = UsageStore(os.environ.get("USAGE_DB", os.path.join(".cache", "usage.sqlite3")))
+on_usage(usage_store.record)
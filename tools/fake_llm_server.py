@@ -0,0 +1,154 @@
+"""
+Faux serveur HTTP local imitant l'API OpenAI (chat.completions) et l'API REST Gemini (generateContent).
+Sert à tester llm_provider (timeouts, reprises, disjoncteur, repli) et aux benchmarks, sans réseau.
+
+    python tools/fake_llm_server.py --port 8765 --latency 0.5 --fail-first 2 --fail-status 503
+
+OpenAI : OpenAIProvider(api_key="x", base_url="http://127.0.0.1:8765/v1")
+Gemini : GeminiProvider(api_key="x", endpoint="127.0.0.1:8765")  (transport REST)
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeConfig:
+    def __init__(self, latency=0.0, chunk_latency=0.0, fail_first=0, fail_status=503, payload_size=800,
+                 reply=None, fail_models=()):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.payload_size = payload_size
+        self.reply = reply
+        self.fail_models = set(fail_models)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def next_failure(self, model):
+        """Statut d'erreur à renvoyer pour cette requête, ou None."""
+        with self._lock:
+            self.requests += 1
+            if model in self.fail_models: return self.fail_status
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return self.fail_status
+        return None
+
+    def text_for(self, prompt):
+        if self.reply is not None: return self.reply(prompt) if callable(self.reply) else self.reply
+        base = f"Réponse simulée pour : {prompt[:80]}. "
+        return (base * (self.payload_size // len(base) + 1))[:self.payload_size]
+
+
+def _chunks(text, n=8):
+    size = max(1, len(text) // n)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def make_handler(cfg: FakeConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args): pass
+
+        def _json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429: self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _sse(self, events, done=False):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for event in events:
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(cfg.chunk_latency)
+            if done: self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if url.path.endswith("/chat/completions"): model = body.get("model", "")
+            else: model = url.path.rsplit("/", 1)[-1].split(":")[0]
+            time.sleep(cfg.latency)
+            status = cfg.next_failure(model)
+            if status:
+                return self._json(status, {"error": {"message": "fake failure", "code": status}})
+            if url.path.endswith("/chat/completions"): return self._openai(body, model)
+            if ":generateContent" in url.path or ":streamGenerateContent" in url.path:
+                return self._gemini(body, model, stream=":stream" in url.path, sse="sse" in str(parse_qs(url.query)))
+            self._json(404, {"error": "unknown route"})
+
+        def _openai(self, body, model):
+            prompt = body["messages"][-1]["content"]
+            text = cfg.text_for(prompt)
+            usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                     "total_tokens": (len(prompt) + len(text)) // 4}
+            if not body.get("stream"):
+                return self._json(200, {
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage})
+            events = [{"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                       "choices": [{"index": 0, "delta": {"content": c}, "finish_reason": None}]} for c in _chunks(text)]
+            events.append({"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                           "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            events.append({"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                           "choices": [], "usage": usage})
+            self._sse(events, done=True)
+
+        def _gemini(self, body, model, stream, sse):
+            prompt = " ".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+            text = cfg.text_for(prompt)
+            usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                     "totalTokenCount": (len(prompt) + len(text)) // 4}
+
+            def candidate(t, finish=None):
+                c = {"content": {"parts": [{"text": t}], "role": "model"}, "index": 0}
+                if finish: c["finishReason"] = finish
+                return c
+
+            if not stream:
+                return self._json(200, {"candidates": [candidate(text, "STOP")], "usageMetadata": usage})
+            parts = _chunks(text)
+            events = [{"candidates": [candidate(p, "STOP" if i == len(parts) - 1 else None)],
+                       **({"usageMetadata": usage} if i == len(parts) - 1 else {})} for i, p in enumerate(parts)]
+            if sse: return self._sse(events)
+            self._json(200, events)  # flux REST sans SSE : tableau JSON
+
+    return Handler
+
+
+def serve(cfg: FakeConfig, host="127.0.0.1", port=0):
+    """Démarre le serveur dans un thread ; renvoie (serveur, url de base)."""
+    server = ThreadingHTTPServer((host, port), make_handler(cfg))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0, help="secondes avant la réponse")
+    ap.add_argument("--chunk-latency", type=float, default=0.0, help="secondes entre deux morceaux de flux")
+    ap.add_argument("--fail-first", type=int, default=0, help="nombre de requêtes en échec au démarrage")
+    ap.add_argument("--fail-status", type=int, default=503)
+    ap.add_argument("--fail-model", action="append", default=[], help="modèle toujours en échec (répétable)")
+    ap.add_argument("--payload-size", type=int, default=800, help="taille des réponses en caractères")
+    a = ap.parse_args()
+    srv, url = serve(FakeConfig(a.latency, a.chunk_latency, a.fail_first, a.fail_status, a.payload_size,
+                                fail_models=a.fail_model), port=a.port)
+    print(f"Faux serveur IA sur {url} (Ctrl+C pour arrêter)")
+    try: threading.Event().wait()
+    except KeyboardInterrupt: srv.shutdown()
@@ -0,0 +1,152 @@
+"""
+Traces locales (sans collecteur externe).
+Chaque span mesure une durée, est exporté en une ligne JSON dans un fichier local
+(renommé en .1, .2... au-delà de TRACE_MAX_BYTES, les TRACE_BACKUPS plus récents sont gardés) et alimente des statistiques en mémoire (p50/p95 par nom de span) pour le panneau admin.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(".cache", "traces.jsonl"))
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", 20 * 1024 * 1024))
+TRACE_BACKUPS = int(os.environ.get("TRACE_BACKUPS", 3))
+WINDOW = 500  # dernières mesures conservées par span pour les percentiles
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class JsonlExporter:
+    def __init__(self, path: str = TRACE_FILE, max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._fh = None
+        self._size = 0
+
+    def export(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        size = len(line.encode("utf-8"))
+        with self._lock:
+            try:
+                if self._fh is not None and self.max_bytes and self._size + size > self.max_bytes: self._rotate()
+                if self._fh is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._fh = open(self.path, "a", encoding="utf-8", buffering=1)
+                    self._size = self._fh.tell()
+                self._fh.write(line)
+                self._size += size
+            except OSError:
+                pass  # la trace ne doit jamais casser l'app
+
+    def _rotate(self):
+        """traces.jsonl -> .1 -> .2 ... ; au-delà de `backups`, le plus ancien est supprimé."""
+        self._fh.close()
+        self._fh = None
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else f"{self.path}.{i - 1}"
+            if os.path.exists(src): os.replace(src, f"{self.path}.{i}")
+        if not self.backups: os.remove(self.path)
+
+
+class Tracer:
+    def __init__(self, exporter=None, window: int = WINDOW):
+        self.exporter = exporter if exporter is not None else JsonlExporter()
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _current.get()
+        record = {
+            "name": name,
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "start": time.time(),
+            "attrs": attrs,
+            "status": "ok",
+        }
+        token = _current.set(record)
+        t0 = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = repr(e)[:300]
+            raise
+        except BaseException as e:
+            # st.rerun()/st.stop() passent par des exceptions de contrôle : ce n'est pas une erreur
+            record["status"] = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            record["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            with self._lock:
+                self._durations[name].append(record["duration_ms"])
+                if record["status"] == "error": self._errors[name] += 1
+            self.exporter.export(record)
+
+    def traced(self, name: str = None, **attrs):
+        def deco(fn):
+            span_name = name or fn.__name__
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, **attrs):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    def summary(self) -> list:
+        with self._lock:
+            items = [(n, sorted(d), self._errors[n]) for n, d in self._durations.items()]
+        rows = []
+        for name, values, errors in sorted(items):
+            if not values: continue
+            rows.append({
+                "span": name,
+                "n": len(values),
+                "p50_ms": round(_percentile(values, 50), 1),
+                "p95_ms": round(_percentile(values, 95), 1),
+                "max_ms": round(values[-1], 1),
+                "erreurs": errors,
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._errors.clear()
+
+
+def _percentile(sorted_values, pct):
+    if len(sorted_values) == 1: return sorted_values[0]
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+
+def render_latency_panel(st, extra: dict = None):
+    """Panneau admin (à appeler dans `with st.sidebar:`). `extra` : compteurs annexes (cache, crédits...)."""
+    with st.expander("⏱️ Latences (admin)"):
+        rows = tracer.summary()
+        if rows: st.dataframe(rows, hide_index=True, use_container_width=True)
+        else: st.caption("Aucune mesure pour l'instant.")
+        for label, stats in (extra or {}).items():
+            st.caption(label)
+            st.json(stats, expanded=False)
+        st.caption(f"Export : {tracer.exporter.path}" if hasattr(tracer.exporter, "path") else "")
+        if st.button("Réinitialiser les mesures"): tracer.reset()